@@ -0,0 +1,845 @@
+import argparse
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import resource
+import shutil
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+import ChartMaker as cm
+import MakeList as ml
+
+# Offline benchmarks for ChartMaker.py and MakeList.py. Every run uses the local SyntheticProvider
+# or generated symbol dumps, so numbers are reproducible and no request ever reaches Yahoo Finance.
+
+END_DATE = "2024-01-01"
+
+def synthetic_tickers(count):
+    """Generate `count` distinct letter-only ticker symbols (AAAA, AAAB, ...)."""
+    tickers = []
+    for n in range(count):
+        name = ""
+        for _ in range(4):
+            n, letter = divmod(n, 26)
+            name = chr(ord("A") + letter) + name
+        tickers.append(name)
+    return tickers
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest child, in MB."""
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+def current_peak_rss_mb():
+    """Peak RSS of this process since the last reset_peak_rss(), in MB (falls back to ru_maxrss off Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) / 1024 for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return peak_rss_mb()[0]
+
+def reset_peak_rss():
+    """Reset the peak RSS counter so later readings exclude imports (Linux only); return the current RSS in MB."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return current_peak_rss_mb()
+
+def run_in_subprocess(*args):
+    """Run one benchmark case in a fresh interpreter so peak RSS is not shared between cases."""
+    result = subprocess.run([sys.executable, __file__, *map(str, args)], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# --- Fetch engines ---
+
+def fetch_case(engine, count, latency):
+    """Download `count` synthetic tickers with one engine and report wall time and peak RSS."""
+    provider = cm.SyntheticProvider(latency=latency, symbol_latency=latency / 50)
+    tickers = synthetic_tickers(count)
+    start_time = time.perf_counter()
+    if engine == "process":
+        prices = cm.fetch_prices_per_process(tickers, "1900-01-01", END_DATE, provider=provider)
+    else:
+        prices = cm.fetch_prices(tickers, "1900-01-01", END_DATE, provider=provider)
+    wall = time.perf_counter() - start_time
+    own, children = peak_rss_mb()
+    return {"engine": engine, "tickers": count, "columns": prices.shape[1], "wall_s": round(wall, 3),
+            "peak_rss_mb": round(own, 1), "peak_child_rss_mb": round(children, 1)}
+
+def bench_fetch(counts=(100, 1300), latency=0.05):
+    """Compare the batched thread-pool engine with the original process-per-ticker engine."""
+    print(f"\n=== Fetch: batched threads vs process per ticker ({latency * 1000:.0f} ms per request) ===")
+    print(f"{'engine':>8} {'tickers':>8} {'wall s':>8} {'peak RSS MB':>12} {'child RSS MB':>13}")
+    for count in counts:
+        for engine in ("process", "batched"):
+            row = run_in_subprocess("fetch", engine, count, latency)
+            print(f"{row['engine']:>8} {row['tickers']:>8} {row['wall_s']:>8} "
+                  f"{row['peak_rss_mb']:>12} {row['peak_child_rss_mb']:>13}")
+
+# --- Retry scheduler ---
+
+def bench_retry(count=500, error_rates=(0.0, 0.1, 0.3), latency=0.02):
+    """Fetch through DownloadScheduler while the provider throttles a share of symbols."""
+    print(f"\n=== Retry scheduler: {count} tickers, injected throttling ===")
+    print(f"{'error rate':>10} {'wall s':>8} {'fetched':>8} {'failed':>7}")
+    tickers = synthetic_tickers(count)
+    for error_rate in error_rates:
+        provider = cm.SyntheticProvider(latency=latency, error_rate=error_rate, seed=1)
+        scheduler = cm.DownloadScheduler(provider, rate=20, burst=8, backoff_base=0.05, seed=1)
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            prices = cm.fetch_prices(tickers, "1900-01-01", END_DATE, provider=scheduler)
+        wall = time.perf_counter() - start_time
+        print(f"{error_rate:>10} {wall:>8.2f} {prices.shape[1]:>8} {len(scheduler.failed):>7}")
+
+# --- Price data model ---
+
+def quiet_fetch(count):
+    """Fetch `count` synthetic tickers (1962 onwards) without the per-ticker progress output."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return cm.fetch_prices(synthetic_tickers(count), "1900-01-01", END_DATE, provider=cm.SyntheticProvider())
+
+def bench_memory(count=1300):
+    """Memory held by the old dicts of per-ticker Series versus the aligned PriceMatrix."""
+    print(f"\n=== Price data model: {count} tickers, daily bars since 1962 ===")
+    prices = quiet_fetch(count)
+
+    tracemalloc.start()
+    stock_data, raw_data, start_dates = {}, {}, {}
+    for ticker in prices.columns:
+        raw_price_data = prices[ticker].dropna().copy()
+        initial_price = raw_price_data.iloc[0]
+        stock_data[ticker] = ((raw_price_data - initial_price) / initial_price) * 100
+        raw_data[ticker] = raw_price_data
+        start_dates[ticker] = raw_price_data.index[0]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del stock_data, raw_data, start_dates
+
+    tracemalloc.start()
+    matrix = cm.PriceMatrix.from_frame(prices)
+    percentages = matrix.view("percent")
+    matrix_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{'dict of Series (prices + %)':>30}: {dict_bytes / 2**20:8.1f} MB")
+    print(f"{'PriceMatrix (prices + %)':>30}: {matrix_bytes / 2**20:8.1f} MB "
+          f"({matrix.nbytes / 2**20:.1f} MB matrix, {percentages.nbytes / 2**20:.1f} MB %)")
+
+def check_views(count=300):
+    """Confirm the vectorized metric views match the original per-ticker formulas exactly."""
+    print(f"\n=== Metric views: vectorized vs per-ticker formula ({count} tickers) ===")
+    prices = quiet_fetch(count)
+    # float64 so the matrix holds exactly the closes the per-ticker code used to see
+    matrix = cm.PriceMatrix.from_frame(prices, dtype=np.float64)
+    formulas = {
+        "percent": lambda close, initial_price: ((close - initial_price) / initial_price) * 100,
+        "log": lambda close, initial_price: np.log(close / initial_price),
+        "rebased": lambda close, initial_price: (close / initial_price) * 100,
+    }
+    for metric, formula in formulas.items():
+        view = matrix.view(metric)
+        mismatched = 0
+        for ticker in matrix.tickers:
+            close = prices[ticker].dropna()
+            expected = formula(close.to_numpy(), close.iloc[0])
+            dates, values = matrix.series(ticker, view)
+            if not (dates.equals(close.index) and np.array_equal(values, expected)):
+                mismatched += 1
+        print(f"{metric:>8}: {len(matrix.tickers) - mismatched}/{len(matrix.tickers)} tickers identical")
+        assert mismatched == 0, f"{metric} view differs from the per-ticker formula"
+
+def check_cache_range(count=100, start_date="2000-01-01", end_date="2010-01-01"):
+    """Confirm a warm-cache read of a date range returns exactly the closes an uncached download does."""
+    print(f"\n=== Price cache: warm vs cold read of {start_date} to {end_date} ({count} tickers) ===")
+    tickers = synthetic_tickers(count)
+    provider = cm.SyntheticProvider()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cold = cm.fetch_prices(tickers, start_date, end_date, provider=provider)
+    # Warmed with all history (served from the cache), and only up to mid-range (topped up)
+    for warmed_through in (END_DATE, "2005-01-01"):
+        with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+            cm.fetch_prices(tickers, "1900-01-01", warmed_through, cache=cm.PriceCache(cache_dir, provider))
+            warm = cm.fetch_prices(tickers, start_date, end_date, cache=cm.PriceCache(cache_dir, provider))
+        same = warm.equals(cold) and warm.index.equals(cold.index)
+        print(f"cache warmed through {warmed_through}: {warm.index[0].date()} to {warm.index[-1].date()}, "
+              f"{'identical' if same else 'DIFFERENT'} to the uncached read")
+        assert same, "a warm-cache read differs from an uncached read of the same range"
+
+# --- Downsampling ---
+
+def render_png(matrix, values, path, mode):
+    """Option 3 style PNG (16x9 in at dpi=480) of every ticker; returns (seconds, bytes)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    start_time = time.perf_counter()
+    plt.figure(figsize=(16, 9), dpi=480)
+    for ticker in matrix.tickers:
+        plt.plot(*cm.downsample(*matrix.series(ticker, values), 16 * 480, mode), label=ticker)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+    return time.perf_counter() - start_time, os.path.getsize(path)
+
+def render_html(matrix, path, mode):
+    """Option 4 style Plotly partition of raw prices; returns (seconds, bytes of chart data)."""
+    import plotly.graph_objects as go
+    start_time = time.perf_counter()
+    fig = go.Figure()
+    for ticker in matrix.tickers:
+        dates, closes = cm.downsample(*matrix.series(ticker), 2560, mode)
+        fig.add_trace(go.Scatter(x=dates, y=closes, name=ticker, mode="lines"))
+    fig.update_layout(width=2560, height=1440)
+    fig.write_html(path, include_plotlyjs=False)
+    return time.perf_counter() - start_time, os.path.getsize(path)
+
+def bench_downsample(count=100):
+    """Render time and output size with and without downsampling to the figure's pixel width."""
+    print(f"\n=== Downsampling: {count} tickers ===")
+    print(f"{'output':>6} {'mode':>8} {'render s':>9} {'bytes':>12}")
+    matrix = cm.PriceMatrix.from_frame(quiet_fetch(count))
+    percentages = matrix.view("percent")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for mode in ("", "minmax", "lttb"):
+            seconds, size = render_png(matrix, percentages, os.path.join(out_dir, f"{mode or 'none'}.png"), mode)
+            print(f"{'png':>6} {mode or 'none':>8} {seconds:>9.2f} {size:>12,}")
+        for mode in ("", "minmax", "lttb"):
+            seconds, size = render_html(matrix, os.path.join(out_dir, f"{mode or 'none'}.html"), mode)
+            print(f"{'html':>6} {mode or 'none':>8} {seconds:>9.2f} {size:>12,}")
+
+# --- Parallel rendering ---
+
+def bench_render(count=600, groups=30):
+    """Option 1 style PNGs: sequential pyplot loop versus the process render pool."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    print(f"\n=== Rendering {groups} grouped PNGs ({count} tickers, dpi=240, {cm.mp.cpu_count()} CPUs) ===")
+    matrix = cm.PriceMatrix.from_frame(quiet_fetch(count))
+    percentages = matrix.view("percent")
+    # Deal tickers round-robin into `groups` charts by start date
+    order = np.argsort(matrix.start)
+    jobs = [(f"group_{g}.png", f"Group {g}", [matrix.tickers[i] for i in order[g::groups]]) for g in range(groups)]
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        start_time = time.perf_counter()
+        for filename, title, tickers in jobs:
+            plt.figure(figsize=(16, 9), dpi=240)
+            for ticker in tickers:
+                plt.plot(*matrix.series(ticker, percentages), label=ticker)
+            plt.title(title)
+            plt.legend()
+            plt.grid(True)
+            plt.xticks(rotation=45)
+            plt.tight_layout()
+            plt.savefig(os.path.join(out_dir, filename))
+            plt.close()
+        sequential = time.perf_counter() - start_time
+
+        pool_jobs = [(os.path.join(out_dir, f"pool_{filename}"), title, tickers) for filename, title, tickers in jobs]
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cm.render_group_charts(matrix, percentages, pool_jobs, "Percentage Increase (%)")
+        pooled = time.perf_counter() - start_time
+
+    print(f"{'sequential pyplot':>18}: {sequential:7.2f} s")
+    print(f"{'render pool':>18}: {pooled:7.2f} s ({sequential / pooled:.1f}x)")
+
+# --- Plotly export ---
+
+def bench_export(count=500):
+    """Option 4 headless export: inlined vs shared plotly.js bundle, SVG vs WebGL traces."""
+    print(f"\n=== Plotly export: {count} tickers in partitions of 100 ===")
+    print(f"{'bundle':>7} {'webgl':>6} {'files':>6} {'wall s':>7} {'total MB':>9} {'MB/file':>8}")
+    matrix = cm.PriceMatrix.from_frame(quiet_fetch(count))
+    for bundle, webgl in (("inline", False), ("shared", False), ("shared", True)):
+        with tempfile.TemporaryDirectory() as out_dir:
+            start_time = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                cm.chart_partitions(matrix, "percent", out_dir, headless=True,
+                                    export=cm.export_settings(bundle, webgl))
+            wall = time.perf_counter() - start_time
+            sizes = [os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir)]
+            html_files = len([name for name in os.listdir(out_dir) if name.endswith(".html")])
+        print(f"{bundle:>7} {str(webgl):>6} {html_files:>6} {wall:>7.2f} {sum(sizes) / 2**20:>9.1f} "
+              f"{sum(sizes) / html_files / 2**20:>8.2f}")
+
+# --- MakeList pipeline ---
+
+def write_symbol_dump(path, lines, unique=20000, seed=0, distinct_lines=False):
+    """
+    Write a raw symbol dump of `lines` lines drawn from `unique` symbols, some with -W/-U style
+    suffixes. distinct_lines=True gives every line its own -<serial> suffix instead, so the
+    input has as many distinct lines as lines but still only `unique` symbols.
+    """
+    rng = np.random.default_rng(seed)
+    symbols = synthetic_tickers(unique)
+    pool = np.array(symbols + [f"{s}-{suffix}" for s in symbols[::4] for suffix in ("W", "U", "PA")])
+    chunk = 1_000_000
+    with open(path, "w", encoding="utf-8") as f:
+        for offset in range(0, lines, chunk):
+            count = min(chunk, lines - offset)
+            if distinct_lines:
+                picks = np.char.add(np.char.add(np.array(symbols)[rng.integers(0, unique, count)], "-"),
+                                    np.arange(offset, offset + count).astype(str))
+            else:
+                picks = pool[rng.integers(0, len(pool), count)]
+            f.write("\n".join(picks.tolist()) + "\n")
+
+# The original MakeList pipeline, kept as the baseline the "tempfiles" engine measures:
+# readlines + hyphen strip to a temp file, remove_duplicates, then re-read, dedupe and sort
+
+def legacy_preprocess_remove_hyphen(input_file):
+    """Remove everything after a hyphen on each line and save to a temporary file (whole file in memory)."""
+    temp_file = os.path.splitext(os.path.basename(input_file))[0] + "_preprocessed.txt"
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    cleaned_lines = [line.split('-')[0].strip() for line in lines]
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        for line in cleaned_lines:
+            if line:
+                f.write(line + '\n')
+    return temp_file
+
+def legacy_extract_tickers_from_file(input_filename):
+    """Read one ticker per line and return them deduped and sorted."""
+    with open(input_filename, 'r') as file:
+        return sorted({line.strip() for line in file if line.strip()})
+
+def makelist_case(engine, input_file, work_dir):
+    """Build the ticker list with one pipeline and report wall time, peak RSS and an output digest."""
+    os.chdir(work_dir)  # the temp-file pipeline writes its intermediates to the working directory
+    output_file = os.path.join(work_dir, f"{engine}.txt")
+    base_rss = reset_peak_rss()
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if engine == "tempfiles":
+            preprocessed_file = legacy_preprocess_remove_hyphen(input_file)
+            deduped_file = ml.remove_duplicates(preprocessed_file)
+            ml.write_ticker_list(legacy_extract_tickers_from_file(deduped_file), output_file)
+        elif engine == "mmap":
+            ml.write_ticker_list(ml.mmap_tickers(input_file), output_file)
+        else:
+            ml.write_ticker_list(ml.stream_tickers(input_file), output_file)
+    wall = time.perf_counter() - start_time
+    own = current_peak_rss_mb()
+    with open(output_file, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    return {"engine": engine, "wall_s": round(wall, 2), "base_rss_mb": round(base_rss, 1),
+            "peak_rss_mb": round(own, 1), "sha256": digest}
+
+def bench_makelist(lines=50_000_000, engines=("tempfiles", "streaming", "mmap"), distinct_lines=False):
+    """
+    Compare the MakeList pipelines: original temp files, line streaming and the memory-mapped bytes
+    scan. distinct_lines=True uses a SYM-<serial> dump, where every line is distinct.
+    """
+    kind = ", every line distinct" if distinct_lines else ""
+    print(f"\n=== MakeList: {', '.join(engines)} ({lines:,} lines{kind}) ===")
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "symbols.txt")
+        write_symbol_dump(input_file, lines, unique=5000 if distinct_lines else 20000, distinct_lines=distinct_lines)
+        print(f"input: {os.path.getsize(input_file) / 1024 / 1024:.0f} MB")
+        print(f"{'engine':>10} {'wall s':>8} {'base RSS MB':>12} {'peak RSS MB':>12} {'output sha256':>17}")
+        for engine in engines:
+            try:
+                row = run_in_subprocess("makelist", engine, input_file, work_dir)
+            except RuntimeError as e:
+                # The temp-file pipeline holds every line in memory and can be killed on large inputs
+                print(f"{engine:>10} failed: {str(e).splitlines()[-1] if str(e) else 'killed (out of memory?)'}")
+                continue
+            print(f"{row['engine']:>10} {row['wall_s']:>8} {row['base_rss_mb']:>12} "
+                  f"{row['peak_rss_mb']:>12} {row['sha256']:>17}")
+
+def dedupe_case(mode, input_file, work_dir):
+    """Run remove_duplicates with `mode` workers (or "external") and report lines per second and peak RSS."""
+    os.chdir(work_dir)
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "external":
+            output_file = ml.remove_duplicates(input_file, external=True, spill_dir=work_dir)
+        else:
+            output_file = ml.remove_duplicates(input_file, workers=int(mode))
+    wall = time.perf_counter() - start_time
+    with open(input_file, "rb") as f:
+        lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    with open(output_file, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    own, children = peak_rss_mb()
+    return {"mode": mode, "wall_s": round(wall, 2), "lines_per_s": int(lines / wall),
+            "peak_rss_mb": round(max(own, children), 1), "sha256": digest}
+
+def bench_dedupe(lines=5_000_000, workers=(1, 4, 16)):
+    """Throughput of remove_duplicates at several worker counts and in external-memory mode."""
+    print(f"\n=== MakeList dedupe: {lines:,} lines, {os.cpu_count()} CPUs ===")
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "symbols.txt")
+        write_symbol_dump(input_file, lines, unique=200000)
+        print(f"{'workers':>8} {'wall s':>8} {'lines/s':>11} {'peak RSS MB':>12} {'output sha256':>17}")
+        for mode in [*map(str, workers), "external"]:
+            row = run_in_subprocess("dedupe", mode, input_file, work_dir)
+            print(f"{row['mode']:>8} {row['wall_s']:>8} {row['lines_per_s']:>11,} "
+                  f"{row['peak_rss_mb']:>12} {row['sha256']:>17}")
+
+def bench_incremental(lines=50_000_000, appends=(1_000, 100_000, 1_000_000)):
+    """Update after an append: full rescan with mmap_tickers vs an incremental update of only the new bytes."""
+    print(f"\n=== MakeList incremental: {lines:,}-line input, then appends ===")
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "symbols.txt")
+        extra_file = os.path.join(work_dir, "extra.txt")
+        write_symbol_dump(input_file, lines)
+        output_file = os.path.join(work_dir, "symbols.lines")
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            ml.IncrementalTickerList(input_file, output_file, "lines").update()
+            first = time.perf_counter() - start_time
+        print(f"first run (full scan + state): {first:.2f}s, "
+              f"state file {os.path.getsize(output_file + ml.STATE_SUFFIX) / 1024:.0f} KB")
+        print(f"{'appended':>10} {'rescan s':>9} {'incremental s':>14} {'speedup':>8} {'same':>5}")
+        for seed, appended in enumerate(appends, start=1):
+            write_symbol_dump(extra_file, appended, unique=25000, seed=seed)  # a few new symbols per append
+            with open(extra_file, "rb") as src, open(input_file, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start_time = time.perf_counter()
+                full = ml.mmap_tickers(input_file)
+                rescan = time.perf_counter() - start_time
+                start_time = time.perf_counter()
+                ml.IncrementalTickerList(input_file, output_file, "lines").update()
+                incremental = time.perf_counter() - start_time
+            same = ml.read_ticker_file(output_file) == full
+            print(f"{appended:>10,} {rescan:>9.2f} {incremental:>14.3f} {rescan / incremental:>7.0f}x {str(same):>5}")
+
+# --- Start-date grouping ---
+
+def legacy_bucket_groups(tickers, start_dates):
+    """Option 1 grouping as it was: a Python loop over every ticker."""
+    earliest_date = start_dates.min()
+    buckets = {}
+    for ticker, start_date in zip(tickers, start_dates):
+        bucket = int(((start_date - earliest_date).days / 365.25) // 5) * 5
+        buckets.setdefault(bucket, []).append(ticker)
+    return sorted(buckets.items())
+
+def legacy_majority_date_groups(tickers, start_dates):
+    """Option 2 grouping as it was: a Counter, then a rescan of every ticker per shared date."""
+    date_counts = Counter(start_dates)
+    majority_dates = sorted(date for date, count in date_counts.items() if count >= 10)
+    return [(date, [ticker for ticker, start in zip(tickers, start_dates) if start == date])
+            for date in majority_dates]
+
+def bench_grouping(counts=(1000, 10_000, 100_000)):
+    """Time the StartDateIndex against the original per-ticker loops and check both give the same groups."""
+    print("\n=== Start-date grouping: sorted index vs per-ticker loops ===")
+    days = np.arange(np.datetime64("1962-01-02"), np.datetime64(END_DATE), dtype="datetime64[D]")
+    dates = cm.pd.DatetimeIndex(days[np.is_busday(days)].astype("datetime64[ns]"))
+    print(f"{'tickers':>8} {'groups 1/2':>11} {'index ms':>9} {'calendar ms':>12} {'legacy ms':>10} {'same':>5}")
+    for count in counts:
+        rng = np.random.default_rng(count)
+        start = rng.integers(0, len(dates) - 1000, count) // 63 * 63
+        tickers = synthetic_tickers(count)
+        start_time = time.perf_counter()
+        index = cm.StartDateIndex(dates.asi8, start, tickers)
+        buckets = index.buckets("5Y")
+        shared = index.shared_dates(10)
+        index_ms = (time.perf_counter() - start_time) * 1000
+        start_time = time.perf_counter()
+        index.buckets("1Y", align="calendar", min_size=50)
+        calendar_ms = (time.perf_counter() - start_time) * 1000
+
+        legacy_ms, same = float("nan"), "-"
+        if count <= 10_000:  # the legacy option 2 rescan is quadratic
+            start_time = time.perf_counter()
+            legacy = (legacy_bucket_groups(tickers, dates[start]), legacy_majority_date_groups(tickers, dates[start]))
+            legacy_ms = (time.perf_counter() - start_time) * 1000
+            same = "yes" if (buckets, shared) == legacy else "NO"
+        print(f"{count:>8} {len(buckets):>5}/{len(shared):<5} {index_ms:>9.1f} {calendar_ms:>12.1f} "
+              f"{legacy_ms:>10.1f} {same:>5}")
+
+# --- Resampling ---
+
+def bench_resample(count=500):
+    """
+    Rows, matrix plus percent view memory, and option 1 PNG and option 4 HTML time when the charts are
+    drawn from daily, weekly or monthly bars; checks every resampled view equals the daily one on its dates.
+    """
+    print(f"\n=== Resampling: {count} tickers, daily bars since 1962 ===")
+    print(f"{'bars':>8} {'rows':>7} {'resample s':>11} {'matrix+% MB':>12} {'option 1 s':>11} {'option 4 s':>11} "
+          f"{'same':>5}")
+    daily = cm.PriceMatrix.from_frame(quiet_fetch(count))
+    for bars in ("daily", "weekly", "monthly"):
+        start_time = time.perf_counter()
+        matrix = daily.resample(bars)
+        resample_s = time.perf_counter() - start_time
+        percentages = matrix.view("percent")
+        # Compared where the ticker has a bar on the period's last day (otherwise the period
+        # carries an earlier close of the same period)
+        rows = daily.dates.get_indexer(matrix.dates)
+        traded = daily.valid[rows]
+        same = "yes" if np.array_equal(percentages[traded], daily.view("percent")[rows][traded]) else "NO"
+        size_mb = (matrix.nbytes + percentages.nbytes) / 2**20
+        with tempfile.TemporaryDirectory() as out_dir, contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            cm.chart_buckets(matrix, out_dir)
+            option1_s = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            cm.chart_partitions(matrix, "percent", out_dir, headless=True)
+            option4_s = time.perf_counter() - start_time
+        print(f"{bars:>8} {len(matrix.dates):>7,} {resample_s:>11.3f} {size_mb:>12.1f} {option1_s:>11.2f} "
+              f"{option4_s:>11.2f} {same:>5}")
+    print(f"auto picks {cm.resample_bars(daily.dates, 'auto')} bars for a {cm.RESAMPLE_WIDTH_PX} px wide chart")
+
+# --- Ticker statistics ---
+
+def bench_stats(counts=(1000, 10_000), queries=100):
+    """
+    Build the ticker statistics index, reload it from its file (all rows reused, then with 1% of
+    tickers changed), and time ranking queries against it: top 20 by CAGR with a history filter.
+    """
+    print("\n=== Ticker statistics: build, reuse and query ===")
+    print(f"{'tickers':>8} {'build s':>8} {'reuse s':>8} {'1% new s':>9} {'file MB':>8} {'query ms':>9}")
+    for count in counts:
+        daily = random_walk_matrix(count)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            timings = []
+            for changed in (None, 0, count // 100):
+                matrix = cm.PriceMatrix(daily.dates, daily.tickers, daily.values.copy())
+                matrix.stats_path = os.path.join(cache_dir, cm.STATS_FILE)
+                if changed:
+                    matrix.values[-1, :changed] *= 1.01
+                start_time = time.perf_counter()
+                stats = cm.ticker_stats(matrix)
+                timings.append(time.perf_counter() - start_time)
+            size_mb = os.path.getsize(os.path.join(cache_dir, cm.STATS_FILE)) / 2**20
+        start_time = time.perf_counter()
+        for n in range(queries):
+            stats.ranked(("cagr", "max_drawdown", "volatility", "total_return")[n % 4], min_years=n % 20)[:20]
+        query_ms = (time.perf_counter() - start_time) / queries * 1000
+        print(f"{count:>8} {timings[0]:>8.3f} {timings[1]:>8.3f} {timings[2]:>9.3f} {size_mb:>8.2f} {query_ms:>9.2f}")
+        del daily, matrix
+
+# --- Universe envelope ---
+
+def random_walk_matrix(count, years=30, seed=0):
+    """PriceMatrix of `count` random-walk closes over `years` of business days, listed on staggered dates."""
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(f"{int(END_DATE[:4]) - years}-01-02"), np.datetime64(END_DATE),
+                     dtype="datetime64[D]")
+    dates = cm.pd.DatetimeIndex(days[np.is_busday(days)].astype("datetime64[ns]"))
+    values = np.empty((len(dates), count), dtype=np.float32)
+    for first in range(0, count, 500):
+        returns = rng.normal(0.0003, 0.02, (len(dates), min(500, count - first)))
+        values[:, first:first + 500] = 10 * np.exp(np.cumsum(returns, axis=0))
+    start = rng.integers(0, len(dates) - 252, count) // 63 * 63
+    values[np.arange(len(dates))[:, None] < start] = np.nan
+    return cm.PriceMatrix(dates, synthetic_tickers(count), values)
+
+def bench_universe(counts=(100, 1000, 10_000), lines_up_to=1000):
+    """
+    Option 5 percentile envelope (percentiles plus a dpi=240 PNG) against one line per ticker at the
+    same size, and the chunked-sort percentiles against np.nanpercentile on the same matrix.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    print("\n=== Universe chart: percentile envelope vs one line per ticker (dpi=240) ===")
+    print(f"{'tickers':>8} {'percentiles s':>14} {'nanpercentile s':>16} {'same':>5} {'envelope s':>11} "
+          f"{'all lines s':>12}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for count in counts:
+            matrix = random_walk_matrix(count)
+            percentages = matrix.view("percent")
+            start_time = time.perf_counter()
+            bands = matrix.percentiles("percent")
+            percentiles_s = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            with warnings.catch_warnings():  # rows before the first listing are all NaN
+                warnings.simplefilter("ignore", RuntimeWarning)
+                reference = np.nanpercentile(percentages, cm.ENVELOPE_PERCENTILES, axis=1)
+            nanpercentile_s = time.perf_counter() - start_time
+            enough = matrix.valid.sum(axis=1) >= cm.ENVELOPE_MIN_TICKERS
+            same = "yes" if np.allclose(bands[:, enough], reference[:, enough], rtol=1e-4) else "NO"
+
+            start_time = time.perf_counter()
+            fig = cm.draw_envelope_chart(matrix.dates, cm.ENVELOPE_PERCENTILES, bands, "Universe",
+                                         "Percentage Increase (%)", 240)
+            fig.savefig(os.path.join(out_dir, f"universe_{count}.png"))
+            envelope_s = time.perf_counter() - start_time
+
+            lines_s = float("nan")
+            if count <= lines_up_to:  # one Line2D per ticker grows linearly; skip the largest universes
+                start_time = time.perf_counter()
+                plt.figure(figsize=(16, 9), dpi=240)
+                for ticker in matrix.tickers:
+                    plt.plot(*cm.downsample(*matrix.series(ticker, percentages), 16 * 240))
+                plt.grid(True)
+                plt.tight_layout()
+                plt.savefig(os.path.join(out_dir, f"lines_{count}.png"))
+                plt.close()
+                lines_s = time.perf_counter() - start_time
+            print(f"{count:>8} {percentiles_s:>14.3f} {nanpercentile_s:>16.3f} {same:>5} {envelope_s:>11.3f} "
+                  f"{lines_s:>12.3f}")
+            del matrix, percentages
+
+# --- Startup and worker spawn ---
+
+def cold_start_s(command, runs=5):
+    """Best wall time of `runs` fresh interpreters running `command` (a list of arguments after python)."""
+    best = float("inf")
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, *command], capture_output=True, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+def worker_ready(kind):
+    """Pool task: import what a `kind` worker needs, then hold the worker so every task lands on a new one."""
+    for module in cm.WORKER_MODULES[kind]:
+        importlib.import_module(module)
+    ready = time.time()
+    time.sleep(0.5)
+    return os.getpid(), ready
+
+def spawn_case(method, kind, workers, preload):
+    """Start a pool of `workers` ChartMaker workers and report how long each took to be ready for work."""
+    cm.WORKER_START_METHOD = method
+    cm.preload_workers([kind] if preload == "1" else [])
+    start_time = time.time()
+    with cm.worker_pool(kind, workers, None, ()) as executor:
+        ready = dict(executor.map(worker_ready, [kind] * workers))
+    return {"method": method, "kind": kind, "preload": preload == "1", "workers": len(ready),
+            "ready_s": round(max(ready.values()) - start_time, 3)}
+
+def bench_startup(workers=4):
+    """Cold start of ChartMaker.py, and time until each pool worker is ready per start method."""
+    print("\n=== Startup: cold start (best of 5) ===")
+    for label, command in (("import ChartMaker", ["-c", "import ChartMaker"]),
+                           ("ChartMaker.py -h", ["ChartMaker.py", "-h"])):
+        print(f"{label:>20} {cold_start_s(command):>8.3f} s")
+
+    # Time until 1 and until `workers` workers are ready: the difference is what every extra
+    # worker costs, the rest is paid once per pool (e.g. starting the fork server)
+    print(f"\n=== Startup: pool workers until ready, including their imports ===")
+    print(f"{'start method':>22} {'pool':>7} {'1 worker s':>11} {f'{workers} workers s':>11} {'per extra s':>12}")
+    cases = [("fork", "0"), ("spawn", "0"), ("forkserver", "0"), ("forkserver", "1")]
+    for kind in ("render", "export"):
+        for method, preload in cases:
+            if method not in cm.mp.get_all_start_methods():
+                continue
+            one = run_in_subprocess("spawn", method, kind, 1, preload)["ready_s"]
+            many = run_in_subprocess("spawn", method, kind, workers, preload)["ready_s"]
+            label = method + (" + preload" if preload == "1" else "")
+            print(f"{label:>22} {kind:>7} {one:>11.3f} {many:>11.3f} {(many - one) / (workers - 1):>12.3f}")
+
+# --- Pipeline stages (comparable across commits) ---
+
+STAGE_COUNTS = (10, 100, 1000, 5000)
+STAGES = ("fetch", "transform", "group_option1", "group_option2", "render_png", "export_plotly")
+RESULTS_DIR = "bench_results"
+
+def timed_stage(results, name, function, *args):
+    """Run one stage quietly, record its wall time and peak RSS (since the stage began) and return its result."""
+    base_rss = reset_peak_rss()
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    results[name] = {"wall_s": round(time.perf_counter() - start_time, 4),
+                     "peak_rss_mb": round(current_peak_rss_mb(), 1), "base_rss_mb": round(base_rss, 1)}
+    return result
+
+def transform_case(prices):
+    """Build the price matrix and its percent view, as every grouped chart option does."""
+    matrix = cm.PriceMatrix.from_frame(prices)
+    matrix.view("percent")
+    return matrix
+
+def stages_case(count, work_dir, years, listing_step, shared_start, seed):
+    """Run every pipeline stage once on `count` synthetic tickers and report each stage's cost."""
+    first_date = f"{int(END_DATE[:4]) - years}-01-02"
+    provider = cm.SyntheticProvider(first_date=first_date, last_listing=END_DATE, seed=seed,
+                                    listing_step=listing_step, shared_start=shared_start)
+    tickers = synthetic_tickers(count)
+    results = {}
+    prices = timed_stage(results, "fetch", cm.fetch_prices, tickers, "1900-01-01", END_DATE, None, provider)
+    matrix = timed_stage(results, "transform", transform_case, prices)
+    timed_stage(results, "group_option1", cm.bucket_groups, matrix)
+    groups = timed_stage(results, "group_option2", cm.majority_date_groups, matrix)
+    timed_stage(results, "render_png", cm.chart_buckets, matrix, work_dir)
+    timed_stage(results, "export_plotly", cm.chart_partitions, matrix, "percent", work_dir, True)
+    return {"tickers": count, "columns": len(matrix.tickers), "rows": len(matrix.dates),
+            "option2_groups": len(groups), "stages": results}
+
+def git_revision():
+    """Short commit hash of the working tree, with a -dirty suffix when it has uncommitted changes."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def bench_stages(counts=STAGE_COUNTS, years=60, listing_step=63, shared_start=0.1, seed=0, out=None):
+    """
+    Time each pipeline stage (fetch, transform, grouping for options 1 and 2, PNG render, Plotly export)
+    at each ticker count, each count in a fresh interpreter, and save the results as JSON for compare().
+    """
+    revision = git_revision()
+    print(f"\n=== Pipeline stages at {', '.join(map(str, counts))} tickers ({revision}) ===")
+    params = {"counts": list(counts), "years": years, "listing_step": listing_step,
+              "shared_start": shared_start, "seed": seed, "end_date": END_DATE}
+    results = []
+    print(f"{'tickers':>8} " + " ".join(f"{stage:>14}" for stage in STAGES) + f" {'peak RSS MB':>12}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as work_dir:
+            row = run_in_subprocess("pipeline", count, work_dir, years, listing_step, shared_start, seed)
+        results.append(row)
+        peak = max(stage["peak_rss_mb"] for stage in row["stages"].values())
+        print(f"{count:>8} " + " ".join(f"{row['stages'][stage]['wall_s']:>14.3f}" for stage in STAGES)
+              + f" {peak:>12}")
+
+    report = {"revision": revision, "date": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "platform": sys.platform, "cpus": os.cpu_count(),
+              "numpy": np.__version__, "pandas": cm.pd.__version__, "params": params, "results": results}
+    out = out or os.path.join(RESULTS_DIR, f"stages_{revision}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {out}")
+    return out
+
+def compare(baseline_file, candidate_file):
+    """Print stage times of two bench_stages result files side by side, with the candidate/baseline ratio."""
+    with open(baseline_file, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(candidate_file, encoding="utf-8") as f:
+        candidate = json.load(f)
+    if baseline["params"] != candidate["params"]:
+        print(f"Warning: parameters differ: {baseline['params']} vs {candidate['params']}")
+    print(f"\n=== {baseline['revision']} -> {candidate['revision']} (wall seconds) ===")
+    print(f"{'tickers':>8} {'stage':>14} {'baseline':>10} {'candidate':>10} {'ratio':>7}")
+    candidate_rows = {row["tickers"]: row for row in candidate["results"]}
+    for row in baseline["results"]:
+        other = candidate_rows.get(row["tickers"])
+        if other is None:
+            continue
+        for stage in STAGES:
+            before = row["stages"][stage]["wall_s"]
+            after = other["stages"][stage]["wall_s"]
+            ratio = after / before if before else float("nan")
+            print(f"{row['tickers']:>8} {stage:>14} {before:>10.3f} {after:>10.3f} {ratio:>6.2f}x")
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "fetch":
+        # Child mode: python Benchmark.py fetch <engine> <count> <latency>
+        row = fetch_case(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+        print(json.dumps(row))
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "makelist":
+        # Child mode: python Benchmark.py makelist <engine> <input file> <work dir>
+        row = makelist_case(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(json.dumps(row))
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "dedupe":
+        # Child mode: python Benchmark.py dedupe <workers|external> <input file> <work dir>
+        row = dedupe_case(sys.argv[2], sys.argv[3], sys.argv[4])
+        print(json.dumps(row))
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "spawn":
+        # Child mode: python Benchmark.py spawn <start method> <render|export> <workers> <preload 0|1>
+        row = spawn_case(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+        print(json.dumps(row))
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "pipeline":
+        # Child mode: python Benchmark.py pipeline <count> <work dir> <years> <listing step> <shared start> <seed>
+        row = stages_case(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]), int(sys.argv[5]),
+                          float(sys.argv[6]), int(sys.argv[7]))
+        print(json.dumps(row))
+        return
+
+    parser = argparse.ArgumentParser(description="Offline benchmarks for ChartMaker.py and MakeList.py.")
+    parser.add_argument("suite", nargs="?", default="all", choices=["all", "stages", "startup", "views", "compare"],
+                        help="all: every benchmark; stages: the per-stage pipeline suite only; "
+                             "startup: cold start and worker spawn time only; "
+                             "views: check the metric views against the per-ticker formulas only; "
+                             "compare: compare two stages result files")
+    parser.add_argument("files", nargs="*", help="for compare: baseline and candidate result files")
+    parser.add_argument("--counts", type=int, nargs="+", default=list(STAGE_COUNTS),
+                        help="ticker counts for the stages suite")
+    parser.add_argument("--years", type=int, default=60, help="years of synthetic history for the stages suite")
+    parser.add_argument("--listing-step", type=int, default=63,
+                        help="trading days between possible listing dates (1 = fully ragged starts)")
+    parser.add_argument("--shared-start", type=float, default=0.1,
+                        help="share of tickers listed on the first day of history")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic data seed")
+    parser.add_argument("--out", default=None, help=f"stages result file (default: {RESULTS_DIR}/stages_<commit>.json)")
+    parser.add_argument("--lines", type=int, default=50_000_000, help="Lines in the generated MakeList input")
+    parser.add_argument("--large-lines", type=int, default=180_000_000,
+                        help="Lines in the large (about 1 GB) input for the streaming vs mmap comparison")
+    args = parser.parse_args()
+
+    if args.suite == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs a baseline and a candidate result file")
+        compare(*args.files)
+        return
+    stages_args = (args.counts, args.years, args.listing_step, args.shared_start, args.seed, args.out)
+    if args.suite == "stages":
+        bench_stages(*stages_args)
+        return
+    if args.suite == "startup":
+        bench_startup()
+        return
+    if args.suite == "views":
+        check_views()
+        return
+
+    print(f"=== ChartMaker benchmarks ({datetime.now().strftime('%Y-%m-%d %H:%M')}) ===")
+    bench_fetch()
+    bench_retry()
+    bench_memory()
+    check_views()
+    check_cache_range()
+    bench_downsample()
+    bench_render()
+    bench_export()
+    bench_grouping()
+    bench_resample()
+    bench_stats()
+    bench_universe()
+    bench_startup()
+    bench_stages(*stages_args)
+    bench_makelist(args.lines)
+    bench_makelist(args.large_lines, engines=("streaming", "mmap"))
+    bench_makelist(args.lines // 5, engines=("streaming", "mmap"), distinct_lines=True)
+    bench_dedupe()
+    bench_incremental(args.lines)
+
+if __name__ == "__main__":
+    main()
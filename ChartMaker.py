@@ -1,441 +1,2602 @@
-import yfinance as yf
 import pandas as pd
-import matplotlib.pyplot as plt
-from collections import Counter
-import plotly.graph_objects as go
+from collections import OrderedDict
 from datetime import datetime
 import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
+import argparse
+import hashlib
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import zlib
+from pathlib import Path
+from MakeList import read_ticker_file
+import RunReport as run_report
 
-# Function to download and process data for a single ticker (CPU-only)
+# Directory holding the local price cache (one Parquet file per ticker + index.json)
+CACHE_DIR = "price_cache"
+
+# Batched download settings: symbols per request and concurrent requests in flight
+BATCH_SIZE = 50
+MAX_DOWNLOAD_WORKERS = 8
+
+# Download scheduler settings: provider requests per second (and burst), retries per
+# ticker, exponential backoff bounds in seconds, and where failed tickers are journaled
+REQUESTS_PER_SECOND = 1.0
+REQUEST_BURST = 4
+MAX_RETRIES = 4
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+FAILED_JOURNAL = "failed_tickers.json"
+
+# Downsampling applied to each series before it is handed to Matplotlib/Plotly:
+# "minmax" (keep each pixel bucket's low and high), "lttb" or None for every bar
+DOWNSAMPLE_MODE = "minmax"
+
+# Bar size the charts are drawn from: "weekly" or "monthly" resample the daily matrix to
+# each period's last close before any grouping or rendering, "auto" picks the coarsest of
+# the two that still leaves RESAMPLE_BARS_PER_PIXEL bars per pixel of a RESAMPLE_WIDTH_PX
+# wide figure (a 16 in PNG at dpi=240) over the date span, and None keeps the daily bars
+RESAMPLE_MODE = None
+RESAMPLE_WIDTH_PX = 16 * 240
+RESAMPLE_BARS_PER_PIXEL = 0.5
+RESAMPLE_CHUNK_COLUMNS = 1024
+
+# Worker processes for rendering PNGs and exporting Plotly charts (None = one per CPU)
+RENDER_WORKERS = None
+
+# Start method for worker pools. With "forkserver" each worker forks from one small server
+# process that imported this module (and the plotting library its pool needs) once, instead
+# of forking this threaded process or re-importing everything per worker as "spawn" does.
+# None uses the platform default (spawn on Windows, where forkserver is unavailable).
+WORKER_START_METHOD = "forkserver" if "forkserver" in mp.get_all_start_methods() else None
+
+# Plotly export settings: how HTML files get plotly.js ("shared" writes one plotly-<version>.min.js
+# per output directory that every file references, "inline" embeds ~3-4 MB per file,
+# "cdn" loads it online), and the point count above which a chart uses WebGL (Scattergl)
+PLOTLY_BUNDLE = "shared"
+PLOTLY_JS_FILE = "plotly-{version}.min.js"  # versioned, so a plotly upgrade never reuses an older bundle
+WEBGL_MIN_POINTS = 200_000
+
+# Incremental regeneration (run_charts' default): when enabled, each output directory keeps a
+# manifest of the input hash of every chart written there, and charts whose inputs and render
+# parameters are unchanged since the last run are not rendered again. Bump MANIFEST_VERSION
+# when the rendering itself changes so every chart is redrawn once.
+INCREMENTAL = False
+MANIFEST_FILE = "chart_manifest.json"
+MANIFEST_VERSION = 1
+
+# Start-date grouping: option 1 bucket width ("5Y", "6M", ...) and alignment ("earliest"
+# counts from the earliest start date, "calendar" cuts at calendar boundaries), the minimum
+# tickers per bucket, and the minimum tickers sharing a start date for option 2
+BUCKET_WIDTH = "5Y"
+BUCKET_ALIGN = "earliest"
+MIN_BUCKET_TICKERS = 1
+MIN_SHARED_START = 10
+
+# Universe chart (option 5): the cross-sectional percentiles drawn as bands around the
+# median, the fewest tickers a date needs to get percentiles, and the rows sorted per pass
+ENVELOPE_PERCENTILES = (5, 25, 50, 75, 95)
+ENVELOPE_MIN_TICKERS = 5
+ENVELOPE_CHUNK_ROWS = 2048
+
+# Per-ticker statistics (total return, CAGR, max drawdown, volatility, first/last date, bar
+# count), computed for all tickers at once and kept in STATS_FILE next to the price data so
+# ranking never rereads the series; option 6 charts the RANK_TOP best and worst tickers
+STATS_FILE = "ticker_stats.parquet"
+STATS_CHUNK_COLUMNS = 1024
+TRADING_DAYS_PER_YEAR = 252
+RANK_BY = "cagr"
+RANK_TOP = 20
+
+# Sharding: the ticker universe is split into N shards by a stable hash of each symbol, so
+# separate processes (or hosts) can each download one shard and write its aligned closes to
+# SHARD_DIR; `merge` reassembles the shards into one matrix for the global charts
+SHARD_DIR = "shards"
+SHARD_VERSION = 1
+
+# Chart service (serve subcommand): address, threads rendering charts, and the memory for
+# rendered charts kept for repeat requests (least recently used evicted first). The service
+# also keeps the groupings of its most recent option settings, and only the last
+# SERVE_SPAN_HISTORY span records (per-stage totals still cover every request).
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8050
+SERVE_THREADS = 4
+SERVE_CACHE_MB = 256
+SERVE_GROUPINGS = 64
+SERVE_SPAN_HISTORY = 1000
+
+# Raised by a provider when some symbols of a request failed for a reason worth retrying
+# (throttling, timeouts); carries the frames that did arrive so only the failures are retried.
+class TransientDownloadError(Exception):
+    def __init__(self, message, frames=None, failed=()):
+        super().__init__(message)
+        self.frames = frames or {}
+        self.failed = list(failed)
+
+# yfinance logs per-symbol download errors instead of raising them; this handler collects
+# them (yf.download logs "['SYM1', 'SYM2']: <error>") so throttled symbols can be retried.
+class _YahooErrorLog(logging.Handler):
+    TRANSIENT = ("RateLimit", "Too Many Requests", "Timeout", "timed out", "Connection", "curl")
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = {}
+
+    def emit(self, record):
+        match = re.match(r"^\[(.*?)\]: (.*)$", record.getMessage(), re.S)
+        if match:
+            for ticker in re.findall(r"'([^']+)'", match.group(1)):
+                self.errors[ticker] = match.group(2)
+
+    def transient(self, ticker):
+        return any(marker in self.errors.get(ticker, "") for marker in self.TRANSIENT)
+
+# Price source backed by Yahoo Finance. Anything with the same history()
+# signature (e.g. a local fake provider for offline runs) can be plugged in instead;
+# history_many() is optional and lets a provider serve many symbols per request.
+class YahooProvider:
+    def history(self, ticker, start_date, end_date):
+        import yfinance as yf
+        return yf.Ticker(ticker).history(start=start_date, end=end_date)
+
+    def history_many(self, tickers, start_date, end_date):
+        import yfinance as yf
+        error_log = _YahooErrorLog()
+        logger = logging.getLogger("yfinance")
+        logger.addHandler(error_log)
+        try:
+            data = yf.download(tickers, start=start_date, end=end_date, group_by="ticker", actions=True,
+                               auto_adjust=True, threads=False, progress=False)
+        finally:
+            logger.removeHandler(error_log)
+
+        frames = {}
+        if data is not None and not data.empty:
+            available = set(data.columns.get_level_values(0))
+            for ticker in tickers:
+                if ticker in available:
+                    frame = data[ticker]
+                    frame = frame[frame["Close"].notna()]
+                    if not frame.empty:
+                        frames[ticker] = frame
+
+        failed = [ticker for ticker in tickers if ticker not in frames and error_log.transient(ticker)]
+        if failed:
+            raise TransientDownloadError(f"{len(failed)} tickers throttled or timed out", frames, failed)
+        return frames
+
+# Deterministic offline price source: seeded random-walk OHLC bars per ticker, from a
+# ragged (but often shared) listing date until end_date, with optional sleeps that mimic
+# network latency; error_rate makes that share of symbols fail each request with a
+# TransientDownloadError. first_date sets the history length, listing_step how ragged the
+# listing dates are (1 = any trading day) and shared_start the share listed on first_date.
+class SyntheticProvider:
+    def __init__(self, first_date="1962-01-02", last_listing="2020-01-01", latency=0.0,
+                 symbol_latency=0.0, error_rate=0.0, seed=0, listing_step=63, shared_start=0.0):
+        self.first_date = first_date
+        self.last_listing = last_listing
+        self.latency = latency
+        self.symbol_latency = symbol_latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.listing_step = listing_step
+        self.shared_start = shared_start
+        self._calendars = {}
+        self._errors = random.Random(seed)
+
+    # Weekday calendar from first_date up to (not including) end_date, built once per end date
+    def _calendar(self, end_date):
+        if end_date not in self._calendars:
+            days = np.arange(np.datetime64(self.first_date), np.datetime64(end_date), dtype="datetime64[D]")
+            self._calendars[end_date] = pd.DatetimeIndex(days[np.is_busday(days)].astype("datetime64[ns]"))
+        return self._calendars[end_date]
+
+    def _frame(self, ticker, start_date, end_date):
+        calendar = self._calendar(end_date)
+        key = zlib.crc32(ticker.encode())
+        rng = np.random.default_rng([self.seed, key])
+        # Listing dates snap to every listing_step-th trading day (63: about a quarter) so
+        # many tickers share one; a shared_start share of tickers is listed on first_date
+        listing_days = np.busday_count(np.datetime64(self.first_date), np.datetime64(self.last_listing))
+        listing = int(rng.integers(0, listing_days)) // self.listing_step * self.listing_step
+        shape = np.random.default_rng([self.seed, key, 1])
+        if self.shared_start and shape.random() < self.shared_start:
+            listing = 0
+        calendar = calendar[listing:]
+        returns = rng.normal(0.0003, 0.012, len(calendar))
+        close = 10.0 * np.exp(np.cumsum(returns))
+        # Open gaps from the previous close; high and low bracket the open-close range
+        open_ = np.concatenate(([10.0], close[:-1])) * np.exp(shape.normal(0.0, 0.003, len(close)))
+        high = np.maximum(open_, close) * (1 + np.abs(shape.normal(0.0, 0.005, len(close))))
+        low = np.minimum(open_, close) * (1 - np.abs(shape.normal(0.0, 0.005, len(close))))
+        volume = shape.lognormal(12.0, 1.0, len(close)).astype(np.int64)
+        frame = pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close,
+                              "Volume": volume, "Dividends": 0.0, "Stock Splits": 0.0}, index=calendar)
+        return frame[frame.index >= pd.Timestamp(start_date)]
+
+    def history(self, ticker, start_date, end_date):
+        return self.history_many([ticker], start_date, end_date).get(ticker, pd.DataFrame())
+
+    def history_many(self, tickers, start_date, end_date):
+        time.sleep(self.latency + self.symbol_latency * len(tickers))
+        failed = [ticker for ticker in tickers if self._errors.random() < self.error_rate]
+        frames = {ticker: self._frame(ticker, start_date, end_date) for ticker in tickers if ticker not in failed}
+        frames = {ticker: frame for ticker, frame in frames.items() if not frame.empty}
+        if failed:
+            raise TransientDownloadError(f"{len(failed)} tickers throttled (synthetic)", frames, failed)
+        return frames
+
+# Token-bucket rate limiter: refills `rate` tokens per second up to `capacity`;
+# acquire() blocks until a token is available. Shared by all download threads.
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Wraps a provider with a rate limit, retries with exponential backoff and full jitter,
+# and a retry budget per ticker. Tickers that exhaust their budget are kept in `failed`
+# and can be written to a journal so a later run retries only those. It is itself a
+# provider, so it plugs into PriceCache and fetch_prices unchanged.
+class DownloadScheduler:
+    def __init__(self, provider, rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP, seed=None):
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failed = {}
+        self._jitter = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt):
+        return self._jitter.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def history(self, ticker, start_date, end_date):
+        return self.history_many([ticker], start_date, end_date).get(ticker, pd.DataFrame())
+
+    def history_many(self, tickers, start_date, end_date):
+        frames = {}
+        attempts = dict.fromkeys(tickers, 0)
+        pending = list(tickers)
+        while pending:
+            self.bucket.acquire()
+            try:
+                fetched = history_many(self.provider, pending, start_date, end_date)
+                frames.update(fetched)
+                failed, error = [], None
+            except TransientDownloadError as e:
+                fetched = e.frames
+                frames.update(e.frames)
+                failed, error = [ticker for ticker in e.failed if ticker not in e.frames], e
+            except Exception as e:
+                fetched, failed, error = {}, pending, e
+            run_report.count("requests")
+            run_report.count("bytes_fetched", sum(int(frame.memory_usage().sum()) for frame in fetched.values()))
+
+            retry = []
+            for ticker in failed:
+                attempts[ticker] += 1
+                if attempts[ticker] > self.max_retries:
+                    run_report.count("retries_exhausted")
+                    with self._lock:
+                        self.failed[ticker] = {"error": str(error), "attempts": attempts[ticker]}
+                else:
+                    retry.append(ticker)
+            run_report.count("retries", len(retry))
+            if retry:
+                attempt = max(attempts[ticker] for ticker in retry)
+                delay = self.backoff(attempt)
+                print(f"Retrying {len(retry)} tickers in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries + 1}): {error}")
+                time.sleep(delay)
+            pending = retry
+
+        with self._lock:
+            for ticker in frames:
+                self.failed.pop(ticker, None)
+        return frames
+
+    # Write the failed-ticker journal, or remove it once nothing is left to retry
+    def save_journal(self, path, tickers, start_date, end_date):
+        if not self.failed:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"tickers": tickers, "start_date": start_date, "end_date": end_date,
+                       "failed": self.failed}, f, indent=1)
+        print(f"{len(self.failed)} tickers failed after {self.max_retries} retries; saved to {path}.")
+
+# Read a failed-ticker journal written by DownloadScheduler.save_journal, or None
+def load_journal(path=FAILED_JOURNAL):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading failed-ticker journal {path}: {e}")
+        return None
+
+# Fetch many tickers from any provider, batched if it supports it: {ticker: DataFrame}
+def history_many(provider, tickers, start_date, end_date):
+    if hasattr(provider, "history_many"):
+        return provider.history_many(tickers, start_date, end_date)
+    frames = {}
+    for ticker in tickers:
+        frame = provider.history(ticker, start_date, end_date)
+        if not frame.empty:
+            frames[ticker] = frame
+    return frames
+
+# Daily bars keyed by plain dates: Ticker.history() is tz-aware, yf.download() is not
+def naive_dates(frame):
+    if getattr(frame.index, "tz", None) is not None:
+        frame = frame.tz_localize(None)
+    return frame
+
+# Local columnar price cache. Each ticker's bars live in <cache_dir>/<TICKER>.parquet and
+# index.json records, per ticker, the requested start, the first/last bar date, the row
+# count and the end date it was last fetched through, so later runs only top up the gap.
+class PriceCache:
+    def __init__(self, cache_dir=CACHE_DIR, provider=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.provider = provider if provider is not None else YahooProvider()
+        self.index_path = self.cache_dir / "index.json"
+        self.index = self._load_index()
+        self._updated = set()
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Error reading cache index, starting with an empty cache: {e}")
+            return {}
+
+    def save_index(self):
+        # Write to a temp file first so an interrupted run never leaves a truncated index.
+        # Only this run's entries are written over the index on disk, so processes sharing
+        # the cache (e.g. shards on one machine) keep each other's updates.
+        temp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with self._lock:
+            index = self._load_index()
+            index.update({ticker: self.index[ticker] for ticker in self._updated})
+            self.index = index
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.index_path)
+
+    def path(self, ticker):
+        return self.cache_dir / f"{ticker}.parquet"
+
+    def load(self, ticker):
+        if ticker not in self.index or not self.path(ticker).exists():
+            return None
+        try:
+            return naive_dates(pd.read_parquet(self.path(ticker)))
+        except Exception as e:
+            print(f"Error reading cached data for {ticker}, refetching: {e}")
+            return None
+
+    # First date still missing from the cache, or None if it is already fetched through end_date
+    def missing_start(self, ticker, start_date, end_date):
+        entry = self.index.get(ticker)
+        if entry is None or entry["start"] > start_date:
+            return start_date
+        if entry["fetched_through"] >= end_date:
+            return None
+        next_day = (pd.Timestamp(entry["last_date"]) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        # Nothing to ask for if the gap holds no weekday (e.g. a Monday rerun after Friday's bar)
+        return next_day if np.busday_count(next_day, end_date) > 0 else None
+
+    def record(self, ticker, data, start_date, end_date):
+        self.record_entry(ticker, start_date, end_date, data.index[0].strftime('%Y-%m-%d'),
+                          data.index[-1].strftime('%Y-%m-%d'), len(data))
+
+    # Index entry from metadata alone (e.g. reported by a download worker that wrote the file)
+    def record_entry(self, ticker, start_date, end_date, first_date, last_date, rows):
+        with self._lock:
+            self._updated.add(ticker)
+            self.index[ticker] = {
+                "start": start_date,
+                "first_date": first_date,
+                "last_date": last_date,
+                "rows": rows,
+                "fetched_through": end_date,
+            }
+
+    # Append freshly downloaded bars to the cached ones, write the file and index entry
+    def _store(self, ticker, cached, new_data, start_date, end_date):
+        if new_data is not None:
+            new_data = naive_dates(new_data)
+        if cached is None:
+            data = new_data
+        elif new_data is None or new_data.empty:
+            data = cached
+        else:
+            data = pd.concat([cached, new_data])
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+
+        if data is None or data.empty:
+            return None
+        if data is not cached:
+            data.to_parquet(self.path(ticker))
+        self.record(ticker, data, start_date, end_date)
+        return data
+
+    # Return {ticker: bars in [start_date, end_date)}, downloading only the ranges the cache
+    # is missing. Tickers missing the same range are fetched together in one batched request.
+    # The cache may hold more history than this run asks for, so every frame is clipped to
+    # the range, the same bars an uncached download returns.
+    def update_many(self, tickers, start_date, end_date):
+        results = {}
+        cached = {}
+        plans = {}
+        for ticker in tickers:
+            frame = self.load(ticker)
+            fetch_start = self.missing_start(ticker, start_date, end_date) if frame is not None else start_date
+            if fetch_start is None:
+                results[ticker] = frame
+                continue
+            cached[ticker] = frame if fetch_start != start_date else None
+            plans.setdefault(fetch_start, []).append(ticker)
+
+        refetch = []
+        for fetch_start, group in sorted(plans.items()):
+            new_frames = history_many(self.provider, group, fetch_start, end_date)
+            for ticker in group:
+                new_data = new_frames.get(ticker)
+                # A top-up the provider gave up on keeps the cached bars but not a new
+                # fetched_through, so a resume from the failed-ticker journal asks again
+                if new_data is None and cached[ticker] is not None and ticker in getattr(self.provider, "failed", ()):
+                    results[ticker] = cached[ticker]
+                    continue
+                # Yahoo back-adjusts closes on splits/dividends, so a top-up containing one
+                # invalidates the cached history and we refetch it in full
+                if cached[ticker] is not None and new_data is not None:
+                    events = [column for column in ("Dividends", "Stock Splits") if column in new_data]
+                    if events and new_data[events].to_numpy().any():
+                        print(f"Split or dividend for {ticker} since last run, refetching full history...")
+                        refetch.append(ticker)
+                        continue
+                data = self._store(ticker, cached[ticker], new_data, start_date, end_date)
+                if data is not None:
+                    results[ticker] = data
+
+        if refetch:
+            new_frames = history_many(self.provider, refetch, start_date, end_date)
+            for ticker in refetch:
+                data = self._store(ticker, None, new_frames.get(ticker), start_date, end_date)
+                if data is not None:
+                    results[ticker] = data
+        first, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        clipped = {ticker: frame[(frame.index >= first) & (frame.index < end)] for ticker, frame in results.items()}
+        return {ticker: frame for ticker, frame in clipped.items() if not frame.empty}
+
+    # Single-ticker form of update_many; returns an empty frame if there is no data
+    def update(self, ticker, start_date, end_date):
+        return self.update_many([ticker], start_date, end_date).get(ticker, pd.DataFrame())
+
+# Batched download engine. The work is network-bound, so instead of one process per ticker
+# we send batch_size symbols per request through a bounded thread pool and return the
+# closes as one wide date-by-ticker DataFrame aligned on the union of trading days.
+def fetch_prices(tickers, start_date, end_date, cache=None, provider=None,
+                 batch_size=BATCH_SIZE, max_workers=MAX_DOWNLOAD_WORKERS):
+    if provider is None:
+        provider = cache.provider if cache is not None else YahooProvider()
+    batches = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+
+    # Each batch is reduced to its closes right away so full OHLC frames never pile up
+    def fetch_batch(batch):
+        print(f"Downloading data for {len(batch)} tickers ({batch[0]} to {batch[-1]})...")
+        try:
+            if cache is not None:
+                frames = cache.update_many(batch, start_date, end_date)
+            else:
+                frames = history_many(provider, batch, start_date, end_date)
+        except Exception as e:
+            print(f"Error downloading {batch[0]} to {batch[-1]}: {e}")
+            return {}
+        # copy() so the close column does not keep its whole OHLC frame alive
+        return {ticker: naive_dates(frame)["Close"].dropna().copy() for ticker, frame in frames.items()}
+
+    closes = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch, batch_closes in zip(batches, executor.map(fetch_batch, batches)):
+            for ticker in batch:
+                close = batch_closes.get(ticker)
+                if close is None or close.empty:
+                    print(f"No data available for {ticker}")
+                    run_report.count("tickers_empty")
+                    continue
+                closes[ticker] = close
+                run_report.count("tickers_ok")
+                print(f"Data for {ticker} starts from {close.index[0].strftime('%Y-%m-%d')}")
+
+    if cache is not None:
+        cache.save_index()
+    return align_closes(closes)
+
+# Stack {ticker: close Series} into one date-by-ticker DataFrame on the union of their dates.
+# Filling a preallocated array avoids the per-column reindex copies of pd.DataFrame(dict).
+def align_closes(closes):
+    if not closes:
+        return pd.DataFrame(dtype="float64")
+    dates = closes[next(iter(closes))].index
+    for close in closes.values():
+        if not close.index.equals(dates):
+            dates = dates.union(close.index)
+    values = np.full((len(dates), len(closes)), np.nan)
+    for column, close in enumerate(closes.values()):
+        values[dates.get_indexer(close.index), column] = close.to_numpy()
+    return pd.DataFrame(values, index=dates, columns=list(closes))
+
+# Aligned price store shared by every chart option: one float32 date-by-ticker matrix on a
+# single trading-day index (NaN where a ticker has no bar), each ticker's start offset
+# (first row with data) and the validity mask. Replaces per-ticker dicts of Series.
+class PriceMatrix:
+    # Derived views, computed lazily by view() and kept for reuse within the run
+    METRICS = ("price", "percent", "log", "rebased")
+
+    def __init__(self, dates, tickers, values, daily=None):
+        self.dates = dates
+        self.tickers = list(tickers)
+        self.values = values
+        self.valid = ~np.isnan(values)
+        self.start = self.valid.argmax(axis=0) if len(values) else np.zeros(values.shape[1], dtype=np.intp)
+        self.column = {ticker: i for i, ticker in enumerate(self.tickers)}
+        # Daily matrix this one was resampled from (None for daily bars): its first bars stay
+        # the start dates and metric baselines, so grouping is unchanged and every view equals
+        # the daily view on the sampled dates
+        self.daily = daily
+        # Where ticker_stats() keeps this matrix's statistics (None: computed in memory only)
+        self.stats_path = None
+        self._views = {"price": values}
+        self._cache = {}
+
+    @classmethod
+    def from_frame(cls, prices, dtype=np.float32):
+        prices = prices.dropna(axis=1, how="all")
+        return cls(prices.index, prices.columns, prices.to_numpy(dtype=dtype))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.valid.nbytes + self.start.nbytes + self.dates.nbytes
+
+    # First bar date of every ticker, in self.tickers order
+    def start_dates(self):
+        if self.daily is not None:
+            return self.daily.start_dates()
+        return self.dates[self.start]
+
+    # Hash of one column's bars (dates and closes of the rows it has data), built on first use;
+    # every metric view of the column is derived from exactly these values
+    def column_digest(self, column):
+        digests = self._cache.setdefault("digests", {})
+        if column not in digests:
+            rows = self.valid[:, column]
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(self.dates.asi8[rows].tobytes())
+            digest.update(self.values[rows, column].tobytes())
+            digests[column] = digest.hexdigest()
+        return digests[column]
+
+    # Tickers sorted by start date for grouping, built on first use
+    def start_index(self):
+        if self.daily is not None:
+            return self.daily.start_index()
+        if "start_index" not in self._cache:
+            self._cache["start_index"] = StartDateIndex(self.dates.asi8, self.start, self.tickers)
+        return self._cache["start_index"]
+
+    # Close of every ticker on its first bar
+    def initial_prices(self):
+        if self.daily is not None:
+            return self.daily.initial_prices()
+        return self.values[self.start, np.arange(len(self.tickers))]
+
+    # Matrix of "weekly" or "monthly" bars: each ticker's last close in every period, dated
+    # by the period's last trading day; "daily" returns this matrix. Built on first use. Each
+    # period takes its last row, and a ticker missing a bar there steps back one row at a time
+    # (at most the longest period) to its latest bar in the period, a column chunk at a time;
+    # a period where a ticker has no bar (before listing, after delisting) stays NaN.
+    def resample(self, bars):
+        if self.daily is not None:
+            return self.daily.resample(bars)
+        if bars == "daily":
+            return self
+        if ("resample", bars) not in self._cache:
+            with run_report.span(f"resample:{bars}"):
+                periods = period_keys(self.dates, bars)
+                last = np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+                first = np.append(0, last[:-1] + 1)
+                longest = int((last - first).max()) if len(last) else 0
+                values = np.empty((len(last), len(self.tickers)), dtype=self.values.dtype)
+                for start in range(0, len(self.tickers), RESAMPLE_CHUNK_COLUMNS):
+                    columns = slice(start, start + RESAMPLE_CHUNK_COLUMNS)
+                    block = self.values[last, columns]
+                    missing = ~self.valid[last, columns]
+                    for back in range(1, longest + 1):
+                        earlier = np.maximum(last - back, first)
+                        fill = missing & self.valid[earlier, columns]
+                        block[fill] = self.values[earlier, columns][fill]
+                        missing &= ~fill
+                    values[:, columns] = block
+                self._cache[("resample", bars)] = PriceMatrix(self.dates[last], self.tickers, values, daily=self)
+            run_report.count("resampled_rows", len(last))
+        return self._cache[("resample", bars)]
+
+    # Matrix of one metric for all tickers, relative to each ticker's first close:
+    # "price" (raw closes), "percent" (percentage increase), "log" (cumulative log
+    # return) or "rebased" (rebased to 100). Each is one vectorized pass, built on first use.
+    def view(self, metric):
+        if metric not in self._views:
+            with run_report.span(f"view:{metric}"):
+                self._views[metric] = self._compute_view(metric)
+        return self._views[metric]
+
+    def _compute_view(self, metric):
+        initial_prices = self.initial_prices()
+        if metric == "percent":
+            return ((self.values - initial_prices) / initial_prices) * 100
+        if metric == "log":
+            return np.log(self.values / initial_prices)
+        if metric == "rebased":
+            return (self.values / initial_prices) * 100
+        raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(self.METRICS)}")
+
+    # Percentiles of one metric across all tickers on each date, as a (percentiles, dates)
+    # array; NaN on dates where fewer than min_count tickers have a bar. Rows are sorted a
+    # chunk at a time (NaN sorts last), and each percentile interpolates linearly between
+    # two sorted neighbours like np.nanpercentile, without its per-row Python loop.
+    def percentiles(self, metric="percent", percentiles=ENVELOPE_PERCENTILES, min_count=ENVELOPE_MIN_TICKERS):
+        key = ("percentiles", metric, tuple(percentiles), min_count)
+        if key not in self._cache:
+            with run_report.span("percentiles"):
+                values = self.view(metric)
+                counts = self.valid.sum(axis=1)
+                fractions = np.asarray(percentiles, dtype=np.float64)[:, None] / 100
+                result = np.full((len(percentiles), len(self.dates)), np.nan, dtype=np.float32)
+                for start in range(0, len(self.dates), ENVELOPE_CHUNK_ROWS):
+                    rows = slice(start, start + ENVELOPE_CHUNK_ROWS)
+                    block = np.sort(values[rows], axis=1)
+                    position = fractions * np.maximum(counts[rows] - 1, 0)
+                    low = np.floor(position).astype(np.intp)
+                    high = np.minimum(low + 1, np.maximum(counts[rows] - 1, 0))
+                    below = np.take_along_axis(block, low.T, axis=1).T
+                    above = np.take_along_axis(block, high.T, axis=1).T
+                    result[:, rows] = below + (above - below) * (position - low)
+                result[:, counts < min_count] = np.nan
+            self._cache[key] = result
+        return self._cache[key]
+
+    # (dates, values) for one ticker's bars, skipping rows where it has no data; `values`
+    # may be any matrix of the same shape (e.g. view("percent")), default closes
+    def series(self, ticker, values=None):
+        column = self.column[ticker]
+        rows = self.valid[:, column]
+        data = self.values if values is None else values
+        return self.dates[rows], data[rows, column]
+
+# --- Resampling ---
+
+# Period of every date for resampling: weeks (Monday to Sunday, counted in days shifted by 3
+# since the numpy epoch is a Thursday) or calendar months, as non-decreasing integers
+def period_keys(dates, bars):
+    days = dates.asi8.astype("datetime64[ns]").astype("datetime64[D]")
+    if bars == "weekly":
+        return (days.astype(np.int64) + 3) // 7
+    if bars == "monthly":
+        return days.astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"Unknown bar size '{bars}', expected 'daily', 'weekly' or 'monthly'")
+
+# Bar size for a resampling mode over `dates`: "auto" picks the coarsest bars that still
+# give at least bars_per_pixel bars per pixel of a width_px wide figure, else daily
+def resample_bars(dates, mode=RESAMPLE_MODE, width_px=RESAMPLE_WIDTH_PX, bars_per_pixel=RESAMPLE_BARS_PER_PIXEL):
+    if not mode or mode == "daily" or not len(dates):
+        return "daily"
+    if mode != "auto":
+        return mode
+    for bars in ("monthly", "weekly"):
+        if len(np.unique(period_keys(dates, bars))) >= width_px * bars_per_pixel:
+            return bars
+    return "daily"
+
+# --- Ticker statistics ---
+
+# Statistics of every ticker in a matrix, one numpy array per field in tickers order.
+# Returns, drawdown and volatility are in percent; max_drawdown is <= 0 and volatility is
+# the annualized standard deviation of daily log returns.
+class TickerStats:
+    FIELDS = ("first_date", "last_date", "bars", "first_close", "last_close",
+              "total_return", "cagr", "max_drawdown", "volatility")
+    # Fields a ticker can be ranked by, with their chart labels
+    RANKINGS = {"total_return": "Total Return", "cagr": "CAGR", "max_drawdown": "Max Drawdown",
+                "volatility": "Volatility", "bars": "History"}
+
+    def __init__(self, tickers, fields):
+        self.tickers = list(tickers)
+        self.fields = fields
+        self.position = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    def __len__(self):
+        return len(self.tickers)
+
+    # First and last bar, bar count and the closes on both ends: enough to tell whether a
+    # stored row still describes a column without reading the column
+    @staticmethod
+    def signature(matrix):
+        columns = np.arange(len(matrix.tickers))
+        last = len(matrix.dates) - 1 - matrix.valid[::-1].argmax(axis=0)
+        dates = matrix.dates.asi8.astype("datetime64[ns]")
+        return {"first_date": dates[matrix.start], "last_date": dates[last], "bars": matrix.valid.sum(axis=0),
+                "first_close": matrix.values[matrix.start, columns], "last_close": matrix.values[last, columns]}
+
+    # Statistics of the given columns of a daily matrix, a chunk of columns at a time
+    @classmethod
+    def compute(cls, matrix, columns, signature):
+        fields = {name: values[columns] for name, values in signature.items()}
+        years = (fields["last_date"] - fields["first_date"]).astype("timedelta64[D]").astype(np.float64) / 365.25
+        growth = fields["last_close"].astype(np.float64) / fields["first_close"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fields["total_return"] = (growth - 1) * 100
+            fields["cagr"] = np.where(years > 0, (growth ** (1 / years) - 1) * 100, np.nan)
+        fields["max_drawdown"] = np.empty(len(columns))
+        fields["volatility"] = np.empty(len(columns))
+        for start in range(0, len(columns), STATS_CHUNK_COLUMNS):
+            chunk = slice(start, start + STATS_CHUNK_COLUMNS)
+            values = matrix.values[:, columns[chunk]]
+            # fmax skips NaN, so the running peak only starts at each ticker's first bar
+            peaks = np.fmax.accumulate(values, axis=0)
+            fields["max_drawdown"][chunk] = (np.nanmin(values / peaks, axis=0) - 1) * 100
+            returns = np.diff(np.log(values), axis=0)
+            counted = ~np.isnan(returns)
+            n = counted.sum(axis=0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                mean = np.nansum(returns, axis=0, dtype=np.float64) / n
+                variance = np.nansum((returns - mean) ** 2, axis=0, dtype=np.float64) / (n - 1)
+            fields["volatility"][chunk] = np.where(n > 1, np.sqrt(variance * TRADING_DAYS_PER_YEAR) * 100, np.nan)
+        return fields
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        signature = cls.signature(matrix)
+        return cls(matrix.tickers, cls.compute(matrix, np.arange(len(matrix.tickers)), signature))
+
+    def frame(self):
+        return pd.DataFrame(self.fields, index=pd.Index(self.tickers, name="ticker"))
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(frame.index, {name: frame[name].to_numpy() for name in cls.FIELDS})
+
+    # Years between each ticker's first and last bar
+    def years(self):
+        days = (self.fields["last_date"] - self.fields["first_date"]).astype("timedelta64[D]")
+        return days.astype(np.float64) / 365.25
+
+    # Tickers ordered by one field, highest first, keeping those with a value and at least
+    # min_years of history
+    def ranked(self, by=RANK_BY, min_years=0.0):
+        if by not in self.RANKINGS:
+            raise ValueError(f"Unknown ranking '{by}', expected one of {', '.join(self.RANKINGS)}")
+        values = self.fields[by].astype(np.float64)
+        keep = np.flatnonzero(~np.isnan(values) & (self.years() >= min_years))
+        order = keep[np.argsort(-values[keep], kind="stable")]
+        return [self.tickers[i] for i in order]
+
+    # Statistics of some tickers as JSON-ready dicts
+    def rows(self, tickers):
+        rows = []
+        for ticker in tickers:
+            i = self.position[ticker]
+            row = {"ticker": ticker}
+            for name in self.FIELDS:
+                value = self.fields[name][i]
+                if name.endswith("_date"):
+                    row[name] = pd.Timestamp(value).strftime('%Y-%m-%d')
+                elif name == "bars":
+                    row[name] = int(value)
+                else:
+                    row[name] = None if np.isnan(value) else round(float(value), 4)
+            rows.append(row)
+        return rows
+
+# TickerStats of a matrix (of its daily bars if it was resampled), built on first use. With
+# a stats_path, rows saved there whose signature still matches are reused, only the other
+# tickers are computed, and the file is updated; rows of tickers not in this matrix are kept.
+def ticker_stats(matrix):
+    matrix = matrix.daily if matrix.daily is not None else matrix
+    if "stats" in matrix._cache:
+        return matrix._cache["stats"]
+    with run_report.span("stats"):
+        signature = TickerStats.signature(matrix)
+        saved = None
+        if matrix.stats_path and os.path.exists(matrix.stats_path):
+            try:
+                saved = pd.read_parquet(matrix.stats_path)
+                if not set(TickerStats.FIELDS) <= set(saved.columns):
+                    saved = None
+            except Exception as e:
+                print(f"Error reading ticker statistics, recomputing: {e}")
+
+        fields = {name: np.empty(len(matrix.tickers), dtype=values.dtype) for name, values in signature.items()}
+        fields.update({name: np.empty(len(matrix.tickers)) for name in TickerStats.FIELDS if name not in fields})
+        stale = np.arange(len(matrix.tickers))
+        if saved is not None:
+            rows = saved.index.get_indexer(matrix.tickers)
+            known = rows >= 0
+            same = known.copy()
+            for name, values in signature.items():
+                stored = saved[name].to_numpy()[rows[known]]
+                same[known] &= stored == values[known]
+            for name in TickerStats.FIELDS:
+                fields[name][same] = saved[name].to_numpy()[rows[same]]
+            stale = np.flatnonzero(~same)
+        if len(stale):
+            for name, values in TickerStats.compute(matrix, stale, signature).items():
+                fields[name][stale] = values
+        stats = TickerStats(matrix.tickers, fields)
+        run_report.count("stats_computed", len(stale))
+        run_report.count("stats_reused", len(matrix.tickers) - len(stale))
+
+        if matrix.stats_path and len(stale):
+            frame = stats.frame()
+            if saved is not None:
+                frame = pd.concat([saved.loc[~saved.index.isin(frame.index), list(TickerStats.FIELDS)], frame])
+            temp_path = f"{matrix.stats_path}.{os.getpid()}.tmp"
+            frame.to_parquet(temp_path)
+            os.replace(temp_path, matrix.stats_path)
+    matrix._cache["stats"] = stats
+    return stats
+
+# --- Start-date grouping ---
+
+# Length of each bucket unit in days when buckets count from the earliest start date, and
+# the numpy calendar unit, multiplier and offset when they are calendar-aligned (weeks are
+# counted in days shifted by 3 so they start on Monday; the numpy epoch is a Thursday)
+BUCKET_UNITS = {"Y": (365.25, "Y", 1, 0), "Q": (365.25 / 4, "M", 3, 0), "M": (365.25 / 12, "M", 1, 0),
+                "W": (7, "D", 7, 3), "D": (1, "D", 1, 0)}
+BUCKET_UNIT_NAMES = {"Y": "Years", "Q": "Quarters", "M": "Months", "W": "Weeks", "D": "Days"}
+
+# "5Y" -> (5, "Y"); a bare number means years. Units: Y, Q, M, W, D.
+def parse_bucket_width(width):
+    text = str(width).strip().upper()
+    unit = text[-1] if text and text[-1].isalpha() else "Y"
+    number = text[:-1] if text and text[-1].isalpha() else text
+    if unit not in BUCKET_UNITS or not number.isdigit() or int(number) < 1:
+        raise ValueError(f"Invalid bucket width '{width}', expected e.g. 5Y, 2Q, 6M, 4W or 30D")
+    return int(number), unit
+
+# Tickers sorted once by start date, so every grouping is a vectorized pass over one sorted
+# array: groups are contiguous runs found with np.unique instead of a rescan of all tickers
+# per group. Within a group tickers keep their matrix order, as the charts' legends expect.
+class StartDateIndex:
+    def __init__(self, dates, start, tickers):
+        self.order = np.argsort(start, kind="stable")
+        self.tickers = np.asarray(tickers, dtype=object)
+        self.days = np.asarray(dates, dtype="datetime64[ns]")[start[self.order]].astype("datetime64[D]")
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def earliest(self):
+        return pd.Timestamp(self.days[0])
+
+    # Split the sorted days into runs of equal key (keys must be non-decreasing) and keep
+    # runs of at least min_size tickers: [(key, [tickers]), ...]
+    def _runs(self, keys, min_size):
+        if not len(keys):
+            return []
+        unique_keys, first = np.unique(keys, return_index=True)
+        last = np.append(first[1:], len(keys))
+        return [(key, self.tickers[np.sort(self.order[a:b])].tolist())
+                for key, a, b in zip(unique_keys.tolist(), first, last) if b - a >= min_size]
+
+    # Start dates shared by at least min_size tickers: [(Timestamp, [tickers]), ...]
+    def shared_dates(self, min_size=10):
+        return [(pd.Timestamp(np.datetime64(day, "D")), tickers)
+                for day, tickers in self._runs(self.days.astype(np.int64), min_size)]
+
+    # Buckets of `width` (e.g. "5Y", "6M"). align="earliest" counts whole widths from the
+    # earliest start date and keys each bucket by its offset (0, 5, 10 years, ...);
+    # align="calendar" cuts at calendar boundaries (1960, 1965, ... for 5Y) and keys each
+    # bucket by its first calendar unit. Returns [(key, [tickers]), ...] sorted by key.
+    def buckets(self, width="5Y", align="earliest", min_size=1):
+        number, unit = parse_bucket_width(width)
+        unit_days, calendar_unit, multiplier, offset = BUCKET_UNITS[unit]
+        if not len(self):
+            return []
+        if align == "earliest":
+            elapsed = (self.days - self.days[0]).astype(np.int64) / unit_days
+            keys = (elapsed // number).astype(np.int64) * number
+        elif align == "calendar":
+            keys = (self.days.astype(f"datetime64[{calendar_unit}]").astype(np.int64) + offset) // multiplier
+            keys = keys // number * number
+        else:
+            raise ValueError(f"Unknown bucket alignment '{align}', expected 'earliest' or 'calendar'")
+        return self._runs(keys, min_size)
+
+    # First day and exclusive end of a calendar-aligned bucket key
+    def bucket_dates(self, key, width):
+        number, unit = parse_bucket_width(width)
+        _, calendar_unit, multiplier, offset = BUCKET_UNITS[unit]
+        start = np.datetime64(key * multiplier - offset, calendar_unit)
+        end = np.datetime64((key + number) * multiplier - offset, calendar_unit)
+        return pd.Timestamp(start.astype("datetime64[D]")), pd.Timestamp(end.astype("datetime64[D]"))
+
+# --- Downsampling ---
+
+# Min/max per bucket: split the series into threshold/2 equal buckets and keep each
+# bucket's lowest and highest point (plus both ends), so every peak and trough survives.
+def downsample_minmax(dates, values, threshold):
+    n = len(values)
+    buckets = max(threshold // 2, 1)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan, dtype=values.dtype)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    keep = np.unique(np.concatenate(([0, n - 1], lows[lows < n], highs[highs < n])))
+    return dates[keep], values[keep]
+
+# Largest-Triangle-Three-Buckets (Steinarsson 2013): one point per bucket, chosen to form
+# the largest triangle with the previous pick and the next bucket's average.
+def downsample_lttb(dates, values, threshold):
+    n = len(values)
+    x = np.asarray(dates, dtype="datetime64[ns]").view("i8").astype(np.float64).tolist()
+    y = values.astype(np.float64).tolist()
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int).tolist()
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        count = max(next_end - next_start, 1)
+        avg_x = sum(x[next_start:next_end]) / count
+        avg_y = sum(y[next_start:next_end]) / count
+        xa, ya = x[a], y[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xa - avg_x) * (y[j] - ya) - (xa - x[j]) * (avg_y - ya))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    keep = np.array(keep)
+    return dates[keep], values[keep]
+
+# Reduce one series to about `threshold` points (the figure's pixel width) for plotting;
+# mode None (or "") keeps every point
+def downsample(dates, values, threshold, mode=DOWNSAMPLE_MODE):
+    if not mode or len(values) <= threshold or threshold < 3:
+        return dates, values
+    if mode == "lttb":
+        return downsample_lttb(dates, values, threshold)
+    if mode == "minmax":
+        return downsample_minmax(dates, values, threshold)
+    raise ValueError(f"Unknown downsampling mode '{mode}', expected 'minmax', 'lttb' or None")
+
+# --- Incremental regeneration ---
+
+# Input hash of one chart: its render parameters plus the digest of every series on it
+def chart_key(matrix, tickers, params):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps({"version": MANIFEST_VERSION, **params}, sort_keys=True, default=str).encode())
+    for ticker in tickers:
+        digest.update(ticker.encode() + b"\0" + matrix.column_digest(matrix.column[ticker]).encode())
+    return digest.hexdigest()
+
+# Per-directory record of the input hash behind each chart file written there
+class ChartManifest:
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, MANIFEST_FILE)
+        self.charts = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.charts = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable chart manifest {self.path}: {e}")
+
+    # True when the file exists and was last written from the same inputs
+    def fresh(self, filename, key):
+        return self.charts.get(os.path.basename(filename)) == key and os.path.exists(filename)
+
+    def record(self, filename, key):
+        self.charts[os.path.basename(filename)] = key
+
+    def save(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.charts, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+# Split (filename, key, job) entries into the jobs to render and a manifest to record them
+# in. With incremental off every job is rendered and no manifest is kept.
+def stale_jobs(entries, incremental=False):
+    if not incremental:
+        return [job for _, _, job in entries], {}
+    manifests = {}
+    stale = []
+    for filename, key, job in entries:
+        out_dir = os.path.dirname(filename) or "."
+        if out_dir not in manifests:
+            manifests[out_dir] = ChartManifest(out_dir)
+        if manifests[out_dir].fresh(filename, key):
+            print(f"Unchanged: {filename}")
+            run_report.count("charts_unchanged")
+        else:
+            stale.append(job)
+    return stale, manifests
+
+# Record a rendered chart in its directory's manifest (when incremental mode is on)
+def record_chart(manifests, filename, key):
+    manifest = manifests.get(os.path.dirname(filename) or ".")
+    if manifest is not None:
+        manifest.record(filename, key)
+
+# --- Worker pools ---
+
+# Modules each kind of worker pool needs. The heavy ones are imported by the stage that
+# uses them, never at module load, so downloads never pay for the plotting libraries.
+WORKER_MODULES = {
+    "download": ("yfinance", "pyarrow.parquet"),
+    "render": ("matplotlib.figure", "matplotlib.backends.backend_agg"),
+    "export": ("plotly.graph_objects", "plotly.io"),
+}
+
+_workers_preloaded = False
+
+# Choose what the fork server imports before it forks any worker: the main script, this
+# module and the modules of the given pool kinds. Only the first call before the server
+# starts counts, so run_charts declares every kind its options will use up front.
+def preload_workers(kinds):
+    global _workers_preloaded
+    if _workers_preloaded:
+        return
+    _workers_preloaded = True
+    if WORKER_START_METHOD == "forkserver":
+        modules = ["__main__", __name__] + [module for kind in kinds for module in WORKER_MODULES[kind]]
+        mp.get_context("forkserver").set_forkserver_preload(list(dict.fromkeys(modules)))
+
+# Process pool for one kind of worker ("download", "render" or "export")
+def worker_pool(kind, max_workers, initializer, initargs):
+    preload_workers([kind])
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context(WORKER_START_METHOD),
+                               initializer=initializer, initargs=initargs)
+
+# --- Parallel chart rendering ---
+
+# Arrays handed to worker processes as memory-mapped .npy files in a temp directory: the
+# parent writes each array once and every worker maps it read-only instead of unpickling
+# its own copy. Use as a context manager; the files are removed on exit.
+class SharedArrays:
+    def __init__(self, arrays):
+        self.dir = tempfile.mkdtemp(prefix="chartmaker_")
+        self.paths = {}
+        for name, array in arrays.items():
+            self.paths[name] = os.path.join(self.dir, f"{name}.npy")
+            np.save(self.paths[name], array)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def open_shared_arrays(paths):
+    return {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+
+# Per-process render state, set by init_render_worker
+_render_arrays = None
+
+def init_render_worker(paths):
+    global _render_arrays
+    _render_arrays = open_shared_arrays(paths)
+
+# Draw one grouped line chart from the matrix arrays with the object-oriented Matplotlib
+# API on an Agg canvas (no pyplot global state, so any number of these can run side by
+# side in workers or threads). columns is [(ticker, column), ...]; returns the Figure. With a
+# downsample_mode each series is reduced to the figure's pixel width first.
+def draw_group_chart(arrays, title, ylabel, dpi, columns, downsample_mode=None):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    dates = arrays["dates"].view("datetime64[ns]")
+    values = arrays["values"]
+    valid = arrays["valid"]
+
+    fig = Figure(figsize=(16, 9), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for ticker, column in columns:
+        rows = valid[:, column]
+        ax.plot(*downsample(dates[rows], values[rows, column], 16 * dpi, downsample_mode), label=ticker)
+
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    ax.grid(True)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+# Draw the universe chart: the outer percentiles as nested filled bands around the median
+# line, plus a line for each highlighted (ticker, dates, values). However many tickers the
+# percentiles summarize, the figure holds the same few artists and a short legend.
+def draw_envelope_chart(dates, percentiles, bands, title, ylabel, dpi, highlights=()):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(16, 9), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    count = len(percentiles)
+    for i in range(count // 2):
+        ax.fill_between(dates, bands[i], bands[count - 1 - i], color="tab:blue", alpha=0.15 + 0.15 * i,
+                        linewidth=0, label=f"{percentiles[i]:g}th-{percentiles[count - 1 - i]:g}th percentile")
+    if count % 2:
+        ax.plot(dates, bands[count // 2], color="tab:blue", linewidth=1.5, label="Median")
+    for ticker, ticker_dates, values in highlights:
+        ax.plot(ticker_dates, values, linewidth=1.2, label=ticker)
+
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel(ylabel)
+    ax.legend(loc="upper left")
+    ax.grid(True)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+# Render worker: one grouped chart saved as a PNG.
+# job = (filename, title, ylabel, dpi, [(ticker, column), ...]); returns the filename.
+def render_group_chart(job):
+    filename, title, ylabel, dpi, columns = job
+    draw_group_chart(_render_arrays, title, ylabel, dpi, columns).savefig(filename)
+    return filename
+
+# Run render jobs over the matrix arrays in worker processes and yield their results in
+# job order. The arrays reach the workers as shared memory-mapped files; a single job (or
+# a single core) is not worth the process start-up and is rendered in-process instead.
+def run_render_pool(render, jobs, arrays, max_workers=RENDER_WORKERS, kind="render"):
+    global _render_arrays
+    workers = min(max_workers or mp.cpu_count(), len(jobs))
+    if workers <= 1:
+        _render_arrays = arrays
+        try:
+            for job in jobs:
+                yield render(job)
+        finally:
+            _render_arrays = None
+        return
+
+    with SharedArrays(arrays) as shared:
+        with worker_pool(kind, workers, init_render_worker, (shared.paths,)) as executor:
+            yield from executor.map(render, jobs)
+
+# Render many grouped charts of one metric matrix in parallel. jobs is a list of
+# (filename, title, tickers).
+def render_group_charts(matrix, values, jobs, ylabel, dpi=240, max_workers=RENDER_WORKERS, incremental=False):
+    keys = {}
+    entries = []
+    for filename, title, tickers in jobs:
+        if incremental:
+            keys[filename] = chart_key(matrix, tickers, {"title": title, "ylabel": ylabel, "dpi": dpi})
+        entries.append((filename, keys.get(filename),
+                        (filename, title, ylabel, dpi, [(ticker, matrix.column[ticker]) for ticker in tickers])))
+    render_jobs, manifests = stale_jobs(entries, incremental)
+    arrays = {"dates": matrix.dates.asi8, "values": values, "valid": matrix.valid}
+    with run_report.span("render:png"):
+        for filename in run_render_pool(render_group_chart, render_jobs, arrays, max_workers):
+            run_report.count("charts_png")
+            record_chart(manifests, filename, keys.get(filename))
+            print(f"Saved chart: {filename}")
+    for manifest in manifests.values():
+        manifest.save()
+
+# --- Plotly export ---
+
+# Build one Plotly line chart from the matrix arrays. spec is a dict with title, metric,
+# hovermode, columns [(ticker, column), ...], webgl (True/False/None = by point count)
+# and downsample (mode name or None).
+def build_plotly_figure(arrays, spec):
+    import plotly.graph_objects as go
+    dates = arrays["dates"].view("datetime64[ns]")
+    values = arrays["values"]
+    valid = arrays["valid"]
+    y_axis_title, _, hover_label, _ = METRIC_LABELS[spec["metric"]]
+
+    traces = []
+    for ticker, column in spec["columns"]:
+        rows = valid[:, column]
+        x, y = downsample(dates[rows], values[rows, column], 2560, spec["downsample"])
+        traces.append((ticker, x, y))
+
+    webgl = spec["webgl"]
+    if webgl is None:
+        webgl = sum(len(y) for _, _, y in traces) >= WEBGL_MIN_POINTS
+    trace_type = go.Scattergl if webgl else go.Scatter
+
+    fig = go.Figure()
+    for ticker, x, y in traces:
+        fig.add_trace(trace_type(
+            x=x,
+            y=y,
+            name=ticker,
+            mode='lines',
+            hovertemplate=f"{ticker}<br>Date: %{{x}}<br>{hover_label}"
+        ))
+
+    fig.update_layout(
+        title=spec["title"],
+        xaxis_title="Date",
+        yaxis_title=y_axis_title,
+        legend_title="Tickers",
+        hovermode=spec["hovermode"],
+        template="plotly_white",
+        width=2560,
+        height=1440
+    )
+    return fig
+
+# Name of the plotly.js bundle that ships with the installed plotly package
+def plotly_js_file():
+    from importlib.metadata import version
+    return PLOTLY_JS_FILE.format(version=version("plotly"))
+
+# Write plotly.js once into out_dir so "shared" HTML exports can all reference it
+def ensure_plotly_bundle(out_dir):
+    path = os.path.join(out_dir, plotly_js_file())
+    if not os.path.exists(path):
+        from plotly.offline import get_plotlyjs
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+    return path
+
+# Export worker: build the figure for spec and write spec["path"] as HTML (plus a static
+# image if spec["image_format"] is set; that needs the optional kaleido package).
+# Returns [(path, seconds, bytes), ...] for the files written.
+def export_plotly_chart(spec):
+    start_time = time.perf_counter()
+    fig = build_plotly_figure(_render_arrays, spec)
+    bundle = {"shared": plotly_js_file(), "inline": True, "cdn": "cdn"}[spec["bundle"]]
+    fig.write_html(spec["path"], include_plotlyjs=bundle)
+    written = [(spec["path"], time.perf_counter() - start_time, os.path.getsize(spec["path"]))]
+
+    if spec["image_format"]:
+        image_path = os.path.splitext(spec["path"])[0] + "." + spec["image_format"]
+        start_time = time.perf_counter()
+        try:
+            fig.write_image(image_path)
+            written.append((image_path, time.perf_counter() - start_time, os.path.getsize(image_path)))
+        except (ImportError, ValueError) as e:
+            print(f"Error writing {image_path} (static export needs kaleido: pip install kaleido): {e}")
+    return written
+
+# Export Plotly charts of one metric matrix in parallel and report each file's size and
+# write time. specs are build_plotly_figure specs plus path, bundle and image_format.
+def export_plotly_charts(matrix, values, specs, max_workers=RENDER_WORKERS, incremental=False):
+    if any(spec["bundle"] == "shared" for spec in specs):
+        for out_dir in {os.path.dirname(spec["path"]) or "." for spec in specs}:
+            ensure_plotly_bundle(out_dir)
+
+    keys = {}
+    if incremental:
+        for spec in specs:
+            params = {name: value for name, value in spec.items() if name != "columns"}
+            keys[spec["path"]] = chart_key(matrix, [ticker for ticker, _ in spec["columns"]], params)
+    specs, manifests = stale_jobs([(spec["path"], keys.get(spec["path"]), spec) for spec in specs], incremental)
+
+    arrays = {"dates": matrix.dates.asi8, "values": values, "valid": matrix.valid}
+    total_bytes = 0
+    with run_report.span("export:html"):
+        for spec, written in zip(specs, run_render_pool(export_plotly_chart, specs, arrays, max_workers, "export")):
+            for path, seconds, size in written:
+                total_bytes += size
+                run_report.count("charts_exported")
+                run_report.count("bytes_written", size)
+                print(f"Saved chart: {path} ({size / 2**20:.2f} MB in {seconds:.2f}s)")
+            record_chart(manifests, spec["path"], keys.get(spec["path"]))
+    for manifest in manifests.values():
+        manifest.save()
+    print(f"Exported {len(specs)} Plotly charts, {total_bytes / 2**20:.1f} MB total.")
+
+# Per-process download state, set by init_download_worker in each pool worker: the
+# provider, the cache, and the shared close matrix with the first day of its calendar
+_worker_provider = YahooProvider()
+_worker_cache = None
+_worker_closes = None
+_worker_first_day = None
+
+def init_download_worker(cache_dir, provider, closes_path=None, shape=None, first_day=None):
+    global _worker_provider, _worker_cache, _worker_closes, _worker_first_day
+    _worker_provider = provider
+    _worker_cache = PriceCache(cache_dir, provider) if cache_dir else None
+    if closes_path is not None:
+        _worker_closes = np.memmap(closes_path, dtype=np.float64, mode="r+", shape=shape)
+        _worker_first_day = np.datetime64(first_day, "D")
+
+# Download one ticker's closes and write them into its row of the shared close matrix, at
+# the rows of their business days (an int64 day index from the calendar's first day); bars
+# on non-business days are dropped. Only metadata goes back through pickle: (ticker, status,
+# first row, row count, cache index entry). The entry is the one this worker's cache
+# recorded for the file it wrote, so the parent's index matches the file, weekend bars included.
 def download_ticker(args):
-    ticker, start_date, end_date = args  # Unpack the arguments
+    ticker, column, start_date, end_date = args  # Unpack the arguments
     try:
         print(f"Downloading data for {ticker}...")
-        stock = yf.Ticker(ticker)
-        data = stock.history(start=start_date, end=end_date)
-        if not data.empty:
-            # Calculate percentage increase on CPU using Pandas/NumPy
-            initial_price = data["Close"].iloc[0]
-            percentage_data = ((data["Close"] - initial_price) / initial_price) * 100
-            percentage_data.name = "Percentage"  # Name the Series for clarity
-            raw_price_data = data["Close"]
-            start_date = data.index[0]
-            print(f"Data for {ticker} starts from {start_date.strftime('%Y-%m-%d')}")
-            return ticker, percentage_data, raw_price_data, start_date
+        if _worker_cache is not None:
+            data = _worker_cache.update(ticker, start_date, end_date)
         else:
+            data = naive_dates(_worker_provider.history(ticker, start_date, end_date))
+        if data.empty:
             print(f"No data available for {ticker}")
-            return ticker, None, None, None
+            return ticker, "empty", 0, 0, None
+        days = data.index.to_numpy().astype("datetime64[D]")
+        closes = data["Close"].to_numpy(dtype=np.float64)
+        business = np.is_busday(days)
+        days, closes = days[business], closes[business]
+        if not len(days):
+            print(f"No data available for {ticker}")
+            return ticker, "empty", 0, 0, None
+        rows = np.busday_count(_worker_first_day, days)
+        first_row, end_row = int(rows[0]), int(rows[-1]) + 1
+        _worker_closes[column, first_row:end_row] = np.nan
+        _worker_closes[column, rows] = closes
+        print(f"Data for {ticker} starts from {days[0]}")
+        entry = _worker_cache.index.get(ticker) if _worker_cache is not None else None
+        return ticker, "ok", first_row, end_row - first_row, entry
     except Exception as e:
         print(f"Error downloading {ticker}: {e}")
-        return ticker, None, None, None
+        return ticker, "error", 0, 0, None
 
-# Main script
-if __name__ == "__main__":
-    # Prompt for tickers with validation
-    def get_tickers_from_input():
-        while True:
-            user_input = input("Input Tickers (comma-separated, 1-5 letters each, no suffix, or press Enter for default): ").strip()
-            
-            # If the user presses Enter (empty input), return the default ticker list
-            if not user_input:
-                return [
-                    "AADR", "AAIT", "AAVX", "AAXJ", "ABCS", "ACCU", "ACIM", "ACWI", "ACWV", "ACWX",
-                    "ADRA", "ADRD", "ADRE", "ADRU", "ADZ", "AFK", "AGA", "AGEM", "AGF", "AGG",
-                    "AGLS", "AGND", "AGOL", "AGQ", "AGRG", "AGZ", "AGZD", "AIA", "ALD", "ALFA",
-                    "ALT", "ALTL", "ALUM", "AMJ", "AMLP", "AMPS", "AMU", "AND", "ANGL", "AOA",
-                    "AOK", "AOM", "AOR", "ARGT", "ASDR", "ASEA", "ASHR", "ASO", "ATMP", "AUD",
-                    "AUNZ", "AUSE", "AXDI", "AXEN", "AXFN", "AXHE", "AXID", "AXIT", "AXJL",
-                    "AXJS", "AXMT", "AXSL", "AXTE", "AXUT", "AYT", "AZIA", "BAB", "BABS",
-                    "BABZ", "BAL", "BARL", "BARN", "BBH", "BBRC", "BBVX", "BCM", "BDCL", "BDCS",
-                    "BDD", "BDG", "BDH", "BFOR", "BGU", "BGZ", "BHH", "BIB", "BICK", "BIK",
-                    "BIL", "BIS", "BIV", "BIZD", "BJK", "BKF", "BKLN", "BLND", "BLNG", "BLV",
-                    "BND", "BNDX", "BNO", "BNPC", "BNZ", "BOIL", "BOM", "BOND", "BONO", "BOS",
-                    "BRAF", "BRAQ", "BRAZ", "BRF", "BRIL", "BRIS", "BRXX", "BRZS", "BRZU", "BSC",
-                    "BSCB", "BSCC", "BSCD", "BSCE", "BSCF", "BSCG", "BSCH", "BSCI", "BSCJ",
-                    "BSCK", "BSCL", "BSCM", "BSJC", "BSJD", "BSJE", "BSJF", "BSJG", "BSJH",
-                    "BSJI", "BSJJ", "BSJK", "BSR", "BSV", "BTAH", "BTAL", "BUND", "BUNL", "BUNT",
-                    "BVL", "BVT", "BWV", "BWX", "BWZ", "BXDB", "BXDC", "BXDD", "BXUB", "BXUC",
-                    "BZF", "BZQ", "CAD", "CAFE", "CANE", "CAPE", "CARZ", "CBND", "CCVX", "CCX",
-                    "CCXE", "CEFL", "CEMB", "CEW", "CFT", "CGW", "CHEP", "CHIB", "CHIE", "CHII",
-                    "CHIM", "CHIQ", "CHIX", "CHLC", "CHNA", "CHOC", "CHXF", "CHXX", "CIU", "CLY",
-                    "CMBS", "CMD", "CMF", "CNDA", "CNPF", "CNTR", "CNY", "COBO", "COLX", "CONG",
-                    "COPX", "CORN", "CORP", "COW", "COWL", "COWS", "CPER", "CPI", "CQQQ", "CRBA",
-                    "CRBI", "CRBQ", "CRO", "CROC", "CROP", "CRUD", "CSCB", "CSCR", "CSD", "CSJ",
-                    "CSLS", "CSM", "CSMA", "CSMB", "CSMN", "CTNN", "CU", "CUPM", "CURE", "CUT",
-                    "CVOL", "CVRT", "CVY", "CWB", "CWI", "CXA", "CYB", "CZA", "CZI", "CZM",
-                    "DAG", "DBA", "DBAP", "DBB", "DBBR", "DBC", "DBCN", "DBE", "DBEF", "DBEM",
-                    "DBEU", "DBGR", "DBIZ", "DBJP", "DBN", "DBO", "DBP", "DBR", "DBS", "DBT",
-                    "DBU", "DBUK", "DBV", "DCNG", "DDG", "DDI", "DDM", "DDP", "DDVX", "DEB",
-                    "DEE", "DEF", "DEFL", "DEM", "DENT", "DES", "DEW", "DFE", "DFJ", "DFVL",
-                    "DFVS", "DGAZ", "DGG", "DGL", "DGLD", "DGP", "DGRE", "DGRS", "DGRW", "DGS",
-                    "DGT", "DGZ", "DHS", "DIA", "DIG", "DIM", "DIRT", "DIV", "DIVS", "DJCI",
-                    "DJP", "DKA", "DLBL", "DLBS", "DLN", "DLS", "DMM", "DND", "DNH", "DNL",
-                    "DNO", "DOD", "DOG", "DOIL", "DOL", "DON", "DOO", "DOY", "DPC", "DPK",
-                    "DPN", "DPU", "DRF", "DRGS", "DRN", "DRR", "DRV", "DRW", "DSC", "DSG",
-                    "DSI", "DSLV", "DSTJ", "DSUM", "DSV", "DSXJ", "DTD", "DTH", "DTN", "DTO",
-                    "DUG", "DVY", "DWM", "DWX", "DXD", "DXJ", "DXO", "DYY", "DZK", "DZZ",
-                    "EAPS", "EATX", "EBND", "ECH", "ECNS", "ECON", "EDC", "EDEN", "EDIV", "EDV",
-                    "EDZ", "EEB", "EEG", "EEH", "EEHB", "EELV", "EEM", "EEME", "EEML", "EEMS",
-                    "EEMV", "EEN", "EEO", "EES", "EET", "EEV", "EEVX", "EEZ", "EFA", "EFAV",
-                    "EFG", "EFN", "EFNL", "EFO", "EFU", "EFV", "EFZ", "EGPT", "EGRW", "EIDO",
-                    "EIPL", "EIPO", "EIRL", "EIS", "EKH", "ELD", "ELG", "ELR", "ELV", "EMAG",
-                    "EMB", "EMBB", "EMCB", "EMCD", "EMCG", "EMCR", "EMDD", "EMDG", "EMDI",
-                    "EMDR", "EMER", "EMEY", "EMFM", "EMFN", "EMFT", "EMG", "EMGX", "EMHD",
-                    "EMHY", "EMIF", "EMLB", "EMLC", "EMLP", "EMM", "EMMT", "EMSA", "EMT", "EMV",
-                    "EMVX", "ENFR", "ENGN", "ENOR", "ENY", "ENZL", "EPHE", "EPI", "EPOL", "EPP",
-                    "EPS", "EPU", "EPV", "EQIN", "EQL", "ERO", "ERUS", "ERW", "ERX", "ERY",
-                    "ESR", "ETFY", "EU", "EUFN", "EUM", "EUO", "EUSA", "EVX", "EWA", "EWC",
-                    "EWD", "EWG", "EWH", "EWI", "EWJ", "EWK", "EWL", "EWM", "EWN", "EWO", "EWP",
-                    "EWQ", "EWS", "EWT", "EWU", "EWV", "EWW", "EWX", "EWY", "EWZ", "EXB", "EXI",
-                    "EXT", "EZA", "EZJ", "EZM", "EZU", "EZY", "FAA", "FAB", "FAD", "FAN", "FAS",
-                    "FAUS", "FAZ", "FBM", "FBT", "FBZ", "FCA", "FCAN", "FCD", "FCG", "FCGL",
-                    "FCGS", "FCHI", "FCL", "FCOM", "FCQ", "FCV", "FDD", "FDIS", "FDL", "FDM",
-                    "FDN", "FDT", "FDTS", "FDV", "FEEU", "FEFN", "FEG", "FEM", "FEMS", "FENY",
-                    "FEP", "FEU", "FEX", "FEZ", "FFL", "FFR", "FFVX", "FGD", "FGEM", "FGHY",
-                    "FGM", "FHC", "FHK", "FHLC", "FIDU", "FIGY", "FIL", "FILL", "FINF", "FINU",
-                    "FINZ", "FIO", "FISN", "FIVZ", "FIW", "FJP", "FKL", "FKO", "FKU", "FLAG",
-                    "FLAT", "FLG", "FLM", "FLN", "FLOT", "FLRN", "FLTR", "FLYX", "FM", "FMAT",
-                    "FMF", "FMK", "FMM", "FMU", "FMV", "FNCL", "FNDA", "FNDB", "FNDC", "FNDE",
-                    "FNDF", "FNDX", "FNI", "FNIO", "FNK", "FNX", "FNY", "FOC", "FOIL", "FOL",
-                    "FONE", "FORX", "FOS", "FPA", "FPE", "FPX", "FRI", "FRN", "FTA", "FTC",
-                    "FTY", "FUD", "FUE", "FVD", "FVI", "FVL", "FXA", "FXB", "FXC", "FXD", "FXE",
-                    "FXF", "FXG", "FXH", "FXI", "FXL", "FXM", "FXN", "FXO", "FXP", "FXR", "FXS",
-                    "FXU", "FXY", "FXZ", "FYX", "FZB", "GAF", "GAL", "GASL", "GASX", "GASZ",
-                    "GAZ", "GBB", "GBF", "GCC", "GCE", "GDAY", "GDX", "GDXJ", "GEMS", "GERJ",
-                    "GEX", "GGEM", "GGGG", "GGOV", "GHYG", "GII", "GIVE", "GIY", "GLCB", "GLD",
-                    "GLDI", "GLDX", "GLJ", "GLL", "GLTR", "GMF", "GMFS", "GML", "GMM", "GMMB",
-                    "GMTB", "GNAT", "GNMA", "GNR", "GOE", "GOVT", "GQRE", "GREK", "GRES", "GRI",
-                    "GRID", "GRN", "GRPC", "GRU", "GRV", "GRWN", "GSAX", "GSC", "GSD", "GSG",
-                    "GSGO", "GSMA", "GSO", "GSP", "GSR", "GSRA", "GSW", "GSY", "GSZ", "GTAA",
-                    "GTIP", "GULF", "GUNR", "GUR", "GURU", "GVI", "GVT", "GWL", "GWO", "GWX",
-                    "GXC", "GXF", "GXG", "GYLD", "HAO", "HAP", "HBTA", "HDG", "HDGE", "HDGI",
-                    "HDIV", "HDV", "HECO", "HEDJ", "HEVY", "HFIN", "HGEM", "HGI", "HHH", "HILO",
-                    "HKK", "HMTM", "HPVW", "HSPX", "HUSE", "HVOL", "HVPW", "HYD", "HYE", "HYEM",
-                    "HYG", "HYHG", "HYLD", "HYLS", "HYMB", "HYND", "HYS", "HYXU", "HYZD", "IAH",
-                    "IAI", "IAK", "IAT", "IAU", "IBB", "IBCB", "IBCC", "IBCD", "IBCE", "IBDA",
-                    "IBDB", "IBDC", "IBDD", "IBND", "ICF", "ICI", "ICLN", "ICN", "ICOL", "IDHB",
-                    "IDHQ", "IDLV", "IDOG", "IDU", "IDV", "IDX", "IDXJ", "IEF", "IEFA", "IEI",
-                    "IELG", "IEMG", "IEO", "IESM", "IEV", "IEZ", "IFAS", "IFEU", "IFGL", "IFNA",
-                    "IFSM", "IGE", "IGEM", "IGF", "IGHG", "IGM", "IGN", "IGOV", "IGS", "IGU",
-                    "IGV", "IGW", "IHE", "IHF", "IHI", "IHY", "IIH", "IJH", "IJJ", "IJK", "IJR",
-                    "IJS", "IJT", "ILB", "ILF", "ILTB", "IMLP", "INCO", "INDA", "INDL", "INDY",
-                    "INDZ", "INFL", "INKM", "INP", "INR", "INSD", "INXX", "INY", "IOIL", "IOO",
-                    "IPAL", "IPD", "IPE", "IPF", "IPFF", "IPK", "IPLT", "IPN", "IPO", "IPS",
-                    "IPU", "IPW", "IQDE", "IQDF", "IQDY", "IRO", "IRV", "IRY", "ISHG", "ISI",
-                    "IST", "ITA", "ITB", "ITE", "ITF", "ITM", "ITR", "IVE", "IVV", "IVW", "IWB",
-                    "IWC", "IWD", "IWF", "IWL", "IWM", "IWN", "IWO", "IWP", "IWR", "IWS", "IWV",
-                    "IWW", "IWX", "IWY", "IWZ", "IXC", "IXG", "IXJ", "IXN", "IXP", "IYC", "IYE",
-                    "IYF", "IYG", "IYH", "IYJ", "IYK", "IYM", "IYR", "IYT", "IYW", "IYY", "IYZ",
-                    "JCO", "JDST", "JEM", "JFT", "JGBB", "JGBD", "JGBL", "JGBS", "JGBT", "JJA",
-                    "JJAC", "JJC", "JJE", "JJG", "JJM", "JJN", "JJP", "JJS", "JJT", "JJU", "JKD",
-                    "JKE", "JKF", "JKG", "JKH", "JKI", "JKJ", "JKK", "JKL", "JNK", "JO", "JPNL",
-                    "JPNS", "JPP", "JPX", "JSC", "JUNR", "JVS", "JXI", "JYF", "JYN", "KBE",
-                    "KBWB", "KBWC", "KBWD", "KBWI", "KBWP", "KBWR", "KBWX", "KBWY", "KCE",
-                    "KFYP", "KIE", "KLD", "KME", "KNOW", "KOL", "KOLD", "KORU", "KORZ", "KRE",
-                    "KROO", "KRS", "KRU", "KWT", "KXI", "LAG", "LATM", "LBJ", "LBND", "LBTA",
-                    "LCPR", "LD", "LEDD", "LEMB", "LGEM", "LGLV", "LHB", "LIT", "LPAL", "LPLT",
-                    "LQD", "LSC", "LSKY", "LSO", "LSTK", "LTL", "LTPZ", "LVL", "LVOL", "LWC",
-                    "LWPE", "MATH", "MATL", "MATS", "MBB", "MBG", "MCHI", "MCRO", "MDD", "MDIV",
-                    "MDY", "MDYG", "MDYV", "MES", "MEXS", "MFLA", "MFSA", "MGC", "MGK", "MGV",
-                    "MIDU", "MIDZ", "MINC", "MINT", "MKH", "MLN", "MLPA", "MLPC", "MLPG", "MLPI",
-                    "MLPJ", "MLPL", "MLPN", "MLPS", "MLPW", "MLPX", "MLPY", "MMTM", "MNA",
-                    "MOAT", "MOM", "MONY", "MOO", "MORL", "MORT", "MRGR", "MSXX", "MTK", "MTUM",
-                    "MUAA", "MUAB", "MUAC", "MUAD", "MUAE", "MUAF", "MUB", "MUNI", "MVV", "MWJ",
-                    "MWN", "MXI", "MYY", "MZG", "MZN", "MZO", "MZZ", "NAGS", "NASH", "NASI",
-                    "NFO", "NFRA", "NGE", "NIB", "NINI", "NKY", "NLR", "NOBL", "NOMO", "NORW",
-                    "NUCL", "NY", "NYC", "NYF", "OEF", "OFF", "OGEM", "OIH", "OIL", "OILZ",
-                    "OLEM", "OLO", "ONEF", "ONEQ", "ONG", "ONN", "OOK", "OTP", "OTR", "PAF",
-                    "PAGG", "PALL", "PAO", "PBD", "PBE", "PBJ", "PBP", "PBS", "PBTQ", "PBW",
-                    "PCA", "PCEF", "PCY", "PDN", "PDP", "PEF", "PEJ", "PEK", "PERM", "PEX",
-                    "PEY", "PEZ", "PFA", "PFEM", "PFF", "PFI", "PFIG", "PFM", "PFXF", "PGAL",
-                    "PGD", "PGF", "PGHY", "PGJ", "PGM", "PGX", "PHB", "PHDG", "PHO", "PHYS",
-                    "PIC", "PICB", "PICK", "PID", "PIE", "PIN", "PIO", "PIQ", "PIV", "PIZ",
-                    "PJB", "PJF", "PJG", "PJM", "PJO", "PJP", "PKB", "PKN", "PKOL", "PKW", "PLK",
-                    "PLND", "PLTM", "PLW", "PMA", "PMNA", "PMR", "PMY", "PNQI", "PNXQ", "PPA",
-                    "PPH", "PPLT", "PQBW", "PQSC", "PQY", "PQZ", "PRB", "PRF", "PRFZ", "PRN",
-                    "PSAU", "PSCC", "PSCD", "PSCE", "PSCF", "PSCH", "PSCI", "PSCM", "PSCT",
-                    "PSCU", "PSI", "PSJ", "PSK", "PSL", "PSP", "PSQ", "PSR", "PST", "PSTL",
-                    "PTD", "PTE", "PTF", "PTH", "PTJ", "PTM", "PTO", "PTRP", "PUI", "PUW",
-                    "PVI", "PWB", "PWC", "PWJ", "PWND", "PWO", "PWP", "PWT", "PWV", "PWY",
-                    "PWZ", "PXE", "PXF", "PXH", "PXI", "PXJ", "PXN", "PXQ", "PXR", "PYH", "PYZ",
-                    "PZA", "PZD", "PZI", "PZJ", "PZT", "QABA", "QAI", "QCLN", "QDEF", "QDF",
-                    "QDYN", "QEH", "QGEM", "QID", "QLD", "QLT", "QLTA", "QLTB", "QLTC", "QMN",
-                    "QQEW", "QQQ", "QQQC", "QQQE", "QQQM", "QQQQ", "QQQV", "QQXT", "QTEC",
-                    "QUAL", "RALS", "RAVI", "RBL", "RCD", "RDIV", "REA", "REC", "REK", "REM",
-                    "REMX", "RETL", "RETS", "REW", "REZ", "RFF", "RFG", "RFL", "RFN", "RFV",
-                    "RGI", "RGRA", "RGRC", "RGRE", "RGRI", "RGRP", "RHM", "RHO", "RHS", "RIGS",
-                    "RINF", "RING", "RJA", "RJI", "RJN", "RJZ", "RKH", "RLY", "RMB", "RMM",
-                    "RMS", "ROB", "ROBO", "ROI", "ROLA", "ROM", "ROOF", "ROSA", "RPG", "RPQ",
-                    "RPV", "RPX", "RRF", "RRGR", "RRY", "RRZ", "RSP", "RSU", "RSUN", "RSW",
-                    "RSX", "RSXJ", "RTG", "RTH", "RTL", "RTLA", "RTM", "RTR", "RTSA", "RTW",
-                    "RUDR", "RUSL", "RUSS", "RVNU", "RWG", "RWJ", "RWK", "RWL", "RWM", "RWO",
-                    "RWR", "RWV", "RWW", "RWX", "RWXL", "RXD", "RXI", "RXL", "RYE", "RYF",
-                    "RYH", "RYJ", "RYT", "RYU", "RZG", "RZV", "SAA", "SAGG", "SBB", "SBM",
-                    "SBND", "SBV", "SCC", "SCEQ", "SCHA", "SCHB", "SCHC", "SCHD", "SCHE",
-                    "SCHF", "SCHG", "SCHH", "SCHM", "SCHO", "SCHP", "SCHR", "SCHV", "SCHX",
-                    "SCHZ", "SCIF", "SCIN", "SCJ", "SCLP", "SCO", "SCOG", "SCPB", "SCPR", "SCTR",
-                    "SCZ", "SDD", "SDK", "SDIV", "SDOG", "SDOW", "SDP", "SDS", "SDY", "SDYL",
-                    "SEA", "SEF", "SFK", "SFLA", "SFSA", "SGAR", "SGG", "SGGG", "SGOL", "SH",
-                    "SHBT", "SHM", "SHMO", "SHV", "SHVY", "SHY", "SHYG", "SICK", "SIJ", "SIL",
-                    "SILJ", "SINF", "SIVR", "SIZ", "SIZE", "SJB", "SJF", "SJH", "SJL", "SJNK",
-                    "SKF", "SKK", "SKOR", "SKYY", "SLBT", "SLQD", "SLV", "SLVO", "SLVP", "SLVY",
-                    "SLX", "SLY", "SLYG", "SLYV", "SMB", "SMDD", "SMDV", "SMH", "SMIN", "SMK",
-                    "SMLV", "SMMU", "SMN", "SNDS", "SNLN", "SOCL", "SOIL", "SOXL", "SOXS",
-                    "SPGH", "SPXU", "SPY", "SQQQ", "SRS", "SRTY", "SSG", "SSO", "STH", "STPZ",
-                    "SUB", "SWH", "SZK", "SZO", "SZR", "TAGS", "TAN", "TAO", "TBAR", "TBF",
-                    "TBT", "TBX", "TBZ", "TCHI", "TDD", "TDH", "TDIV", "TDN", "TDTF", "TDTS",
-                    "TDTT", "TDV", "TDX", "TECL", "TECS", "TENZ", "TEST", "TFI", "TGEM", "TGR",
-                    "THD", "THHY", "TILT", "TIP", "TIPX", "TIPZ", "TLH", "TLL", "TLO", "TLT",
-                    "TLTD", "TLTE", "TMF", "TMV", "TMW", "TNA", "TNDQ", "TOK", "TOTS", "TPS",
-                    "TQQQ", "TRND", "TRNM", "TRSK", "TRSY", "TRXT", "TSXV", "TTFS", "TTH", "TTT",
-                    "TUR", "TUZ", "TVIX", "TVIZ", "TWM", "TWOK", "TWOL", "TWON", "TWOZ", "TWQ",
-                    "TWTI", "TXF", "TYBS", "TYD", "TYH", "TYNS", "TYO", "TYP", "TZA", "TZD",
-                    "TZE", "TZG", "TZI", "TZL", "TZO", "TZV", "TZW", "TZY", "UAG", "UBC", "UBD",
-                    "UBG", "UBM", "UBN", "UBR", "UBT", "UCC", "UCD", "UCI", "UCO", "UDN", "UDNT",
-                    "UDOW", "UEM", "UGA", "UGAZ", "UGE", "UGEM", "UGL", "UGLD", "UHN", "UINF",
-                    "UJB", "UKF", "UKK", "UKW", "ULE", "ULQ", "ULST", "UMDD", "UMM", "UMX",
-                    "UNG", "UNL", "UOIL", "UOY", "UPRO", "UPV", "UPW", "URA", "URE", "URR",
-                    "URTH", "URTY", "USAG", "USCI", "USD", "USDU", "USL", "USLV", "USMI", "USMV",
-                    "USO", "UST", "USV", "USY", "UTH", "UTLT", "UUP", "UUPT", "UVG", "UVT",
-                    "UVU", "UVXY", "UWC", "UWM", "UWTI", "UXI", "UXJ", "UYG", "UYM", "VAW", "VB",
-                    "VBK", "VBR", "VCIT", "VCLT", "VCR", "VCSH", "VDC", "VDE", "VEA", "VEGA",
-                    "VEGI", "VEU", "VFH", "VGEM", "VGIT", "VGK", "VGLT", "VGSH", "VGT", "VHT",
-                    "VIDI", "VIG", "VIIX", "VIIZ", "VIOG", "VIOO", "VIOV", "VIS", "VIXH", "VIXM",
-                    "VIXY", "VLAT", "VLU", "VLUE", "VMBS", "VNM", "VNQ", "VNQI", "VO", "VOE",
-                    "VONE", "VONG", "VONV", "VOO", "VOOG", "VOOV", "VOT", "VOX", "VPL", "VPU",
-                    "VQT", "VRD", "VROM", "VSPR", "VSPY", "VSS", "VT", "VTHR", "VTI", "VTIP",
-                    "VTV", "VTWG", "VTWO", "VTWV", "VUG", "VV", "VWO", "VWOB", "VXAA", "VXBB",
-                    "VXCC", "VXDD", "VXEE", "VXF", "VXFF", "VXUS", "VXX", "VXZ", "VYM", "VZZ",
-                    "VZZB", "WCAT", "WDIV", "WDTI", "WEAT", "WEET", "WFVK", "WIP", "WITE",
-                    "WMCR", "WMH", "WMW", "WOOD", "WPS", "WREI", "WSTE", "WXSP", "XAR", "XBI",
-                    "XES", "XGC", "XHB", "XHE", "XHMO", "XHS", "XIV", "XLB", "XLBS", "XLBT",
-                    "XLE", "XLES", "XLF", "XLFS", "XLG", "XLI", "XLIS", "XLK", "XLKS", "XLP",
-                    "XLPS", "XLU", "XLUS", "XLV", "XLVO", "XLVS", "XLY", "XLYS", "XME", "XMLV",
-                    "XMPT", "XOIL", "XOP", "XOVR", "XPH", "XPP", "XRO", "XRT", "XRU", "XSD",
-                    "XSLV", "XSW", "XTL", "XTN", "XVIX", "XVZ", "XXV", "YANG", "YAO", "YCL",
-                    "YCS", "YDIV", "YINN", "YMLI", "YMLP", "YXI", "YYY", "ZIV", "ZROZ", "ZSL"
-                ], False #False indicates default was used
-            
-            # Split the input by commas and clean up each ticker
-            ticker_list = [ticker.strip().upper() for ticker in user_input.split(",")]
-            
-            # Validate each ticker
-            valid = True
-            for ticker in ticker_list:
-                # Check length (1 to 5 characters)
-                if not (1 <= len(ticker) <= 5):
-                    print(f"Error: Ticker '{ticker}' must be 1 to 5 letters long.")
-                    valid = False
-                    break
-                # Check if ticker contains only letters (no suffixes or special characters)
-                if not ticker.isalpha():
-                    print(f"Error: Ticker '{ticker}' must contain only letters (no suffixes like '.TO' or special characters).")
-                    valid = False
-                    break
-            
-            if valid:
-                return ticker_list, True  # True indicates user provided input
-            else:
-                print("Please try again.")
-
-    # Get the tickers (either from user input or default)
-    tickers, user_provided_input = get_tickers_from_input()
-    if user_provided_input:
-        print(f"Using tickers: {tickers}")
-
-    # Set date range
-    end_date = datetime.now().strftime('%Y-%m-%d')
-    stock_data = {}
-    raw_data = {}
-    start_dates = {}
-    earliest_date = None
-
-    # Prepare arguments for each ticker
-    ticker_args = [(ticker, "1900-01-01", end_date) for ticker in tickers]
-
-    # Use ProcessPoolExecutor to parallelize data downloading
-    with ProcessPoolExecutor(max_workers=mp.cpu_count()) as executor:
-        # Map the download function to all tickers
-        results = executor.map(download_ticker, ticker_args)
-
-        # Process results
-        for ticker, percentage_data, raw_price_data, start_date in results:
-            if percentage_data is not None:
-                stock_data[ticker] = percentage_data
-                raw_data[ticker] = raw_price_data
-                start_dates[ticker] = start_date
-                if earliest_date is None or start_date < earliest_date:
-                    earliest_date = start_date
-
-    if not stock_data:
-        print("No data available for any ticker.")
-        exit()
+# Original download engine: one process per CPU, one ticker per task. Only the baseline in
+# Benchmark.py: load_prices and every subcommand use fetch_prices, whose threads share the
+# scheduler's rate limit, retries and failed-ticker journal (worker processes would each
+# have their own). Instead of pickling each ticker's Series back, workers write into a
+# preallocated ticker-by-business-day float64 matrix in a memory-mapped temp file, and the
+# returned DataFrame is a view of it, so the float32 copy PriceMatrix.from_frame makes is
+# the only one. Weekday holidays stay in it as all-NaN rows, which every chart skips.
+def fetch_prices_per_process(tickers, start_date, end_date, cache=None, provider=None, max_workers=None):
+    if provider is None:
+        provider = cache.provider if cache is not None else YahooProvider()
+    cache_dir = str(cache.cache_dir) if cache is not None else None
+    first_day = np.busday_offset(np.datetime64(start_date, "D"), 0, roll="forward")
+    shape = (len(tickers), max(int(np.busday_count(first_day, np.datetime64(end_date, "D"))), 0))
+    if not tickers or not shape[1]:
+        return align_closes({})
 
-    # User input for chart option
+    # The file is sparse: only the rows a worker writes ever take up disk or memory
+    with tempfile.NamedTemporaryFile(prefix="closes_", suffix=".f64", delete=False) as f:
+        closes_path = f.name
+        f.truncate(shape[0] * shape[1] * 8)
+    try:
+        closes = np.memmap(closes_path, dtype=np.float64, mode="r+", shape=shape)
+        ticker_args = [(ticker, column, start_date, end_date) for column, ticker in enumerate(tickers)]
+        results = []
+        with worker_pool("download", max_workers or mp.cpu_count(), init_download_worker,
+                         (cache_dir, provider, closes_path, shape, str(first_day))) as executor:
+            for column, (ticker, status, first_row, rows, entry) in enumerate(
+                    executor.map(download_ticker, ticker_args)):
+                if status == "ok":
+                    results.append((ticker, column, first_row, rows))
+                    if cache is not None and entry is not None:
+                        cache.record_entry(ticker, entry["start"], entry["fetched_through"], entry["first_date"],
+                                           entry["last_date"], entry["rows"])
+    finally:
+        try:
+            os.remove(closes_path)  # the mapping stays valid; the file goes once it is unmapped
+        except OSError:
+            pass
+    if cache is not None:
+        cache.save_index()
+    if not results:
+        return align_closes({})
+
+    # Move the tickers that have data to the front rows in place, then NaN-fill each row
+    # outside its own bars within the span every ticker covers together
+    low = min(first_row for _, _, first_row, _ in results)
+    high = max(first_row + rows for _, _, first_row, rows in results)
+    for new_column, (ticker, old_column, first_row, rows) in enumerate(results):
+        if old_column != new_column:
+            closes[new_column, first_row:first_row + rows] = closes[old_column, first_row:first_row + rows]
+        closes[new_column, low:first_row] = np.nan
+        closes[new_column, first_row + rows:high] = np.nan
+    dates = pd.DatetimeIndex(np.busday_offset(first_day, np.arange(low, high)).astype("datetime64[ns]"))
+    return pd.DataFrame(closes[:len(results), low:high].T, index=dates,
+                        columns=[ticker for ticker, _, _, _ in results], copy=False)
+
+# --- Ticker input ---
+
+# Default ticker universe, used when no tickers are given. It lives in a data file (one ticker
+# per line, or any format MakeList.py writes) and is only read when it is actually needed.
+DEFAULT_TICKERS_FILE = Path(__file__).with_name("default_tickers.txt")
+
+def default_tickers():
+    return read_tickers_file(DEFAULT_TICKERS_FILE)
+
+# Validate one cleaned-up ticker (1-5 letters, no suffix); raises ValueError saying why not
+def validate_ticker(ticker):
+    # Check length (1 to 5 characters)
+    if not (1 <= len(ticker) <= 5):
+        raise ValueError(f"Ticker '{ticker}' must be 1 to 5 letters long.")
+    # Check if ticker contains only letters (no suffixes or special characters)
+    if not ticker.isalpha():
+        raise ValueError(f"Ticker '{ticker}' must contain only letters (no suffixes like '.TO' or special characters).")
+
+# Split comma-separated tickers and validate each one (1-5 letters, no suffix);
+# raises ValueError describing the first invalid ticker
+def parse_tickers(text):
+    # Split the input by commas and clean up each ticker
+    ticker_list = [ticker.strip().upper() for ticker in text.split(",")]
+    for ticker in ticker_list:
+        validate_ticker(ticker)
+    return ticker_list
+
+# Read tickers from a file written by MakeList.py (python literal, one per line, JSON or binary)
+# or a plain comma-separated list; blank lines are ignored. Generated lists can hold symbols
+# ChartMaker cannot chart (BRK.B, long names), so invalid ones are skipped with a warning
+# instead of rejecting the file; raises ValueError only if no valid ticker is left.
+def read_tickers_file(path):
+    tickers, skipped = [], []
+    for ticker in read_ticker_file(path):
+        ticker = ticker.strip().upper()
+        if not ticker:
+            continue
+        try:
+            validate_ticker(ticker)
+        except ValueError:
+            skipped.append(ticker)
+            continue
+        tickers.append(ticker)
+    if skipped:
+        examples = ", ".join(skipped[:5]) + (", ..." if len(skipped) > 5 else "")
+        print(f"Skipped {len(skipped)} invalid tickers in {path} (1-5 letters, no suffix): {examples}")
+        run_report.count("tickers_skipped", len(skipped))
+    if not tickers:
+        raise ValueError(f"No valid tickers in {path}.")
+    return tickers
+
+# Prompt for tickers with validation
+def get_tickers_from_input():
     while True:
-        print("\nChoose a charting option:")
-        print("1: Group by 5-year buckets from the earliest date")
-        print("2: Group by majority start dates (10+ tickers per date)")
-        print("3: Chart all tickers in one chart")
-        print("4: Chart tickers in partitions of 100 (with price or percentage option)")
-        option = input("Enter 1, 2, 3, or 4: ").strip()
-        
-        if option in ["1", "2", "3", "4"]:
-            break
-        else:
-            print("Invalid option selected. Please enter 1, 2, 3, or 4.")
-
-    if option == "1":
-        # Option 1: 5-year buckets
-        buckets = {}
-        for ticker, start_date in start_dates.items():
-            years_since_earliest = (start_date - earliest_date).days / 365.25
-            bucket = int(years_since_earliest // 5) * 5
-            if bucket not in buckets:
-                buckets[bucket] = []
-            buckets[bucket].append(ticker)
-
-        for bucket_start, ticker_list in sorted(buckets.items()):
-            bucket_end = bucket_start + 5
-            plt.figure(figsize=(16, 9), dpi=240)
-            for ticker in ticker_list:
-                plt.plot(stock_data[ticker].index, stock_data[ticker], label=ticker)
-            
-            plt.title(f"Percentage Increase (Start: {bucket_start}-{bucket_end} Years After {earliest_date.strftime('%Y-%m-%d')})")
-            plt.xlabel("Date")
-            plt.ylabel("Percentage Increase (%)")
-            plt.legend()
-            plt.grid(True)
-            plt.xticks(rotation=45)
-            
-            filename = f"chart_{bucket_start}_to_{bucket_end}_years.png"
-            plt.tight_layout()
-            plt.savefig(filename)
-            print(f"Saved chart: {filename}")
-            plt.close()
+        user_input = input("Input Tickers (comma-separated, 1-5 letters each, no suffix, or press Enter for default): ").strip()
 
-    elif option == "2":
-        # Option 2: Group by majority start dates (10+ tickers)
-        date_counts = Counter(start_dates.values())
-        majority_dates = [date for date, count in date_counts.items() if count >= 10]
-        majority_dates.sort()
+        # If the user presses Enter (empty input), return the default ticker list
+        if not user_input:
+            return default_tickers(), False #False indicates default was used
 
-        if not majority_dates:
-            print("No dates found with 10 or more tickers starting.")
-        else:
-            for i, start_date in enumerate(majority_dates):
-                ticker_list = [ticker for ticker, date in start_dates.items() if date == start_date]
-                plt.figure(figsize=(16, 9), dpi=240)
-                for ticker in ticker_list:
-                    plt.plot(stock_data[ticker].index, stock_data[ticker], label=ticker)
-                
-                plt.title(f"Percentage Increase (Start Date: {start_date.strftime('%Y-%m-%d')})")
-                plt.xlabel("Date")
-                plt.ylabel("Percentage Increase (%)")
-                plt.legend()
-                plt.grid(True)
-                plt.xticks(rotation=45)
-                
-                filename = f"chart_start_{start_date.strftime('%Y-%m-%d')}.png"
-                plt.tight_layout()
-                plt.savefig(filename)
-                print(f"Saved chart: {filename}")
-                plt.close()
-
-    elif option == "3":
-        # Option 3: All tickers in one chart
+        try:
+            return parse_tickers(user_input), True  # True indicates user provided input
+        except ValueError as e:
+            print(f"Error: {e}")
+            print("Please try again.")
+
+# --- Loading ---
+
+# Download (or read from the cache) every ticker and return the aligned PriceMatrix, or
+# None if no ticker had data. Downloads are rate-limited and retried by the scheduler,
+# and tickers that still fail are journaled (to `journal`) for a later resume.
+def load_prices(tickers, start_date="1900-01-01", end_date=None, cache_dir=CACHE_DIR, provider=None,
+                batch_size=BATCH_SIZE, max_workers=MAX_DOWNLOAD_WORKERS, journal=FAILED_JOURNAL):
+    end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+    scheduler = DownloadScheduler(provider if provider is not None else YahooProvider())
+    cache = PriceCache(cache_dir, scheduler) if cache_dir else None
+    with run_report.span("download"):
+        prices = fetch_prices(tickers, start_date, end_date, cache=cache, provider=scheduler,
+                              batch_size=batch_size, max_workers=max_workers)
+    scheduler.save_journal(journal, tickers, start_date, end_date)
+    run_report.count("tickers_failed", len(scheduler.failed))
+
+    # One aligned float32 matrix holds every ticker; metric views (percentages etc.) are
+    # derived from it in one vectorized pass, only when a chart option asks for them
+    with run_report.span("matrix"):
+        matrix = PriceMatrix.from_frame(prices)
+    if not matrix.tickers:
+        print("No data available for any ticker.")
+        return None
+    if cache_dir:
+        matrix.stats_path = os.path.join(cache_dir, STATS_FILE)
+    return matrix
+
+# --- Sharding ---
+
+# Shard of one ticker out of `shards`: crc32 is stable across processes and machines, unlike
+# hash(), so every host computes the same split of the same list
+def ticker_shard(ticker, shards):
+    return zlib.crc32(ticker.encode("ascii")) % shards
+
+# Tickers of one shard, in universe order
+def shard_tickers(tickers, shard, shards):
+    return [ticker for ticker in tickers if ticker_shard(ticker, shards) == shard]
+
+# Short digest of the whole ticker list, so merge can refuse shards cut from different lists
+def universe_digest(tickers):
+    return hashlib.blake2b("\n".join(tickers).encode("ascii"), digest_size=8).hexdigest()
+
+# Base path of one shard's files: <shard_dir>/shard_<i>_of_<n> (.parquet, .json, .failed.json)
+def shard_path(shard_dir, shard, shards):
+    return os.path.join(shard_dir, f"shard_{shard}_of_{shards}")
+
+# Write one shard: its aligned closes as a date-by-ticker float32 Parquet file, then a JSON
+# description (shard number, date range, each column's position in the full ticker list).
+# The JSON is written last, so merge only ever sees shards whose data is complete.
+@run_report.span("write:shard")
+def write_shard(matrix, universe, shard, shards, start_date, end_date, shard_dir=SHARD_DIR):
+    os.makedirs(shard_dir, exist_ok=True)
+    base = shard_path(shard_dir, shard, shards)
+    if matrix is None:
+        frame = pd.DataFrame(index=pd.DatetimeIndex([], name="Date"), dtype=np.float32)
+        columns = []
+    else:
+        frame = pd.DataFrame(matrix.values, index=matrix.dates, columns=matrix.tickers, copy=False)
+        columns = matrix.tickers
+    position = {ticker: i for i, ticker in enumerate(universe)}
+    info = {"version": SHARD_VERSION, "shard": shard, "shards": shards, "start_date": start_date,
+            "end_date": end_date, "universe": universe_digest(universe), "universe_size": len(universe),
+            "tickers": shard_tickers(universe, shard, shards), "columns": columns,
+            "positions": [position[ticker] for ticker in columns]}
+    # Each file goes through a temp file so a killed shard never leaves a truncated one
+    temp_path = f"{base}.{os.getpid()}.tmp"
+    frame.to_parquet(temp_path)
+    os.replace(temp_path, f"{base}.parquet")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=1)
+    os.replace(temp_path, f"{base}.json")
+    run_report.count("bytes_written", os.path.getsize(f"{base}.parquet") + os.path.getsize(f"{base}.json"))
+    print(f"Saved shard {shard} of {shards}: {len(columns)} of {len(info['tickers'])} tickers with data ({base}.parquet)")
+
+# Descriptions of every shard in shard_dir, checked to form one complete set: the same shard
+# count and ticker list, and every shard present. Returns a list sorted by shard, or None.
+def read_shard_set(shard_dir=SHARD_DIR):
+    infos = []
+    for path in sorted(Path(shard_dir).glob("shard_*_of_*.json")):
+        if path.name.endswith(".failed.json"):
+            continue
+        try:
+            info = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"Error reading shard {path}: {e}")
+            return None
+        if info.get("version") != SHARD_VERSION:
+            print(f"Shard {path} was written by a different version; rerun it.")
+            return None
+        infos.append(info)
+    if not infos:
+        print(f"No shards found in {shard_dir}.")
+        return None
+
+    sets = {(info["shards"], info["universe"]) for info in infos}
+    if len(sets) > 1:
+        print(f"Shards in {shard_dir} come from different runs (shard counts or ticker lists differ); "
+              f"clear the directory and rerun every shard.")
+        return None
+    shards = infos[0]["shards"]
+    missing = sorted(set(range(shards)) - {info["shard"] for info in infos})
+    if missing:
+        print(f"Missing {len(missing)} of {shards} shards: {', '.join(map(str, missing))}")
+        return None
+    if len({(info["start_date"], info["end_date"]) for info in infos}) > 1:
+        print("Warning: shards were downloaded over different date ranges.")
+    return sorted(infos, key=lambda info: info["shard"])
+
+# Reassemble every shard in shard_dir into one PriceMatrix on the union of their dates, with
+# the tickers back in the order of the full list, so grouping and partitions match a single
+# process run. Returns None if the shard set is incomplete or has no data.
+@run_report.span("merge")
+def merge_shards(shard_dir=SHARD_DIR):
+    infos = read_shard_set(shard_dir)
+    if infos is None:
+        return None
+    frames = [pd.read_parquet(f"{shard_path(shard_dir, info['shard'], info['shards'])}.parquet")
+              for info in infos]
+    tickers = [ticker for info in infos for ticker in info["columns"]]
+    if not tickers:
+        print("No data available for any ticker.")
+        return None
+
+    dates = frames[0].index
+    for frame in frames[1:]:
+        if not frame.index.equals(dates):
+            dates = dates.union(frame.index)
+    # Final column of each shard column: its rank among all positions in the full list
+    order = np.argsort([position for info in infos for position in info["positions"]], kind="stable")
+    columns = np.empty(len(order), dtype=np.intp)
+    columns[order] = np.arange(len(order))
+    values = np.full((len(dates), len(tickers)), np.nan, dtype=np.float32)
+    offset = 0
+    for frame in frames:
+        width = frame.shape[1]
+        if width:
+            values[np.ix_(dates.get_indexer(frame.index), columns[offset:offset + width])] = frame.to_numpy(np.float32)
+        offset += width
+
+    requested = sum(len(info["tickers"]) for info in infos)
+    print(f"Merged {len(infos)} shards: {len(tickers)} of {requested} tickers with data.")
+    matrix = PriceMatrix(dates, [tickers[i] for i in order], values)
+    matrix.stats_path = os.path.join(shard_dir, STATS_FILE)
+    return matrix
+
+# --- Chart options ---
+
+# Axis title, chart title, hover label and file suffix of each metric in the Plotly charts
+METRIC_LABELS = {
+    "price": ("Price (USD)", "Stock Prices Over Time", "Price: %{y:.2f} USD", "prices"),
+    "percent": ("Percentage Increase (%)", "Percentage Increase Over Time", "Percentage: %{y:.2f}%", "percentage"),
+    "log": ("Log Return", "Log Return Over Time", "Log return: %{y:.4f}", "log"),
+    "rebased": ("Rebased Price (Start = 100)", "Rebased Prices Over Time", "Rebased: %{y:.2f}", "rebased"),
+}
+
+# Export settings for the Plotly charts: bundle ("shared", "inline" or "cdn"), webgl
+# (True, False or None to decide by point count) and image_format (e.g. "png" or None)
+def export_settings(bundle=PLOTLY_BUNDLE, webgl=None, image_format=None):
+    return {"bundle": bundle, "webgl": webgl, "image_format": image_format}
+
+def plotly_spec(matrix, tickers, title, metric, hovermode, path, export=None, downsample_mode=DOWNSAMPLE_MODE):
+    spec = {"title": title, "metric": metric, "hovermode": hovermode, "path": path,
+            "columns": [(ticker, matrix.column[ticker]) for ticker in tickers],
+            "downsample": downsample_mode}
+    spec.update(export or export_settings())
+    return spec
+
+# Open each Plotly chart in the browser, or in headless mode export them all as files
+def show_or_export(matrix, values, specs, headless=False, incremental=False):
+    if headless:
+        export_plotly_charts(matrix, values, specs, incremental=incremental)
+        return
+    arrays = {"dates": matrix.dates.asi8, "values": values, "valid": matrix.valid}
+    for spec in specs:
+        with run_report.span("show"):
+            build_plotly_figure(arrays, spec).show()
+
+# Grouping settings for options 1 and 2: bucket width (e.g. "5Y", "6M"), alignment
+# ("earliest" start date or "calendar"), minimum tickers per bucket and minimum tickers
+# sharing a start date
+def grouping_settings(width=BUCKET_WIDTH, align=BUCKET_ALIGN, min_bucket=MIN_BUCKET_TICKERS,
+                      min_shared=MIN_SHARED_START):
+    return {"width": width, "align": align, "min_bucket": min_bucket, "min_shared": min_shared}
+
+# Ranking settings for options 4 and 6: the TickerStats field to order by (None keeps option 4
+# in matrix order; option 6 then ranks by RANK_BY), tickers per option 6 chart, and the
+# fewest years of history a ticker needs to be charted
+def ranking_settings(by=None, top=RANK_TOP, min_years=0.0):
+    return {"by": by, "top": top, "min_years": min_years}
+
+# Group tickers into start-date buckets; returns [(key, [tickers]), ...] sorted by key
+def bucket_groups(matrix, grouping=None):
+    grouping = grouping or grouping_settings()
+    return matrix.start_index().buckets(grouping["width"], grouping["align"], grouping["min_bucket"])
+
+# Group tickers by shared start dates; returns [(start_date, [tickers]), ...] sorted by date
+def majority_date_groups(matrix, grouping=None):
+    grouping = grouping or grouping_settings()
+    return matrix.start_index().shared_dates(grouping["min_shared"])
+
+# Title part and filename part of one bucket, e.g. ("0-5 Years After 1962-01-02", "0_to_5_years")
+def bucket_label(index, key, grouping):
+    number, unit = parse_bucket_width(grouping["width"])
+    if grouping["align"] == "earliest":
+        units = BUCKET_UNIT_NAMES[unit]
+        return (f"{key}-{key + number} {units} After {index.earliest.strftime('%Y-%m-%d')}",
+                f"{key}_to_{key + number}_{units.lower()}")
+    start, end = index.bucket_dates(key, grouping["width"])
+    date_format = {"Y": "%Y", "Q": "%Y-%m", "M": "%Y-%m"}.get(unit, "%Y-%m-%d")
+    first = start.strftime(date_format)
+    last = (end - pd.Timedelta(days=1)).strftime(date_format)
+    if first == last:
+        return first, first
+    return f"{first} to {last}", f"{first}_to_{last}"
+
+# Charts of each option as (file name without extension, title, tickers), shared by the
+# chart options below and the chart service
+
+# Option 1 charts, one per start-date bucket
+def bucket_charts(matrix, grouping=None):
+    grouping = grouping or grouping_settings()
+    with run_report.span("group:buckets"):
+        buckets = bucket_groups(matrix, grouping)
+    charts = []
+    for key, ticker_list in buckets:
+        title_part, file_part = bucket_label(matrix.start_index(), key, grouping)
+        charts.append((f"chart_{file_part}", f"Percentage Increase (Start: {title_part})", ticker_list))
+    return charts
+
+# Option 2 charts, one per start date shared by min_shared or more tickers
+def majority_date_charts(matrix, grouping=None):
+    grouping = grouping or grouping_settings()
+    with run_report.span("group:majority_dates"):
+        groups = majority_date_groups(matrix, grouping)
+    return [(f"chart_start_{start_date.strftime('%Y-%m-%d')}",
+             f"Percentage Increase (Start Date: {start_date.strftime('%Y-%m-%d')})", ticker_list)
+            for start_date, ticker_list in groups]
+
+# Tickers for option 4: in matrix order, or best first by ranking["by"], without those
+# with less than ranking["min_years"] of history
+def ranked_tickers(matrix, ranking=None):
+    ranking = ranking or ranking_settings()
+    if ranking["by"] is None and not ranking["min_years"]:
+        return matrix.tickers
+    stats = ticker_stats(matrix)
+    if ranking["by"] is None:
+        keep = stats.years() >= ranking["min_years"]
+        return [ticker for ticker, kept in zip(stats.tickers, keep) if kept]
+    return stats.ranked(ranking["by"], ranking["min_years"])
+
+# Option 4 charts, one per batch_size tickers in matrix order (or ranked, see ranked_tickers)
+def partition_charts(matrix, metric="percent", batch_size=100, ranking=None):
+    ranking = ranking or ranking_settings()
+    _, title, _, suffix = METRIC_LABELS[metric]
+    ticker_list = ranked_tickers(matrix, ranking)
+    by = ranking["by"]
+    if by is not None:
+        suffix = f"{suffix}_by_{by}"
+    charts = []
+    for i in range(0, len(ticker_list), batch_size):
+        batch_tickers = ticker_list[i:i + batch_size]
+        order = f" by {TickerStats.RANKINGS[by]}" if by is not None else ""
+        charts.append((f"partition_{i // batch_size + 1}_{suffix}",
+                       f"{title} (Tickers {i+1} to {i+len(batch_tickers)}{order})", batch_tickers))
+    return charts
+
+# Option 6 charts: the top and the bottom `top` tickers by one statistic (one chart if
+# there are no more than `top` ranked tickers), best and worst first
+def ranked_charts(matrix, ranking=None):
+    ranking = ranking or ranking_settings()
+    by = ranking["by"] or RANK_BY
+    top = ranking["top"]
+    with run_report.span("group:ranked"):
+        ordered = ticker_stats(matrix).ranked(by, ranking["min_years"])
+    history = f", {ranking['min_years']:g}+ Years of History" if ranking["min_years"] else ""
+    label = TickerStats.RANKINGS[by]
+    charts = []
+    if ordered:
+        charts.append((f"chart_top_{top}_{by}",
+                       f"Percentage Increase (Top {min(top, len(ordered))} by {label}{history})", ordered[:top]))
+    if len(ordered) > top:
+        charts.append((f"chart_bottom_{top}_{by}",
+                       f"Percentage Increase (Bottom {top} by {label}{history})", ordered[::-1][:top]))
+    return charts
+
+# Option 1: group by start-date buckets (5 years from the earliest start date by default)
+@run_report.span("option1")
+def chart_buckets(matrix, out_dir=".", grouping=None, incremental=False):
+    percentages = matrix.view("percent")
+    jobs = [(os.path.join(out_dir, f"{name}.png"), title, ticker_list)
+            for name, title, ticker_list in bucket_charts(matrix, grouping)]
+    render_group_charts(matrix, percentages, jobs, "Percentage Increase (%)", incremental=incremental)
+
+# Option 2: group by start dates shared by 10+ tickers (min_shared)
+@run_report.span("option2")
+def chart_majority_dates(matrix, out_dir=".", grouping=None, incremental=False):
+    grouping = grouping or grouping_settings()
+    percentages = matrix.view("percent")
+    charts = majority_date_charts(matrix, grouping)
+    if not charts:
+        print(f"No dates found with {grouping['min_shared']} or more tickers starting.")
+        return
+
+    jobs = [(os.path.join(out_dir, f"{name}.png"), title, ticker_list) for name, title, ticker_list in charts]
+    render_group_charts(matrix, percentages, jobs, "Percentage Increase (%)", incremental=incremental)
+
+# Option 3: all tickers in one chart (percentage PNG plus an interactive price chart)
+@run_report.span("option3")
+def chart_all(matrix, out_dir=".", headless=False, export=None, downsample_mode=DOWNSAMPLE_MODE, incremental=False):
+    percentages = matrix.view("percent")
+    filename = os.path.join(out_dir, "chart_all_tickers_percentage.png")
+    key = chart_key(matrix, matrix.tickers, {"chart": "all", "downsample": downsample_mode}) if incremental else None
+    stale, manifests = stale_jobs([(filename, key, filename)], incremental)
+    if stale:
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(16, 9), dpi=480)
-        for ticker in stock_data:
-            plt.plot(stock_data[ticker].index, stock_data[ticker], label=ticker)
-        
+        for ticker in matrix.tickers:
+            plt.plot(*downsample(*matrix.series(ticker, percentages), 16 * 480, downsample_mode), label=ticker)
+
         plt.title("Percentage Increase - All Tickers")
         plt.xlabel("Date")
         plt.ylabel("Percentage Increase (%)")
         plt.legend()
         plt.grid(True)
         plt.xticks(rotation=45)
-        
-        filename = "chart_all_tickers_percentage.png"
-        plt.tight_layout()
-        plt.savefig(filename)
+
+        with run_report.span("render:png"):
+            plt.tight_layout()
+            plt.savefig(filename)
+        run_report.count("charts_png")
         print(f"Saved chart: {filename}")
         plt.close()
+        record_chart(manifests, filename, key)
+        for manifest in manifests.values():
+            manifest.save()
+
+    # Interactive Plotly chart for raw prices
+    spec = plotly_spec(matrix, matrix.tickers, "Stock Prices Over Time", "price", "x unified",
+                       os.path.join(out_dir, "chart_all_tickers_prices.html"), export, downsample_mode)
+    show_or_export(matrix, matrix.values, [spec], headless, incremental)
+
+# Option 4: chart tickers in partitions of 100 with the chosen metric on the y-axis
+@run_report.span("option4")
+def chart_partitions(matrix, metric="percent", out_dir=".", headless=False, batch_size=100, export=None,
+                     ranking=None, downsample_mode=DOWNSAMPLE_MODE, incremental=False):
+    values = matrix.view(metric)
+    specs = [plotly_spec(matrix, batch_tickers, title, metric, "closest", os.path.join(out_dir, f"{name}.html"),
+                         export, downsample_mode)
+             for name, title, batch_tickers in partition_charts(matrix, metric, batch_size, ranking)]
+    show_or_export(matrix, values, specs, headless, incremental)
+
+# Title, percentile bands and highlighted series of the universe chart for one metric
+def universe_chart(matrix, metric="percent", highlight=(), downsample_mode=DOWNSAMPLE_MODE):
+    bands = matrix.percentiles(metric)
+    values = matrix.view(metric)
+    highlights = [(ticker, *downsample(*matrix.series(ticker, values), 16 * 240, downsample_mode))
+                  for ticker in highlight]
+    title = f"{METRIC_LABELS[metric][1]} - Universe of {len(matrix.tickers)} Tickers"
+    return title, bands, highlights
+
+# Option 5: percentile bands of the chosen metric across every ticker, one vectorized pass
+# over the matrix instead of one line per ticker, with optional highlighted tickers
+@run_report.span("option5")
+def chart_universe(matrix, metric="percent", out_dir=".", highlight=(), downsample_mode=DOWNSAMPLE_MODE,
+                   incremental=False):
+    unknown = [ticker for ticker in highlight if ticker not in matrix.column]
+    if unknown:
+        print(f"Not highlighting tickers without data: {', '.join(unknown)}")
+    highlight = [ticker for ticker in highlight if ticker in matrix.column]
+    filename = os.path.join(out_dir, f"chart_universe_{METRIC_LABELS[metric][3]}.png")
+    params = {"chart": "universe", "metric": metric, "percentiles": ENVELOPE_PERCENTILES,
+              "min_count": ENVELOPE_MIN_TICKERS, "highlight": highlight, "downsample": downsample_mode}
+    key = chart_key(matrix, matrix.tickers, params) if incremental else None
+    stale, manifests = stale_jobs([(filename, key, filename)], incremental)
+    if not stale:
+        return
+    title, bands, highlights = universe_chart(matrix, metric, highlight, downsample_mode)
+    with run_report.span("render:png"):
+        fig = draw_envelope_chart(matrix.dates, ENVELOPE_PERCENTILES, bands, title, METRIC_LABELS[metric][0],
+                                  240, highlights)
+        fig.savefig(filename)
+    run_report.count("charts_png")
+    print(f"Saved chart: {filename}")
+    record_chart(manifests, filename, key)
+    for manifest in manifests.values():
+        manifest.save()
+
+# Option 6: the best and worst tickers by one statistic from the ticker statistics index
+@run_report.span("option6")
+def chart_ranked(matrix, out_dir=".", ranking=None, incremental=False):
+    percentages = matrix.view("percent")
+    charts = ranked_charts(matrix, ranking)
+    if not charts:
+        print("No tickers with enough history to rank.")
+        return
+    jobs = [(os.path.join(out_dir, f"{name}.png"), title, ticker_list) for name, title, ticker_list in charts]
+    render_group_charts(matrix, percentages, jobs, "Percentage Increase (%)", incremental=incremental)
+
+# Run each requested chart option ("1"-"6") against the same downloaded matrix, drawn from
+# `resample` bars (see RESAMPLE_MODE) and with options 3-5 downsampled by `downsample`
+# (see DOWNSAMPLE_MODE), skipping unchanged charts when `incremental` (see INCREMENTAL)
+def run_charts(matrix, options, metric="percent", out_dir=".", headless=False, export=None, grouping=None,
+               highlight=(), ranking=None, resample=RESAMPLE_MODE, downsample=DOWNSAMPLE_MODE,
+               incremental=INCREMENTAL):
+    os.makedirs(out_dir, exist_ok=True)
+    # Resample once up front; every option then groups and draws from the same bars and
+    # reuses the metric views built on them
+    bars = resample_bars(matrix.dates, resample)
+    if bars != "daily":
+        daily_rows = len(matrix.dates)
+        matrix = matrix.resample(bars)
+        print(f"Drawing {bars} bars: {len(matrix.dates):,} rows instead of {daily_rows:,} daily rows.")
+    # Options 1, 2 and 6 render PNGs and headless options 3-4 export HTML in worker pools, which
+    # fork from one server; have it import the libraries of every pool this run will use
+    kinds = []
+    if {"1", "2", "6"} & set(options):
+        kinds.append("render")
+    if headless and {"3", "4"} & set(options):
+        kinds.append("export")
+    preload_workers(kinds)
+    for option in options:
+        if option == "1":
+            chart_buckets(matrix, out_dir, grouping, incremental)
+        elif option == "2":
+            chart_majority_dates(matrix, out_dir, grouping, incremental)
+        elif option == "3":
+            chart_all(matrix, out_dir, headless, export, downsample, incremental)
+        elif option == "4":
+            chart_partitions(matrix, metric, out_dir, headless, export=export, ranking=ranking,
+                             downsample_mode=downsample, incremental=incremental)
+        elif option == "5":
+            chart_universe(matrix, metric, out_dir, highlight, downsample, incremental)
+        elif option == "6":
+            chart_ranked(matrix, out_dir, ranking, incremental)
+    print("Chart generation complete.")
+
+# --- Chart service ---
+
+# Rendered responses keyed by request, least recently used evicted once they exceed
+# max_bytes. Entries are futures, so concurrent requests for a chart that is still
+# rendering wait for that one render instead of starting their own.
+class RenderCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
 
-        # Interactive Plotly chart for raw prices
-        fig = go.Figure()
-        for ticker in raw_data:
-            fig.add_trace(go.Scatter(
-                x=raw_data[ticker].index,
-                y=raw_data[ticker],
-                name=ticker,
-                mode='lines',
-                hovertemplate=f"{ticker}<br>Date: %{{x}}<br>Price: %{{y:.2f}} USD"
-            ))
-
-        fig.update_layout(
-            title="Stock Prices Over Time",
-            xaxis_title="Date",
-            yaxis_title="Price (USD)",
-            legend_title="Tickers",
-            hovermode="x unified",
-            template="plotly_white",
-            width=2560,
-            height=1440
-        )
-
-        fig.show()
-
-    elif option == "4":
-        # Option 4: Chart tickers in partitions of 100 with price or percentage option
+    # (future of (content type, body), hit) for key, submitting render to executor on a miss
+    def get(self, key, render, executor):
+        with self._lock:
+            future = self.entries.get(key)
+            if future is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return future, True
+            self.misses += 1
+            future = executor.submit(render)
+            self.entries[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future, False
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self.entries.get(key) is not future:
+                return
+            if future.exception() is not None:
+                del self.entries[key]
+                return
+            self.sizes[key] = len(future.result()[1])
+            self.bytes += self.sizes[key]
+            for old_key in list(self.entries):
+                if self.bytes <= self.max_bytes or old_key == key:
+                    break
+                if old_key in self.sizes:
+                    del self.entries[old_key]
+                    self.bytes -= self.sizes.pop(old_key)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+# One query parameter, or default; raises ValueError if it does not convert
+def query_value(query, name, default=None, convert=str):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return convert(values[-1])
+    except ValueError:
+        raise ValueError(f"Invalid value for {name}: {values[-1]!r}")
+
+# Warm chart service over one loaded PriceMatrix. Every request is answered from the
+# matrix in memory: grouping uses the cached start-date index, metric views are built once,
+# and each rendered chart is kept in a RenderCache, so only the first request for a chart
+# pays for drawing it. Rendering runs on a bounded thread pool.
+#
+#   GET /                          ticker count, date range and the endpoints below
+#   GET /groups?option=1|2|4|5     charts of an option: [{name, title, tickers, png, html}]
+#   GET /chart.png?option=1&group=0  (also option=2&group=N, option=4&group=N, option=3,
+#   GET /chart.html?...              or tickers=A,B,C); metric, dpi, size and the grouping
+#                                    settings width, align, min_bucket, min_shared apply
+#   GET /chart.png?option=5        universe percentile bands; metric, dpi, highlight=A,B
+#   GET /groups?option=6&by=cagr   top and bottom charts by a statistic; top, min_years apply
+#                                  (by and min_years also order and filter option 4)
+#   GET /stats?by=cagr&top=20      ranked ticker statistics (bottom=1 for the lowest first)
+#   GET /plotly-<version>.min.js   the plotly.js bundle the HTML charts reference
+#   GET /status                    cache hits, misses and size
+class ChartService:
+    def __init__(self, matrix, threads=SERVE_THREADS, cache_mb=SERVE_CACHE_MB, downsample_mode=DOWNSAMPLE_MODE):
+        self.matrix = matrix
+        self.downsample_mode = downsample_mode
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="render")
+        self.cache = RenderCache(cache_mb * 2**20)
+        self.groupings = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Build what nearly every request needs before the first one arrives
+    def warm(self):
+        with run_report.span("serve:warm"):
+            self.matrix.view("percent")
+            self.matrix.start_index()
+            ticker_stats(self.matrix)
+            for module in WORKER_MODULES["render"] + WORKER_MODULES["export"]:
+                importlib.import_module(module)
+
+    def arrays(self, metric):
+        return {"dates": self.matrix.dates.asi8, "values": self.matrix.view(metric), "valid": self.matrix.valid}
+
+    # Charts of one option as (name, title, tickers), like the files the chart command writes.
+    # Each option's grouping is built once per distinct settings and reused by /groups and
+    # every chart request with those settings, render cache hit or not.
+    def charts(self, query):
+        option = query_value(query, "option", "1")
+        grouping = grouping_settings(query_value(query, "width", BUCKET_WIDTH),
+                                     query_value(query, "align", BUCKET_ALIGN),
+                                     query_value(query, "min_bucket", MIN_BUCKET_TICKERS, int),
+                                     query_value(query, "min_shared", MIN_SHARED_START, int))
+        if grouping["align"] not in ("earliest", "calendar"):
+            raise ValueError(f"Invalid value for align: {grouping['align']!r}")
+        parse_bucket_width(grouping["width"])
+        if option == "1":
+            return self.grouped((option, *grouping.items()), lambda: bucket_charts(self.matrix, grouping))
+        if option == "2":
+            return self.grouped((option, *grouping.items()), lambda: majority_date_charts(self.matrix, grouping))
+        if option == "3":
+            return [("chart_all_tickers", "Percentage Increase - All Tickers", self.matrix.tickers)]
+        if option == "4":
+            metric, size, ranking = self.metric(query, "percent"), query_value(query, "size", 100, int), self.ranking(query)
+            return self.grouped((option, metric, size, *ranking.items()),
+                                lambda: partition_charts(self.matrix, metric, size, ranking))
+        if option == "6":
+            ranking = self.ranking(query)
+            return self.grouped((option, *ranking.items()), lambda: ranked_charts(self.matrix, ranking))
+        if option == "5":
+            metric = self.metric(query, "percent")
+            return [(f"chart_universe_{METRIC_LABELS[metric][3]}",
+                     f"{METRIC_LABELS[metric][1]} - Universe of {len(self.matrix.tickers)} Tickers",
+                     self.matrix.tickers)]
+        raise ValueError(f"Invalid value for option: {option!r}")
+
+    # Charts for `key` from the grouping cache, built with build() on a miss; the least
+    # recently used settings are dropped past SERVE_GROUPINGS
+    def grouped(self, key, build):
+        with self._lock:
+            if key in self.groupings:
+                self.groupings.move_to_end(key)
+                return self.groupings[key]
+        charts = build()
+        with self._lock:
+            self.groupings[key] = charts
+            while len(self.groupings) > SERVE_GROUPINGS:
+                self.groupings.popitem(last=False)
+        return charts
+
+    def ranking(self, query):
+        ranking = ranking_settings(query_value(query, "by"), query_value(query, "top", RANK_TOP, int),
+                                   query_value(query, "min_years", 0.0, float))
+        if ranking["by"] is not None and ranking["by"] not in TickerStats.RANKINGS:
+            raise ValueError(f"Invalid value for by: {ranking['by']!r}, expected one of "
+                             f"{', '.join(TickerStats.RANKINGS)}")
+        if ranking["top"] < 1:
+            raise ValueError("top must be at least 1")
+        return ranking
+
+    # Ranked rows of the ticker statistics index, highest first (lowest first with bottom=1)
+    def stats(self, query):
+        ranking = self.ranking(query)
+        with run_report.span("serve:stats"):
+            stats = ticker_stats(self.matrix)
+            ordered = stats.ranked(ranking["by"] or RANK_BY, ranking["min_years"])
+            if query_value(query, "bottom", 0, int):
+                ordered = ordered[::-1]
+            return {"by": ranking["by"] or RANK_BY, "ranked": len(ordered), "tickers": len(stats),
+                    "rows": stats.rows(ordered[:ranking["top"]])}
+
+    def metric(self, query, default):
+        metric = query_value(query, "metric", default)
+        if metric not in PriceMatrix.METRICS:
+            raise ValueError(f"Invalid value for metric: {metric!r}, expected one of {', '.join(PriceMatrix.METRICS)}")
+        return metric
+
+    # (title, tickers, metric) of the chart a request asks for; options 1, 2 and 6 always show
+    # percentage increase, option 3 as HTML shows prices like the chart command
+    def select(self, query, html):
+        if "tickers" in query:
+            tickers = parse_tickers(query_value(query, "tickers"))
+            unknown = [ticker for ticker in tickers if ticker not in self.matrix.column]
+            if unknown:
+                raise LookupError(f"Not loaded: {', '.join(unknown)}")
+            metric = self.metric(query, "percent")
+            return f"{METRIC_LABELS[metric][1]} ({', '.join(tickers)})", tickers, metric
+        option = query_value(query, "option", "1")
+        charts = self.charts(query)
+        if option == "3" and html:
+            return "Stock Prices Over Time", self.matrix.tickers, self.metric(query, "price")
+        group = query_value(query, "group", 0, int)
+        if not 0 <= group < len(charts):
+            raise LookupError(f"Option {option} has {len(charts)} charts, no group {group}")
+        _, title, tickers = charts[group]
+        return title, tickers, self.metric(query, "percent") if option == "4" else "percent"
+
+    def render_png(self, title, tickers, metric, dpi):
+        with run_report.span("serve:png"):
+            columns = [(ticker, self.matrix.column[ticker]) for ticker in tickers]
+            # Downsampled like chart_all, so option 3 (every ticker) stays cheap to draw
+            fig = draw_group_chart(self.arrays(metric), title, METRIC_LABELS[metric][0], dpi, columns,
+                                   self.downsample_mode)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png")
+        return "image/png", buffer.getvalue()
+
+    def render_universe(self, metric, highlight, dpi):
+        with run_report.span("serve:png"):
+            title, bands, highlights = universe_chart(self.matrix, metric, highlight, self.downsample_mode)
+            fig = draw_envelope_chart(self.matrix.dates, ENVELOPE_PERCENTILES, bands, title,
+                                      METRIC_LABELS[metric][0], dpi, highlights)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png")
+        return "image/png", buffer.getvalue()
+
+    def render_html(self, title, tickers, metric, hovermode):
+        with run_report.span("serve:html"):
+            spec = plotly_spec(self.matrix, tickers, title, metric, hovermode, None, export_settings(),
+                               self.downsample_mode)
+            html = build_plotly_figure(self.arrays(metric), spec).to_html(include_plotlyjs=plotly_js_file())
+        return "text/html; charset=utf-8", html.encode("utf-8")
+
+    def dpi(self, query):
+        dpi = query_value(query, "dpi", 240, int)
+        if not 50 <= dpi <= 480:
+            raise ValueError("dpi must be between 50 and 480")
+        return dpi
+
+    # Charts of the option a request asks for, with the URLs that render each one
+    def groups(self, query):
+        from urllib.parse import urlencode
+        params = {name: values[-1] for name, values in sorted(query.items()) if name != "group"}
+        groups = []
+        for i, (name, title, tickers) in enumerate(self.charts(query)):
+            chart_params = urlencode(params if params.get("option") in ("3", "5") else {**params, "group": i})
+            groups.append({"name": name, "title": title, "tickers": tickers, "png": f"/chart.png?{chart_params}",
+                           "html": None if params.get("option") == "5" else f"/chart.html?{chart_params}"})
+        return groups
+
+    def index(self):
+        return {"tickers": len(self.matrix.tickers),
+                "first_date": self.matrix.dates[0].strftime('%Y-%m-%d'),
+                "last_date": self.matrix.dates[-1].strftime('%Y-%m-%d'),
+                "endpoints": ["/groups?option=1", "/groups?option=2", "/groups?option=4",
+                              "/chart.png?option=1&group=0", "/chart.html?option=4&group=0",
+                              "/chart.html?option=3", "/chart.png?option=5", "/groups?option=6",
+                              "/chart.png?tickers=A,B", "/stats?by=cagr&top=20", "/status"]}
+
+    # (content type, body, cache hit) for one GET; raises LookupError for an unknown path
+    # or chart and ValueError for an invalid parameter
+    def respond(self, path, query):
+        if path == "/":
+            return "application/json", json.dumps(self.index(), indent=1).encode("utf-8"), False
+        if path == "/status":
+            status = {"cache": self.cache.stats(), "counters": dict(run_report.REPORT.counters)}
+            return "application/json", json.dumps(status, indent=1).encode("utf-8"), False
+
+        if path == "/stats":
+            # Answered from the in-memory index in milliseconds, so not worth caching
+            return "application/json", json.dumps(self.stats(query), indent=1).encode("utf-8"), False
+        if path == "/groups":
+            groups = self.groups(query)
+            def render():
+                return "application/json", json.dumps(groups).encode("utf-8")
+        elif path == "/chart.png" and query_value(query, "option") == "5" and "tickers" not in query:
+            metric = self.metric(query, "percent")
+            highlight = parse_tickers(query_value(query, "highlight")) if "highlight" in query else []
+            unknown = [ticker for ticker in highlight if ticker not in self.matrix.column]
+            if unknown:
+                raise LookupError(f"Not loaded: {', '.join(unknown)}")
+            dpi = self.dpi(query)
+            def render():
+                return self.render_universe(metric, highlight, dpi)
+        elif path == "/chart.png":
+            title, tickers, metric = self.select(query, html=False)
+            dpi = self.dpi(query)
+            def render():
+                return self.render_png(title, tickers, metric, dpi)
+        elif path == "/chart.html" and query_value(query, "option") == "5" and "tickers" not in query:
+            raise LookupError("Option 5 is only rendered as /chart.png")
+        elif path == "/chart.html":
+            title, tickers, metric = self.select(query, html=True)
+            hovermode = "x unified" if query_value(query, "option") == "3" else "closest"
+            def render():
+                return self.render_html(title, tickers, metric, hovermode)
+        elif path == "/" + plotly_js_file():
+            def render():
+                from plotly.offline import get_plotlyjs
+                return "application/javascript", get_plotlyjs().encode("utf-8")
+        else:
+            raise LookupError(f"No such endpoint: {path}")
+
+        key = (path, tuple(sorted((name, values[-1]) for name, values in query.items())))
+        future, hit = self.cache.get(key, render, self.executor)
+        content_type, body = future.result()
+        return content_type, body, hit
+
+# Serve a ChartService over HTTP on host:port until interrupted. Each connection gets its
+# own thread; rendering itself is bounded by the service's thread pool.
+def serve_charts(service, host=SERVE_HOST, port=SERVE_PORT):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    class ChartRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start_time = time.perf_counter()
+            url = urlsplit(self.path)
+            try:
+                content_type, body, hit = service.respond(url.path, parse_qs(url.query))
+                status = 200
+            except LookupError as e:
+                content_type, body, hit, status = "text/plain; charset=utf-8", str(e).encode("utf-8"), False, 404
+            except ValueError as e:
+                content_type, body, hit, status = "text/plain; charset=utf-8", str(e).encode("utf-8"), False, 400
+            except Exception:
+                print(f"Error serving {self.path}:\n{traceback.format_exc()}", end="")
+                run_report.count("requests_failed")
+                content_type, body, hit, status = "text/plain; charset=utf-8", b"Internal server error", False, 500
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Cache", "hit" if hit else "miss")
+            self.end_headers()
+            self.wfile.write(body)
+            run_report.count("requests_served")
+            print(f"{self.command} {self.path} {status} {len(body) / 1024:.0f} KB "
+                  f"{(time.perf_counter() - start_time) * 1000:.1f} ms{' (cached)' if hit else ''}")
+
+        def log_message(self, format, *args):
+            pass  # do_GET prints one line per request instead
+
+    # Stop the same way on SIGTERM (kill, service managers) as on Ctrl+C
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+
+    server = ThreadingHTTPServer((host, port), ChartRequestHandler)
+    print(f"Serving charts for {len(service.matrix.tickers)} tickers on http://{host}:{server.server_port}/ "
+          f"(Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping chart service.")
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+
+# --- Entry points ---
+
+# The original prompt-driven session: tickers, download, one charting option
+def interactive():
+    # Offer to resume a run whose downloads partly failed; everything that succeeded
+    # then comes from the cache and only the journaled failures are fetched again
+    journal = load_journal(FAILED_JOURNAL)
+    resume = False
+    if journal and journal["failed"]:
+        choice = input(f"{len(journal['failed'])} tickers failed to download last run. Retry only those and reuse that run's tickers? (Y/N): ").strip().upper()
+        resume = choice == "Y"
+
+    if resume:
+        tickers = journal["tickers"]
+        start_date, end_date = journal["start_date"], journal["end_date"]
+        print(f"Resuming: retrying {len(journal['failed'])} failed tickers.")
+    else:
+        # Get the tickers (either from user input or default)
+        tickers, user_provided_input = get_tickers_from_input()
+        if user_provided_input:
+            print(f"Using tickers: {tickers}")
+        # Set date range
+        start_date, end_date = "1900-01-01", datetime.now().strftime('%Y-%m-%d')
+
+    matrix = load_prices(tickers, start_date, end_date)
+    if matrix is None:
+        return
+
+    # User input for chart option
+    while True:
+        print("\nChoose a charting option:")
+        print("1: Group by 5-year buckets from the earliest date")
+        print("2: Group by majority start dates (10+ tickers per date)")
+        print("3: Chart all tickers in one chart")
+        print("4: Chart tickers in partitions of 100 (with price or percentage option)")
+        print("5: Chart the whole universe as percentile bands (5th-95th, 25th-75th, median)")
+        print(f"6: Chart the top and bottom {RANK_TOP} tickers by CAGR")
+        option = input("Enter 1, 2, 3, 4, 5, or 6: ").strip()
+
+        if option in ["1", "2", "3", "4", "5", "6"]:
+            break
+        else:
+            print("Invalid option selected. Please enter 1, 2, 3, 4, 5, or 6.")
+
+    metric = "percent"
+    if option == "4":
         while True:
             metric_choice = input("Display y-axis as (P)rice or (P)ercentage? Enter P or %: ").strip().upper()
             if metric_choice in ["P", "%"]:
+                metric = "price" if metric_choice == "P" else "percent"
                 break
             else:
                 print("Invalid choice. Please enter 'P' for Price or '%' for Percentage.")
 
-        batch_size = 100
-        ticker_list = list(raw_data.keys())
-        for i in range(0, len(ticker_list), batch_size):
-            batch_tickers = ticker_list[i:i + batch_size]
-            fig = go.Figure()
-            
-            if metric_choice == "P":
-                for ticker in batch_tickers:
-                    fig.add_trace(go.Scatter(
-                        x=raw_data[ticker].index,
-                        y=raw_data[ticker],
-                        name=ticker,
-                        mode='lines',
-                        hovertemplate=f"{ticker}<br>Date: %{{x}}<br>Price: %{{y:.2f}} USD"
-                    ))
-                y_axis_title = "Price (USD)"
-                chart_title = f"Stock Prices Over Time (Tickers {i+1} to {i+len(batch_tickers)})"
-            else:
-                for ticker in batch_tickers:
-                    fig.add_trace(go.Scatter(
-                        x=stock_data[ticker].index,
-                        y=stock_data[ticker],
-                        name=ticker,
-                        mode='lines',
-                        hovertemplate=f"{ticker}<br>Date: %{{x}}<br>Percentage: %{{y:.2f}}%"
-                    ))
-                y_axis_title = "Percentage Increase (%)"
-                chart_title = f"Percentage Increase Over Time (Tickers {i+1} to {i+len(batch_tickers)})"
-
-            fig.update_layout(
-                title=chart_title,
-                xaxis_title="Date",
-                yaxis_title=y_axis_title,
-                legend_title="Tickers",
-                hovermode="closest",
-                template="plotly_white",
-                width=2560,
-                height=1440
-            )
-
-            fig.show()
+    highlight = []
+    if option == "5":
+        while True:
+            highlight_input = input("Tickers to highlight (comma-separated, or press Enter for none): ").strip()
+            if not highlight_input:
+                break
+            try:
+                highlight = parse_tickers(highlight_input)
+                break
+            except ValueError as e:
+                print(f"Error: {e}")
 
-    print("Chart generation complete.")
+    run_charts(matrix, [option], metric, highlight=highlight)
+
+# Ticker list flags shared by chart and shard
+def add_ticker_arguments(parser):
+    tickers = parser.add_mutually_exclusive_group()
+    tickers.add_argument("--tickers", help="comma-separated tickers (default: the built-in list)")
+    tickers.add_argument("--tickers-file", help="file with tickers: one per line, comma-separated, or any "
+                                                "MakeList.py output (python, json, binary)")
+    return tickers
+
+# Download flags shared by chart and shard
+def add_download_arguments(parser):
+    parser.add_argument("--start", default="1900-01-01", help="first date to download, YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="end date (exclusive), YYYY-MM-DD (default: today)")
+    parser.add_argument("--cache-dir", default=None,
+                        help=f"price cache directory (default: {CACHE_DIR}, or {CACHE_DIR}_synthetic for --source synthetic)")
+    parser.add_argument("--no-cache", action="store_true", help="always download full history, skip the cache")
+    parser.add_argument("--source", choices=["yahoo", "synthetic"], default="yahoo",
+                        help="price source; 'synthetic' generates deterministic offline data")
+
+# Bar size flag shared by chart, merge and serve
+def add_resample_argument(parser):
+    parser.add_argument("--resample", choices=["daily", "weekly", "monthly", "auto"],
+                        default=RESAMPLE_MODE or "daily",
+                        help="draw every chart from daily bars, each week's or month's last close, or (auto) the "
+                             f"coarsest of those that still fills a {RESAMPLE_WIDTH_PX} px wide chart "
+                             "(default: daily)")
+
+# Rendering flags shared by chart and merge
+def add_chart_arguments(parser):
+    parser.add_argument("--options", "-o", nargs="+", choices=["1", "2", "3", "4", "5", "6"], required=True,
+                        help="chart options to render: 1 buckets, 2 shared start dates, 3 all tickers, 4 partitions, "
+                             "5 universe percentile bands, 6 top and bottom tickers by --rank-by")
+    parser.add_argument("--metric", choices=PriceMatrix.METRICS, default="percent",
+                        help="y-axis metric for options 4 and 5 (default: percent)")
+    parser.add_argument("--highlight", default="",
+                        help="option 5: comma-separated tickers drawn as lines over the percentile bands")
+    parser.add_argument("--out-dir", default=".", help="directory for chart files (default: current directory)")
+    parser.add_argument("--headless", action="store_true",
+                        help="save interactive charts as HTML files instead of opening a browser")
+    parser.add_argument("--plotly-bundle", choices=["shared", "inline", "cdn"], default=PLOTLY_BUNDLE,
+                        help=f"how headless HTML files load plotly.js: one shared plotly-<version>.min.js per "
+                             f"directory, inlined in every file, or from the CDN (default: {PLOTLY_BUNDLE})")
+    parser.add_argument("--webgl", choices=["auto", "always", "never"], default="auto",
+                        help=f"draw with WebGL (Scattergl); auto switches at {WEBGL_MIN_POINTS:,} points per chart")
+    parser.add_argument("--image-format", choices=["png", "svg", "pdf"], default=None,
+                        help="also export each interactive chart as a static image (needs kaleido)")
+    parser.add_argument("--downsample", choices=["minmax", "lttb", "none"], default=DOWNSAMPLE_MODE,
+                        help=f"downsampling for options 3 and 4 (default: {DOWNSAMPLE_MODE})")
+    add_resample_argument(parser)
+    parser.add_argument("--bucket-width", default=BUCKET_WIDTH,
+                        help=f"option 1 bucket width: a number and a unit Y, Q, M, W or D (default: {BUCKET_WIDTH})")
+    parser.add_argument("--bucket-align", choices=["earliest", "calendar"], default=BUCKET_ALIGN,
+                        help="count buckets from the earliest start date, or cut them at calendar boundaries")
+    parser.add_argument("--min-bucket", type=int, default=MIN_BUCKET_TICKERS,
+                        help=f"skip option 1 buckets with fewer tickers (default: {MIN_BUCKET_TICKERS})")
+    parser.add_argument("--min-shared", type=int, default=MIN_SHARED_START,
+                        help=f"option 2: minimum tickers sharing a start date (default: {MIN_SHARED_START})")
+    parser.add_argument("--rank-by", choices=list(TickerStats.RANKINGS), default=None,
+                        help=f"order option 4's partitions by this statistic, best first, and rank option 6 by it "
+                             f"(default: matrix order for option 4, {RANK_BY} for option 6)")
+    parser.add_argument("--top", type=int, default=RANK_TOP,
+                        help=f"option 6: tickers in the top and in the bottom chart (default: {RANK_TOP})")
+    parser.add_argument("--min-years", type=float, default=0.0,
+                        help="options 4 and 6: skip tickers with less history than this many years (default: 0)")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"only redraw charts whose input bars or settings changed since the last run "
+                             f"(tracked in {MANIFEST_FILE} in the output directory)")
+
+# Run report flags shared by every subcommand
+def add_report_arguments(parser):
+    parser.add_argument("--report", default=None,
+                        help="write per-stage timings, counters and peak memory to this .json or .csv file at exit")
+    parser.add_argument("--profile", default="",
+                        help="comma-separated stages to profile, e.g. download,option1 (or 'all'); "
+                             "profiles are saved next to the report")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="profiler for --profile (pyinstrument must be installed separately)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Download long-term price history and chart it. Run without arguments for the interactive prompts.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    chart = subparsers.add_parser("chart", help="download once and render one or more chart options without prompts")
+    add_ticker_arguments(chart).add_argument("--resume", action="store_true",
+                                             help=f"retry only the tickers that failed last run (from {FAILED_JOURNAL})")
+    add_download_arguments(chart)
+    add_chart_arguments(chart)
+    add_report_arguments(chart)
+
+    shard = subparsers.add_parser("shard", help="download one hash shard of the ticker list and save its closes "
+                                                "for a later merge")
+    shard.add_argument("--shard", type=int, required=True, help="shard to download, 0 to SHARDS-1")
+    shard.add_argument("--shards", type=int, required=True, help="total number of shards")
+    shard.add_argument("--shard-dir", default=SHARD_DIR, help=f"directory for shard files (default: {SHARD_DIR})")
+    # No --resume: rerunning the same shard reuses the cache, so only its failures are fetched again
+    add_ticker_arguments(shard)
+    add_download_arguments(shard)
+    shard.set_defaults(resume=False)
+    add_report_arguments(shard)
+
+    merge = subparsers.add_parser("merge", help="combine every shard in a directory and render chart options "
+                                                "over the full ticker list")
+    merge.add_argument("shard_dir", nargs="?", default=SHARD_DIR,
+                       help=f"directory written by the shard runs (default: {SHARD_DIR})")
+    add_chart_arguments(merge)
+    add_report_arguments(merge)
+
+    serve = subparsers.add_parser("serve", help="load the ticker list once and serve charts from memory over "
+                                                "local HTTP")
+    add_ticker_arguments(serve)
+    add_download_arguments(serve)
+    serve.set_defaults(resume=False)
+    serve.add_argument("--host", default=SERVE_HOST, help=f"address to listen on (default: {SERVE_HOST})")
+    serve.add_argument("--port", type=int, default=SERVE_PORT, help=f"port to listen on (default: {SERVE_PORT})")
+    serve.add_argument("--threads", type=int, default=SERVE_THREADS,
+                       help=f"threads rendering charts (default: {SERVE_THREADS})")
+    serve.add_argument("--cache-mb", type=int, default=SERVE_CACHE_MB,
+                       help=f"memory for rendered charts kept for repeat requests (default: {SERVE_CACHE_MB})")
+    serve.add_argument("--downsample", choices=["minmax", "lttb", "none"], default=DOWNSAMPLE_MODE,
+                       help=f"downsampling for the HTML charts (default: {DOWNSAMPLE_MODE})")
+    add_resample_argument(serve)
+    add_report_arguments(serve)
+    return parser
+
+# Tickers and date range selected by the ticker flags, or None if there is nothing to resume;
+# raises OSError or ValueError for an unreadable file or an invalid ticker
+def tickers_from_args(args, journal=FAILED_JOURNAL):
+    if args.resume:
+        saved = load_journal(journal)
+        if not saved:
+            print(f"Nothing to resume: {journal} not found.")
+            return None
+        return saved["tickers"], saved["start_date"], saved["end_date"]
+    if args.tickers_file:
+        tickers = read_tickers_file(args.tickers_file)
+    elif args.tickers:
+        tickers = parse_tickers(args.tickers)
+    else:
+        tickers = default_tickers()
+    return tickers, args.start, args.end
+
+# Price provider and cache directory (None for --no-cache) selected by the download flags
+def provider_from_args(args):
+    provider = SyntheticProvider() if args.source == "synthetic" else YahooProvider()
+    # Synthetic bars get their own cache so they never mix with real downloads
+    cache_dir = args.cache_dir or (f"{CACHE_DIR}_synthetic" if args.source == "synthetic" else CACHE_DIR)
+    return provider, None if args.no_cache else cache_dir
+
+# Render the chart options selected by the chart flags from a loaded or merged matrix
+def charts_from_args(matrix, args):
+    webgl = {"auto": None, "always": True, "never": False}[args.webgl]
+    export = export_settings(args.plotly_bundle, webgl, args.image_format)
+    grouping = grouping_settings(args.bucket_width, args.bucket_align, args.min_bucket, args.min_shared)
+    highlight = parse_tickers(args.highlight) if args.highlight else []
+    ranking = ranking_settings(args.rank_by, args.top, args.min_years)
+    downsample_mode = None if args.downsample == "none" else args.downsample
+    run_charts(matrix, args.options, args.metric, args.out_dir, args.headless, export, grouping, highlight, ranking,
+               args.resample, downsample_mode, args.incremental)
+
+# Download one shard of the ticker list and save it to the shard directory
+def run_shard(args):
+    if args.shards < 1 or not 0 <= args.shard < args.shards:
+        print(f"Error: --shard must be between 0 and {args.shards - 1} (--shards {args.shards})")
+        return 2
+    try:
+        universe, start_date, end_date = tickers_from_args(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+    end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+    universe = list(dict.fromkeys(universe))
+    tickers = shard_tickers(universe, args.shard, args.shards)
+    print(f"Shard {args.shard} of {args.shards}: {len(tickers)} of {len(universe)} tickers.")
+
+    os.makedirs(args.shard_dir, exist_ok=True)
+    provider, cache_dir = provider_from_args(args)
+    journal = shard_path(args.shard_dir, args.shard, args.shards) + ".failed.json"
+    matrix = load_prices(tickers, start_date, end_date, cache_dir, provider, journal=journal) if tickers else None
+    write_shard(matrix, universe, args.shard, args.shards, start_date, end_date, args.shard_dir)
+    return 0
+
+# Load the ticker list once and serve charts from it until interrupted
+def run_serve(args):
+    try:
+        tickers, start_date, end_date = tickers_from_args(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+    provider, cache_dir = provider_from_args(args)
+    matrix = load_prices(tickers, start_date, end_date, cache_dir, provider)
+    if matrix is None:
+        return 1
+    bars = resample_bars(matrix.dates, args.resample)
+    if bars != "daily":
+        print(f"Serving {bars} bars.")
+    # A long-running service would otherwise keep one span record per request forever
+    run_report.keep_spans(SERVE_SPAN_HISTORY)
+    downsample_mode = None if args.downsample == "none" else args.downsample
+    service = ChartService(matrix.resample(bars), args.threads, args.cache_mb, downsample_mode)
+    service.warm()
+    serve_charts(service, args.host, args.port)
+    return 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        interactive()
+        return 0
+
+    if args.report or args.profile:
+        run_report.enable(args.report, [stage for stage in args.profile.split(",") if stage], args.profiler)
+    if args.command == "shard":
+        return run_shard(args)
+    if args.command == "serve":
+        return run_serve(args)
+
+    if args.top < 1:
+        print("Error: --top must be at least 1")
+        return 2
+    try:
+        parse_bucket_width(args.bucket_width)
+        if args.highlight:
+            parse_tickers(args.highlight)
+        selected = tickers_from_args(args) if args.command == "chart" else None
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    if args.command == "merge":
+        matrix = merge_shards(args.shard_dir)
+    elif selected is None:
+        return 1
+    else:
+        tickers, start_date, end_date = selected
+        provider, cache_dir = provider_from_args(args)
+        matrix = load_prices(tickers, start_date, end_date, cache_dir, provider)
+    if matrix is None:
+        return 1
+    charts_from_args(matrix, args)
+    return 0
+
+# Main script
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,36 +1,20 @@
+import argparse
+import array
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
 import os
+import re
+import struct
+import sys
+import tempfile
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-# --- New Function to Remove Everything After Hyphen ---
-
-def preprocess_remove_hyphen(input_file):
-    """Remove everything after a hyphen on each line and save to a temporary file."""
-    temp_file = Path(input_file).stem + "_preprocessed.txt"
-    print(f"\nPreprocessing {input_file} to remove everything after '-'...")
-    
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # Process each line to remove everything after the hyphen
-        cleaned_lines = []
-        for line in lines:
-            cleaned_line = line.split('-')[0].strip()
-            if cleaned_line:  # Only keep non-empty lines
-                cleaned_lines.append(cleaned_line)
-        
-        # Write the preprocessed lines to a temporary file
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            for line in cleaned_lines:
-                f.write(line + '\n')
-        
-        print(f"Preprocessed file saved to {temp_file}.")
-        return temp_file
-    except Exception as e:
-        print(f"Error during preprocessing: {e}")
-        return None
+import RunReport as run_report
 
 # --- Functions from the First Script (Duplicate Removal) ---
 
@@ -59,148 +43,771 @@ def get_file_choice():
         except ValueError:
             print("Invalid input. Please enter a number.")
 
-def process_chunk(chunk, seen_words):
-    """Process a chunk of lines, keeping only the first occurrence of each word."""
+def split_into_segments(input_file, segments):
+    """Split the file into up to `segments` byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(input_file)
+    boundaries = [0]
+    with open(input_file, 'rb') as f:
+        for k in range(1, segments):
+            f.seek(size * k // segments)
+            f.readline()  # move to the start of the next full line
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    boundaries = sorted(set(boundaries))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def dedupe_segment(input_file, start, end):
+    """
+    Read the lines in bytes [start, end) and return (line count, unique words in first-occurrence order).
+    Lines break on LF, CRLF and a lone CR like the text-mode readers, so every mode counts the same lines.
+    Each call owns its own set, so segments can run in separate processes without sharing state.
+    """
+    seen_words = set()
     unique_chunk = []
-    for word in chunk:
-        word = word.strip()
-        if word and word not in seen_words:
-            unique_chunk.append(word)
-            seen_words.add(word)
-    return unique_chunk
+    line_count = 0
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        position = start
+        for raw_line in f:
+            if position >= end:
+                break
+            position += len(raw_line)
+            lines = [raw_line]
+            if b'\r' in raw_line:
+                lines = raw_line.replace(b'\r\n', b'\n').split(b'\r')
+                if not lines[-1]:
+                    lines.pop()  # the line ended with a lone \r
+            for line in lines:
+                line_count += 1
+                word = line.decode('utf-8').strip()
+                if word and word not in seen_words:
+                    seen_words.add(word)
+                    unique_chunk.append(word)
+    return line_count, unique_chunk
 
-def remove_duplicates(input_file):
-    """Remove duplicates from the input file using multithreading, return the output filename."""
-    output_file = Path(input_file).stem + "~!.txt"
+def merge_segments(segment_results):
+    """Merge per-segment unique words in file order, so the first occurrence across the whole file wins."""
     seen_words = set()
     unique_words = []
-    
-    # Read the file in chunks to manage memory for large files
-    chunk_size = 10000  # Number of lines per chunk
-    chunks = []
-    current_chunk = []
+    line_count = 0
+    for segment_lines, segment_words in segment_results:
+        line_count += segment_lines
+        for word in segment_words:
+            if word not in seen_words:
+                seen_words.add(word)
+                unique_words.append(word)
+    return line_count, unique_words
 
-    print(f"\nReading {input_file} to remove duplicates...")
-    with open(input_file, 'r', encoding='utf-8') as f:
+def dedupe_in_memory(input_file, workers=None):
+    """Dedupe the file in byte-range segments, one worker process per segment, then merge them in order."""
+    workers = workers or os.cpu_count() or 1
+    segments = split_into_segments(input_file, workers)
+    if workers == 1 or len(segments) <= 1:
+        results = [dedupe_segment(input_file, start, end) for start, end in segments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(dedupe_segment, input_file, start, end) for start, end in segments]
+            results = [future.result() for future in futures]
+    return merge_segments(results)
+
+# --- External-Memory Dedupe (inputs with more unique words than fit in RAM) ---
+
+SPILL_RUN_LINES = 1_000_000  # Lines (or unique words) held in memory per sorted run
+
+def write_run(records, spill_dir, run_files, prefix):
+    """Write (word, line number) records to a new run file, one tab-separated record per line."""
+    run_file = os.path.join(spill_dir, f"{prefix}_{len(run_files)}.txt")
+    with open(run_file, 'w', encoding='utf-8', newline='\n') as f:
+        for word, line_number in records:
+            f.write(f"{word}\t{line_number}\n")
+    run_files.append(run_file)
+
+def read_run(run_file):
+    """Yield the (word, line number) records of a run file."""
+    with open(run_file, 'r', encoding='utf-8', newline='\n') as f:
         for line in f:
-            current_chunk.append(line)
-            if len(current_chunk) >= chunk_size:
-                chunks.append(current_chunk)
-                current_chunk = []
-        if current_chunk:  # Don't forget the last chunk
-            chunks.append(current_chunk)
-
-    print(f"Processing {len(chunks)} chunks with multithreading to remove duplicates...")
-    # Process chunks using ThreadPoolExecutor
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_chunk, chunk, seen_words) for chunk in chunks]
-        for future in futures:
-            unique_words.extend(future.result())
-
-    # Write the unique words to the output file
-    print(f"Writing unique words to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for word in unique_words:
-            f.write(word + '\n')
+            word, line_number = line[:-1].rsplit('\t', 1)
+            yield word, int(line_number)
+
+def dedupe_external(input_file, output_file, spill_dir=None, run_lines=SPILL_RUN_LINES):
+    """
+    Dedupe a file of any size into output_file with bounded memory, keeping first-occurrence order.
+    Returns (line count, unique word count).
+    Pass 1 spills runs sorted by word, pass 2 merges them to each word's first line number
+    and spills runs sorted by line number, pass 3 merges those back into file order.
+    """
+    with tempfile.TemporaryDirectory(dir=spill_dir) as work_dir:
+        # Pass 1: first line number of each word within a run, sorted by word
+        word_runs = []
+        first_seen = {}
+        line_count = 0
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                line_count += 1
+                word = line.strip()
+                if word and word not in first_seen:
+                    first_seen[word] = line_number
+                if (line_number + 1) % run_lines == 0:
+                    write_run(sorted(first_seen.items()), work_dir, word_runs, 'by_word')
+                    first_seen = {}
+        if first_seen:
+            write_run(sorted(first_seen.items()), work_dir, word_runs, 'by_word')
+        first_seen = None
+
+        # Pass 2: merge by word, keep the earliest line number, spill runs sorted by line number
+        order_runs = []
+        batch = []
+        merged = heapq.merge(*(read_run(run_file) for run_file in word_runs))
+        for word, group in itertools.groupby(merged, key=lambda record: record[0]):
+            batch.append((next(group)[1], word))  # runs are sorted by (word, line), so the first is the earliest
+            if len(batch) >= run_lines:
+                write_run([(word, line_number) for line_number, word in sorted(batch)], work_dir, order_runs, 'by_line')
+                batch = []
+        if batch:
+            write_run([(word, line_number) for line_number, word in sorted(batch)], work_dir, order_runs, 'by_line')
+
+        # Pass 3: merge by line number to restore first-occurrence order
+        unique_count = 0
+        merged = heapq.merge(*(read_run(run_file) for run_file in order_runs), key=lambda record: record[1])
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for word, _ in merged:
+                f.write(word + '\n')
+                unique_count += 1
+        return line_count, unique_count
+
+def remove_duplicates(input_file, workers=None, external=False, spill_dir=None):
+    """
+    Remove duplicates from the input file, keeping the first occurrence of each word, and return
+    the output filename. By default the file is split across worker processes; with external=True
+    sorted runs are spilled to disk instead, for inputs whose unique words do not fit in memory.
+    """
+    output_file = Path(input_file).stem + "~!.txt"
+
+    if external:
+        print(f"\nRemoving duplicates from {input_file} with sorted runs spilled to disk...")
+        with run_report.span("dedupe:external"):
+            line_count, unique_count = dedupe_external(input_file, output_file, spill_dir)
+    else:
+        print(f"\nRemoving duplicates from {input_file} with {workers or os.cpu_count() or 1} worker processes...")
+        with run_report.span("dedupe:in_memory"):
+            line_count, unique_words = dedupe_in_memory(input_file, workers)
+        unique_count = len(unique_words)
+
+        # Write the unique words to the output file
+        print(f"Writing unique words to {output_file}...")
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for word in unique_words:
+                f.write(word + '\n')
 
     print(f"Removed duplicates and saved to {output_file}.")
-    print(f"Original file had {len(chunks) * chunk_size + len(current_chunk)} lines.")
-    print(f"Output file has {len(unique_words)} unique words.")
+    run_report.count("lines", line_count)
+    run_report.count("words_unique", unique_count)
+    print(f"Original file had {line_count} lines.")
+    print(f"Output file has {unique_count} unique words.")
     return output_file
 
-# --- Functions from the Second Script (Ticker Extraction and Formatting) ---
+# --- Streaming Pipeline (single pass, no temporary files) ---
+
+def read_lines(input_file):
+    """Yield the lines of the input file one at a time."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        yield from f
+
+def strip_after_hyphen(lines):
+    """Yield each line with everything after the first hyphen removed, skipping empty results."""
+    for line in lines:
+        cleaned_line = line.split('-')[0].strip()
+        if cleaned_line:
+            yield cleaned_line
 
-def extract_tickers_from_file(input_filename):
+def unique_words(words):
+    """Yield each word the first time it is seen; memory grows with unique words, not input size."""
+    seen_words = set()
+    for word in words:
+        if word not in seen_words:
+            seen_words.add(word)
+            yield word
+
+def stream_tickers(input_file):
     """
-    Extracts plain stock tickers from a text file and returns them as a sorted list.
-    Assumes tickers are one per line (e.g., VZ, WCC).
+    Read the input file once and return its sorted unique tickers.
+    Same result as the original preprocess -> remove_duplicates -> extract pipeline (kept in
+    Benchmark.py as the baseline), without the intermediate files or holding the whole input in memory.
     """
-    tickers = set()  # Using a set to ensure uniqueness
-    try:
-        with open(input_filename, 'r') as file:
-            for line in file:
-                # Strip whitespace and add non-empty lines as tickers
-                ticker = line.strip()
-                if ticker:  # Ignore empty lines
-                    tickers.add(ticker)
-    except FileNotFoundError:
-        print(f"Error: File '{input_filename}' not found.")
-        return []
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return []
-    
-    return sorted(list(tickers))  # Return sorted list of unique tickers
+    return sorted(unique_words(strip_after_hyphen(read_lines(input_file))))
 
-def write_ticker_list(tickers, output_filename):
+# --- Memory-Mapped Reader (bytes scan, decodes only unique symbols) ---
+
+MMAP_BLOCK_SIZE = 4 * 1024 * 1024  # Bytes scanned per block; bounds memory regardless of file size
+
+def mapped_blocks(input_file, block_size=MMAP_BLOCK_SIZE, start=0, stop=None):
+    """
+    Yield the memory-mapped file, or its bytes [start, stop) when those fall on line
+    boundaries, in blocks of about block_size bytes that end on a newline.
+    """
+    with open(input_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Pages already scanned are released so resident memory stays at about one block
+            release = hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            stop = len(mm) if stop is None else stop
+            while start < stop:
+                end = mm.find(b'\n', min(start + block_size, stop) - 1, stop)
+                end = stop if end == -1 else end + 1
+                yield mm[start:end]
+                if release:
+                    page_start = start - start % mmap.PAGESIZE
+                    mm.madvise(mmap.MADV_DONTNEED, page_start, end - page_start)
+                start = end
+
+# Bytes before the first hyphen of every line, matched in C (for blocks of mostly distinct lines)
+SYMBOL_PREFIX = re.compile(rb'^[^\n-]*', re.MULTILINE)
+
+def unique_symbol_bytes(blocks):
+    """
+    Collect the distinct byte strings before the first hyphen of each line, without decoding any line.
+    Only symbols are kept across blocks, never whole lines, so memory grows with the unique symbols,
+    not the unique lines (e.g. SYM-<serial> dumps).
     """
-    Writes the list of tickers to a file in Python block format with max 10 items per row.
+    symbols = set()
+    distinct_lines = False
+    for block in blocks:
+        if b'\r' in block:
+            # Text mode treats \r\n and a lone \r as line breaks too
+            block = block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        if distinct_lines:
+            # Deduping lines would not shrink the block, so cut every line at its hyphen in one pass
+            symbols.update(SYMBOL_PREFIX.findall(block))
+            continue
+        lines = set(block.split(b'\n'))  # dedupe the block's lines first; the set is built in C
+        symbols.update(line.split(b'-', 1)[0] for line in lines)
+        distinct_lines = len(lines) * 2 > block.count(b'\n') + 1
+    return symbols
+
+def segment_symbols(input_file, start, stop):
+    """Unique symbol bytes of the lines in bytes [start, stop); runs in a worker process."""
+    return unique_symbol_bytes(mapped_blocks(input_file, start=start, stop=stop))
+
+def mmap_tickers(input_file, workers=1):
+    """
+    Memory-map the input and return its sorted unique tickers, the same list as stream_tickers.
+    Lines are split and deduped as bytes; only the unique symbols are decoded and stripped.
+    With workers > 1 the file is split on line boundaries and the ranges are scanned in parallel.
+    """
+    segments = split_into_segments(input_file, workers) if workers > 1 else []
+    if len(segments) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(segment_symbols, input_file, start, stop) for start, stop in segments]
+            symbols = set().union(*(future.result() for future in futures))
+    else:
+        symbols = unique_symbol_bytes(mapped_blocks(input_file))
+    tickers = set()
+    for symbol in symbols:
+        ticker = symbol.decode('utf-8').strip()
+        if ticker:
+            tickers.add(ticker)
+    return sorted(tickers)
+
+def external_tickers(input_file, spill_dir=None):
+    """
+    Return the sorted unique tickers through dedupe_external, for dumps with more distinct symbols
+    than fit in memory while scanning: the hyphen-stripped lines and the sorted runs are spilled
+    to spill_dir (default: the system temp directory). Only the final list is held in memory.
+    """
+    with tempfile.TemporaryDirectory(dir=spill_dir) as work_dir:
+        stripped_file = os.path.join(work_dir, "stripped.txt")
+        with open(stripped_file, 'w', encoding='utf-8', newline='\n') as f:
+            f.writelines(word + '\n' for word in strip_after_hyphen(read_lines(input_file)))
+        unique_file = os.path.join(work_dir, "unique.txt")
+        with run_report.span("dedupe:external"):
+            line_count, unique_count = dedupe_external(stripped_file, unique_file, work_dir)
+        run_report.count("words_unique", unique_count)
+        with open(unique_file, 'r', encoding='utf-8', newline='\n') as f:
+            return sorted(line[:-1] for line in f)
+
+# --- Functions from the Second Script (Ticker Formatting) ---
+
+def python_block(tickers):
+    """
+    Format the list of tickers as a Python block with max 10 items per row.
     Format: tickers = ["TICKER1", "TICKER2", ..., "TICKER10",]
     """
+    rows = ["tickers = [\n"]
+    for i in range(0, len(tickers), 10):  # Step by 10 items
+        row_tickers = tickers[i:i + 10]  # Get up to 10 tickers for this row
+        row = "    "  # Indent with 4 spaces
+        for j, ticker in enumerate(row_tickers):
+            row += f'"{ticker}"'
+            if j < len(row_tickers) - 1 or i + 10 < len(tickers):  # Add comma unless it's the last ticker in the last row
+                row += ", "
+            else:
+                row += ","  # Last row, last item gets a comma for consistency
+        rows.append(row + "\n")
+    rows.append("]\n")
+    return "".join(rows)
+
+def write_ticker_list(tickers, output_filename):
+    """Writes the list of tickers to a file in Python block format (see python_block)."""
     try:
         with open(output_filename, 'w') as file:
-            file.write("tickers = [\n")
-            for i in range(0, len(tickers), 10):  # Step by 10 items
-                row_tickers = tickers[i:i + 10]  # Get up to 10 tickers for this row
-                row = "    "  # Indent with 4 spaces
-                for j, ticker in enumerate(row_tickers):
-                    row += f'"{ticker}"'
-                    if j < len(row_tickers) - 1 or i + 10 < len(tickers):  # Add comma unless it's the last ticker in the last row
-                        row += ", "
-                    else:
-                        row += ","  # Last row, last item gets a comma for consistency
-                file.write(row + "\n")
-            file.write("]\n")
+            file.write(python_block(tickers))
         print(f"Saved ticker list to: {output_filename}")
     except Exception as e:
         print(f"Error writing to file: {e}")
 
-def process_file_to_ticker_list(input_filename):
+# --- Machine-Readable Ticker Files ---
+
+# Output formats: python (the block literal above), lines (one ticker per line), json (a JSON array)
+# and binary (offset table + symbol bytes, memory-mapped and decoded on access by TickerFile)
+TICKER_FORMATS = {"python": None, "lines": ".txt", "json": ".json", "binary": ".tickers"}
+
+# Binary layout, little-endian: header (magic, count, flags), uint32 offsets[count + 1],
+# uint32 index[count] if FLAG_INDEX, then the UTF-8 symbols back to back
+TICKER_MAGIC = b"TKR1"
+TICKER_HEADER = struct.Struct("<4sII")
+FLAG_INDEX = 1   # a permutation that lists the symbols in sorted order follows the offsets
+FLAG_SORTED = 2  # the symbols themselves are stored in sorted order
+
+def uint32_array(values):
+    """Pack integers as a little-endian uint32 array."""
+    packed = array.array('I', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+def write_binary_ticker_file(tickers, output_filename, index=True):
     """
-    Main function to process the input file and generate the ticker list file.
-    First removes everything after hyphens, then removes duplicates, then formats the tickers.
+    Write tickers in the binary format. Sorted input is flagged as such; otherwise a sorted
+    index is stored (unless index=False) so membership checks stay a binary search.
     """
-    # Step 1: Preprocess to remove everything after hyphens and save to a temporary file
-    preprocessed_file = preprocess_remove_hyphen(input_filename)
-    if not preprocessed_file:
-        print("Failed to preprocess file. Exiting.")
-        return
+    encoded = [ticker.encode('utf-8') for ticker in tickers]
+    offsets = [0]
+    for symbol in encoded:
+        offsets.append(offsets[-1] + len(symbol))
+    flags = 0
+    order = b""
+    if all(a <= b for a, b in zip(encoded, encoded[1:])):
+        flags |= FLAG_SORTED
+    elif index:
+        flags |= FLAG_INDEX
+        order = uint32_array(sorted(range(len(encoded)), key=encoded.__getitem__))
+    with open(output_filename, 'wb') as f:
+        f.write(TICKER_HEADER.pack(TICKER_MAGIC, len(encoded), flags))
+        f.write(uint32_array(offsets))
+        f.write(order)
+        f.write(b"".join(encoded))
 
-    # Step 2: Remove duplicates from the preprocessed file and save to another temporary file with ~!
-    temp_file = remove_duplicates(preprocessed_file)
-    if not temp_file:
-        print("Failed to remove duplicates. Exiting.")
-        return
+def write_ticker_file(tickers, output_filename, fmt="python"):
+    """
+    Write the ticker list in one of TICKER_FORMATS and return True on success. The list is
+    written under a temporary name and moved into place, so readers never see a partial file.
+    """
+    temp_file = f"{output_filename}.{os.getpid()}.tmp"
+    try:
+        if fmt == "python":
+            with open(temp_file, 'w') as f:
+                f.write(python_block(tickers))
+        elif fmt == "lines":
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write("".join(ticker + "\n" for ticker in tickers))
+        elif fmt == "json":
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(tickers), f, separators=(",", ":"))
+        elif fmt == "binary":
+            write_binary_ticker_file(tickers, temp_file)
+        else:
+            raise ValueError(f"unknown ticker format '{fmt}'")
+        os.replace(temp_file, output_filename)
+        print(f"Saved ticker list to: {output_filename}")
+        return True
+    except Exception as e:
+        print(f"Error writing to file: {e}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return False
+
+class TickerFile:
+    """
+    Read-only view of a binary ticker file. The file is memory-mapped and a symbol is only
+    decoded when it is accessed; `ticker in tickers` is a binary search.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._flags = TICKER_HEADER.unpack_from(self._mm)
+        if magic != TICKER_MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a binary ticker file")
+        position = TICKER_HEADER.size
+        self._offsets = self._read_uint32(position, self._count + 1)
+        position += 4 * (self._count + 1)
+        self._index = None
+        if self._flags & FLAG_INDEX:
+            self._index = self._read_uint32(position, self._count)
+            position += 4 * self._count
+        self._data = position
+
+    def _read_uint32(self, position, count):
+        values = array.array('I')
+        values.frombytes(self._mm[position:position + 4 * count])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def _symbol(self, i):
+        return self._mm[self._data + self._offsets[i]:self._data + self._offsets[i + 1]]
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if not -self._count <= i < self._count:
+            raise IndexError("ticker index out of range")
+        return self._symbol(i % self._count).decode('utf-8')
 
-    # Step 3: Generate output filename by appending '~1' to the original filename
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+
+    def __contains__(self, ticker):
+        if not self._flags & (FLAG_SORTED | FLAG_INDEX):
+            return ticker in iter(self)
+        key = ticker.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            position = self._index[middle] if self._index is not None else middle
+            if self._symbol(position) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return False
+        return self._symbol(self._index[low] if self._index is not None else low) == key
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_ticker_file(path):
+    """Read a ticker list written in any of TICKER_FORMATS (or a plain comma-separated file)."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(TICKER_MAGIC))
+    if magic == TICKER_MAGIC:
+        with TickerFile(path) as tickers:
+            return list(tickers)
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        return json.loads(text)
+    if stripped.startswith("tickers = ["):
+        return re.findall(r'"([^"]*)"', text)
+    return [ticker.strip() for line in text.splitlines() for ticker in line.split(",") if ticker.strip()]
+
+def ticker_output_filename(input_filename, fmt):
+    """Output path for a format: the input name with '~1' appended, and the format's extension."""
     base, ext = os.path.splitext(input_filename)
-    output_filename = f"{base}~1{ext}"
+    return f"{base}~1{TICKER_FORMATS[fmt] or ext}"
+
+def process_file_to_ticker_list(input_filename, output_filename=None, fmt="python", workers=1,
+                                external=False, spill_dir=None):
+    """
+    Main function to process the input file and generate the ticker list file.
+    Reads the file once: removes everything after hyphens, removes duplicates,
+    then sorts and formats the tickers. Memory is bounded by the number of unique tickers.
+    workers > 1 scans a regular file in parallel; external=True dedupes through sorted runs
+    spilled to spill_dir instead (see external_tickers).
+    """
+    # Generate output filename by appending '~1' to the original filename
+    output_filename = output_filename or ticker_output_filename(input_filename, fmt)
+
+    print(f"\nScanning {input_filename} (removing everything after '-' and duplicates)...")
+    try:
+        # Regular files are memory-mapped; anything else (e.g. a named pipe) is streamed line by line
+        with run_report.span("scan"):
+            if external:
+                tickers = external_tickers(input_filename, spill_dir)
+            elif os.path.isfile(input_filename):
+                run_report.count("bytes_read", os.path.getsize(input_filename))
+                tickers = mmap_tickers(input_filename, workers)
+            else:
+                tickers = stream_tickers(input_filename)
+    except FileNotFoundError:
+        print(f"Error: File '{input_filename}' not found.")
+        return
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return
 
-    # Step 4: Extract tickers from the temporary file and write them to the final file
-    tickers = extract_tickers_from_file(temp_file)
     if tickers:
-        write_ticker_list(tickers, output_filename)
+        print(f"Found {len(tickers)} unique tickers.")
+        run_report.count("tickers_unique", len(tickers))
+        with run_report.span("write"):
+            write_ticker_file(tickers, output_filename, fmt)
     else:
         print("No tickers found or error occurred. No output file created.")
 
-    # Step 5: Clean up the temporary files
+# --- Incremental and Watch Modes (scan only the bytes appended since the last run) ---
+
+STATE_SUFFIX = ".state.json"  # The state file sits next to the output: <output>.state.json
+STATE_VERSION = 1
+HEAD_BYTES = 4096  # Leading input bytes hashed to tell an appended-to file from a replaced one
+WATCH_INTERVAL = 2.0  # Seconds between polls of the watched inputs
+
+def appended_blocks(input_file, start, block_size=MMAP_BLOCK_SIZE):
+    """
+    Yield the complete lines from byte `start` on, in blocks of about block_size bytes that
+    end on a newline. A last line without its newline is left for the next update.
+    """
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        pending = b""
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                return
+            chunk = pending + chunk
+            end = chunk.rfind(b'\n') + 1
+            pending = chunk[end:]
+            if end:
+                yield chunk[:end]
+
+def unterminated_line(input_file, start):
+    """The bytes from `start` (the end of the last complete line scanned) to the end of the file."""
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        return f.read()
+
+def head_digest(input_file, length):
+    """SHA-256 of the first `length` bytes of the input."""
+    with open(input_file, 'rb') as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+class IncrementalTickerList:
+    """
+    A ticker list kept in step with an input that only grows. The state file records how far
+    the input has been scanned, which file that was and the exact set of tickers seen, so
+    update() reads only the appended bytes. An input that shrank or was replaced is scanned
+    again from the start. A last line without its newline is only listed by a final update,
+    and it is never recorded as scanned: it may still be growing, so the next update reads it again.
+    """
+
+    def __init__(self, input_filename, output_filename=None, fmt="python"):
+        self.input_filename = input_filename
+        self.output_filename = output_filename or ticker_output_filename(input_filename, fmt)
+        self.state_filename = self.output_filename + STATE_SUFFIX
+        self.fmt = fmt
+        self.offset = 0            # bytes scanned, always the end of a complete line
+        self.identity = None       # (device, inode) of the scanned input
+        self.head = None           # (length, digest) of the scanned input's first bytes
+        self.tickers = set()
+        self.tail = set()          # tickers listed from an unterminated last line, not yet in self.tickers
+        self.output_size = None    # output size as last written; any other size means rewrite it
+        self.last_stat = None      # input (inode, size, mtime) at the last update, for watch polling
+        self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_filename, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable state file {self.state_filename}: {e}")
+            return
+        if state.get("version") != STATE_VERSION or state.get("input") != os.path.abspath(self.input_filename):
+            return
+        self.offset = state["offset"]
+        self.identity = tuple(state["identity"])
+        self.head = tuple(state["head"])
+        self.tickers = set(state["tickers"])
+        self.tail = set(state.get("tail", []))
+        if state.get("format") == self.fmt:
+            self.output_size = state["output_size"]
+
+    def save_state(self):
+        state = {"version": STATE_VERSION, "input": os.path.abspath(self.input_filename), "format": self.fmt,
+                 "offset": self.offset, "identity": list(self.identity), "head": list(self.head),
+                 "output_size": self.output_size, "tickers": sorted(self.tickers), "tail": sorted(self.tail)}
+        temp_file = f"{self.state_filename}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(temp_file, self.state_filename)
+
+    def same_input(self, stat):
+        """True if the input is the file scanned before, unchanged or with lines appended."""
+        if self.identity != (stat.st_dev, stat.st_ino) or stat.st_size < self.offset:
+            return False
+        length, digest = self.head
+        return head_digest(self.input_filename, length) == digest
+
+    def changed(self):
+        """True if the input looks different from the last update (one stat call)."""
+        try:
+            stat = os.stat(self.input_filename)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns) != self.last_stat
+
+    def _scanned_blocks(self):
+        for block in appended_blocks(self.input_filename, self.offset):
+            self.offset += len(block)
+            yield block
+
+    def output_current(self):
+        """True if the output is still the file this list last wrote."""
+        try:
+            return os.path.getsize(self.output_filename) == self.output_size
+        except OSError:
+            return False
+
+    def write_output(self, tickers, written):
+        """
+        Replace the output's `written` tickers with `tickers`. A one-ticker-per-line output that
+        only gains tickers sorting after the existing ones is appended to in one write; anything
+        else is rewritten atomically.
+        """
+        added = tickers - written
+        if (self.fmt == "lines" and added and written and tickers >= written and self.output_current()
+                and min(added) > max(written)):
+            with open(self.output_filename, 'a', encoding='utf-8') as f:
+                f.write("".join(ticker + "\n" for ticker in sorted(added)))
+            print(f"Appended {len(added)} tickers to: {self.output_filename}")
+            return True
+        return write_ticker_file(sorted(tickers), self.output_filename, self.fmt)
+
+    def update(self, final=False):
+        """
+        Scan the bytes appended since the last update and update the output if new tickers
+        turned up. final=True (a one-shot run, not --watch) also lists the ticker of a last line
+        that has no newline, so the list matches a full scan of the file as it is now.
+        Returns the number of new tickers, or None if the input cannot be read.
+        """
+        try:
+            stat = os.stat(self.input_filename)
+        except OSError as e:
+            print(f"Error: cannot read '{self.input_filename}': {e}")
+            return None
+        if not os.path.isfile(self.input_filename):
+            print(f"Error: '{self.input_filename}' is not a regular file; incremental mode needs byte offsets.")
+            return None
+        self.last_stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if self.identity is not None and not self.same_input(stat):
+            print(f"{self.input_filename} was truncated or replaced; scanning it again from the start.")
+            self.offset, self.head, self.tickers, self.tail, self.output_size = 0, None, set(), set(), None
+        self.identity = (stat.st_dev, stat.st_ino)
+
+        start = self.offset
+        try:
+            with run_report.span("scan"):
+                symbols = unique_symbol_bytes(self._scanned_blocks())
+                new = {ticker for ticker in (symbol.decode('utf-8').strip() for symbol in symbols) if ticker}
+                new -= self.tickers
+                tail = set()
+                if final:
+                    symbols = unique_symbol_bytes([unterminated_line(self.input_filename, self.offset)])
+                    tail = {ticker for ticker in (symbol.decode('utf-8').strip() for symbol in symbols) if ticker}
+                    tail -= self.tickers | new
+        except Exception as e:
+            print(f"Error reading file: {e}")
+            self.offset = start
+            return None
+        run_report.count("bytes_read", self.offset - start)
+        run_report.count("tickers_new", len(new))
+        if self.head is None or (self.head[0] < HEAD_BYTES and self.offset > self.head[0]):
+            length = min(self.offset, HEAD_BYTES)
+            self.head = (length, head_digest(self.input_filename, length))
+
+        written = self.tickers | self.tail
+        self.tickers |= new
+        print(f"{self.input_filename}: scanned {self.offset - start:,} new bytes, "
+              f"{len(new)} new tickers ({len(self.tickers)} total).")
+        if tail:
+            print(f"Listed {len(tail)} ticker(s) from the last line, which has no newline yet; "
+                  f"it is read again next run.")
+        tickers = self.tickers | tail
+        wrote = False
+        if tickers and (tickers != written or not self.output_current()):
+            with run_report.span("write"):
+                wrote = True
+                # On failure the output is rewritten from the saved ticker set next time
+                self.output_size = os.path.getsize(self.output_filename) if self.write_output(tickers, written) else None
+        if wrote or self.offset != start or tail != self.tail:
+            self.tail = tail
+            self.save_state()
+        return len(new)
+
+def watch_ticker_lists(ticker_lists, interval=WATCH_INTERVAL):
+    """Poll the inputs every `interval` seconds and update the lists whose input changed, until Ctrl+C."""
+    print(f"Watching {len(ticker_lists)} input file(s) every {interval:g}s (Ctrl+C to stop)...")
     try:
-        os.remove(preprocessed_file)
-        print(f"Cleaned up temporary file: {preprocessed_file}")
-        os.remove(temp_file)
-        print(f"Cleaned up temporary file: {temp_file}")
-    except Exception as e:
-        print(f"Error cleaning up temporary files: {e}")
+        while True:
+            for ticker_list in ticker_lists:
+                if ticker_list.changed():
+                    ticker_list.update()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
-def main():
+def main(argv=None):
     """Main function to run the script."""
+    parser = argparse.ArgumentParser(description="Build a ticker list from a raw symbol dump. "
+                                                 "Without an input file the script asks which .txt file to process.")
+    parser.add_argument("inputs", nargs="*", metavar="input", help="raw symbol dump(s) to process")
+    parser.add_argument("-o", "--output", help="output file (default: the input name with '~1' appended)")
+    parser.add_argument("-f", "--format", choices=list(TICKER_FORMATS), default="python",
+                        help="python block literal (default), one ticker per line, JSON array, or binary")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="scan the input in this many line-aligned byte ranges on worker processes (default 1)")
+    parser.add_argument("--external", action="store_true",
+                        help="dedupe through sorted runs spilled to disk, for dumps with more distinct symbols than fit in memory")
+    parser.add_argument("--spill-dir", help="directory for --external's temporary files (default: the system temp directory)")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"scan only the bytes appended since the last run (state kept in <output>{STATE_SUFFIX})")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep polling the inputs and update their lists as they grow (implies --incremental)")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                        help=f"seconds between polls in --watch mode (default {WATCH_INTERVAL:g})")
+    parser.add_argument("--report", help="write per-stage timings, counters and peak memory to this .json or .csv file")
+    parser.add_argument("--profile", default="", help="comma-separated stages to profile (scan, write or all)")
+    parser.add_argument("--profiler", choices=["cprofile", "pyinstrument"], default="cprofile",
+                        help="profiler for --profile (pyinstrument must be installed separately)")
+    args = parser.parse_args(argv)
+    if args.output and len(args.inputs) > 1:
+        parser.error("-o/--output can only be used with a single input file")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if (args.incremental or args.watch) and (args.external or args.workers > 1):
+        parser.error("--workers and --external apply to full scans, not --incremental or --watch")
+    if args.report or args.profile:
+        run_report.enable(args.report, [stage for stage in args.profile.split(",") if stage], args.profiler)
+
     print("=== Ticker List Processor with Hyphen Removal and Duplicate Removal ===")
-    input_file = get_file_choice()
-    if not input_file:
+    input_files = args.inputs or [get_file_choice()]
+    if not input_files[0]:
+        return
+
+    if args.watch:
+        watch_ticker_lists([IncrementalTickerList(input_file, args.output, args.format) for input_file in input_files],
+                           args.interval)
         return
 
     start_time = time.time()
-    process_file_to_ticker_list(input_file)
+    for input_file in input_files:
+        if args.incremental:
+            IncrementalTickerList(input_file, args.output, args.format).update(final=True)
+        else:
+            process_file_to_ticker_list(input_file, args.output, args.format, args.workers,
+                                        args.external, args.spill_dir)
     end_time = time.time()
     print(f"Total processing took {end_time - start_time:.2f} seconds.")
 
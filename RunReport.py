@@ -0,0 +1,255 @@
+import atexit
+import contextlib
+import cProfile
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-stage timing and memory instrumentation shared by ChartMaker.py and MakeList.py.
+#
+#     with run_report.span("download"):     # or @run_report.span("download") on a function
+#         ...
+#     run_report.count("tickers_ok")
+#     run_report.enable("run.json", profile=["download"])   # report written at exit
+#
+# Spans and counters are always recorded (they cost microseconds); the RSS sampler, the
+# profiler hook and the report file only run once enable() is called.
+
+RSS_SAMPLE_INTERVAL = 0.05  # Seconds between resident-memory samples while enabled
+
+def current_rss_mb():
+    """Resident set size of this process in MB (the peak so far where the current value is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return 0.0
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+class Span(contextlib.ContextDecorator):
+    """One timed stage. Usable as `with span(name):` or as a `@span(name)` decorator."""
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        record = {"name": self.name, "thread": threading.current_thread().name,
+                  "depth": len(self.report._stack()), "start_s": time.perf_counter() - self.report.started,
+                  "rss_start_mb": current_rss_mb() if self.report.enabled else None}
+        record["rss_peak_mb"] = record["rss_start_mb"]
+        profiler = self.report._start_profiler(self.name)
+        self.report._open(record)
+        self.report._stack().append((record, profiler, time.perf_counter(), time.process_time()))
+        return self
+
+    def __exit__(self, *exc_info):
+        record, profiler, wall_start, cpu_start = self.report._stack().pop()
+        record["wall_s"] = time.perf_counter() - wall_start
+        record["cpu_s"] = time.process_time() - cpu_start
+        if self.report.enabled:
+            record["rss_end_mb"] = current_rss_mb()
+            record["rss_peak_mb"] = max(record["rss_peak_mb"] or 0.0, record["rss_end_mb"])
+        self.report._stop_profiler(self.name, profiler)
+        self.report._close(record)
+        return False
+
+class RunReport:
+    """Collects spans and counters for one run and writes them as a JSON or CSV report."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.spans = []
+        self.totals = {}  # per-name aggregates, updated as spans close (see summary)
+        self.counters = Counter()
+        self.enabled = False
+        self.path = None
+        self.profile = set()
+        self.profiler = "cprofile"
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._active = []
+        self._peak_rss = 0.0
+        self._profiling = False
+        self._profile_files = Counter()
+        self._sampler = None
+
+    def span(self, name):
+        return Span(self, name)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def keep_spans(self, limit):
+        """
+        Keep only the last `limit` span records, for a long-running process such as the chart
+        service. summary() and the report's stages still cover every span ever closed.
+        """
+        with self._lock:
+            self.spans = deque(self.spans, maxlen=limit)
+
+    def enable(self, path=None, profile=(), profiler="cprofile", interval=RSS_SAMPLE_INTERVAL):
+        """
+        Start RSS sampling and write the report to `path` (.json or .csv) at exit. Spans named
+        in `profile` ("all" for every span) run under cProfile or pyinstrument; their profiles
+        are written next to the report.
+        """
+        self.enabled = True
+        self.path = path
+        self.profile = set(profile)
+        self.profiler = profiler
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, args=(interval,), name="rss-sampler", daemon=True)
+            self._sampler.start()
+        if path:
+            atexit.register(self.write, path)
+
+    # --- Span bookkeeping ---
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _open(self, record):
+        with self._lock:
+            self._active.append(record)
+
+    def _close(self, record):
+        with self._lock:
+            self._active.remove(record)
+            self.spans.append(record)
+            self._peak_rss = max(self._peak_rss, record.get("rss_peak_mb") or 0.0)
+            total = self.totals.setdefault(record["name"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "rss_peak_mb": None})
+            total["calls"] += 1
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+            if record.get("rss_peak_mb") is not None:
+                total["rss_peak_mb"] = max(total["rss_peak_mb"] or 0.0, record["rss_peak_mb"])
+
+    def _sample(self, interval):
+        while True:
+            rss = current_rss_mb()
+            with self._lock:
+                self._peak_rss = max(self._peak_rss, rss)
+                for record in self._active:
+                    if record["rss_peak_mb"] is not None:
+                        record["rss_peak_mb"] = max(record["rss_peak_mb"], rss)
+            time.sleep(interval)
+
+    # --- Profiler hook ---
+
+    def _profile_path(self, name, extension):
+        base = os.path.splitext(self.path)[0] if self.path else "run_report"
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        with self._lock:
+            self._profile_files[safe_name] += 1
+            n = self._profile_files[safe_name]
+        return f"{base}.{safe_name}.{n}.{extension}"
+
+    def _start_profiler(self, name):
+        # Only one profiler can run at a time, so nested or concurrent spans are not profiled
+        if not self.enabled or self._profiling or not ({name, "all"} & self.profile):
+            return None
+        if self.profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("pyinstrument is not installed (pip install pyinstrument); using cProfile instead.")
+                self.profiler = "cprofile"
+            else:
+                profiler = Profiler()
+                profiler.start()
+                self._profiling = True
+                return profiler
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active in this process
+            return None
+        self._profiling = True
+        return profiler
+
+    def _stop_profiler(self, name, profiler):
+        if profiler is None:
+            return
+        self._profiling = False
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path = self._profile_path(name, "prof")
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path = self._profile_path(name, "html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+        print(f"Profile for '{name}' saved to {path}")
+
+    # --- Output ---
+
+    def summary(self):
+        """Total wall and CPU seconds and the peak RSS per span name, in first-seen order."""
+        with self._lock:
+            return {name: dict(total) for name, total in self.totals.items()}
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda record: record["start_s"])
+            counters = dict(self.counters)
+        return {"started": self.started_at, "argv": sys.argv, "wall_s": time.perf_counter() - self.started,
+                "peak_rss_mb": max(self._peak_rss, current_rss_mb()) if self.enabled else None,
+                "counters": counters, "stages": self.summary(), "spans": spans}
+
+    def write(self, path):
+        """Write the report as CSV (one row per span, then one per counter) or JSON, by extension."""
+        report = self.to_dict()
+        try:
+            if path.endswith(".csv"):
+                fields = ["kind", "name", "thread", "depth", "start_s", "wall_s", "cpu_s",
+                          "rss_start_mb", "rss_peak_mb", "rss_end_mb", "value"]
+                with open(path, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+                    writer.writeheader()
+                    for record in report["spans"]:
+                        writer.writerow({"kind": "span", **record})
+                    for name, value in report["counters"].items():
+                        writer.writerow({"kind": "counter", "name": name, "value": value})
+                    writer.writerow({"kind": "run", "name": "total", "wall_s": report["wall_s"],
+                                     "rss_peak_mb": report["peak_rss_mb"]})
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2)
+            print(f"Run report saved to {path}")
+        except OSError as e:
+            print(f"Error writing run report {path}: {e}")
+
+# The process-wide report used by both scripts
+REPORT = RunReport()
+
+def span(name):
+    return REPORT.span(name)
+
+def count(name, n=1):
+    REPORT.count(name, n)
+
+def keep_spans(limit):
+    REPORT.keep_spans(limit)
+
+def enable(path=None, profile=(), profiler="cprofile"):
+    REPORT.enable(path, profile, profiler)